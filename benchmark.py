@@ -0,0 +1,495 @@
+# Performance benchmarks
+# Not part of the unit tests - run directly using
+#     python3 benchmark.py
+# or to use a different building file
+#     python3 benchmark.py buildings/sample_house_2e.json
+# The suite times the main stages (load, regenerate, export) for all the buildings
+# in buildings/ and examples/ as well as synthetic walls and saves as JSON
+#     python3 benchmark.py --suite --json results.json
+# which can then be compared against a previous run to look for regressions
+#     python3 benchmark.py --suite --compare results.json
+import os
+import sys
+import glob
+import json
+import math
+import time
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from shapely import Polygon, LineString
+from buildingdata import BuildingData
+from builder import Builder
+from lcconfig import LCConfig
+from texture import Texture
+from laser import EtchLine
+from wall import Wall
+from scale import Scale
+from interlocking import Interlocking
+from helpers import line_remove_features, shapely_to_linestrings, rect_to_polygon
+
+default_building = "buildings/sample_house_2e.json"
+
+# Files used by the suite
+suite_patterns = ["buildings/*.json", "examples/*.json"]
+
+# Synthetic walls are created with these times the area of the base wall
+synthetic_factors = [1, 10, 100]
+
+# Textures used for synthetic walls
+synthetic_textures = {
+    "brick": {"brick_height": 65, "brick_width": 215, "brick_etch": 10},
+    "tile": {"tile_height": 250, "tile_width": 400, "tile_etch": 10},
+    "wood": {"wood_height": 150, "wood_etch": 10}
+    }
+
+# Result is a regression if this many times slower than the previous run
+regression_threshold = 1.2
+# Timings less than this (seconds) are not compared as they vary too much between runs
+compare_min_time = 0.001
+
+# Number of times to repeat each timing (best time is reported)
+repeats = 3
+
+
+# Previous version of Texture._get_etches_rects which clips one line at a time
+# Kept here as a reference for timing and to check the output is the same
+def rects_reference(texture, etch_width, rect_height, rect_width):
+    lines = []
+    etches = []
+    min_x = texture.polygon.bounds[0]+1
+    max_x = texture.polygon.bounds[2]-1
+    min_y = texture.polygon.bounds[1]+1
+    min_rect_width = rect_width / 2
+    current_y = texture.polygon.bounds[3]-1
+    row = 0
+    half_etch = etch_width / 2
+    while current_y > min_y:
+        current_x = min_x
+        if row == 0:
+            current_x += rect_width
+        else:
+            current_x += rect_width / 2
+        while current_x < max_x:
+            lines.extend(texture._line([current_x, current_y - half_etch], [current_x, current_y-(rect_height+half_etch)]))
+            current_x += rect_width + etch_width
+            if current_x + min_rect_width > max_x:
+                break
+        row = 1 - row
+        current_y -= (rect_height + etch_width)
+        lines.extend(texture._line([min_x, current_y],[max_x, current_y]))
+    for line in lines:
+        etches.append(EtchLine(line[0], line[1], etch_width=etch_width))
+    return etches
+
+# Previous version of helpers.line_remove_features which checks every line against every feature
+def remove_features_reference(lines, excludes):
+    if excludes == []:
+        return list(lines)
+    final_lines = []
+    exclude_poly = []
+    for exclude in excludes:
+        exclude_poly.append(Polygon(exclude))
+    for this_line in lines:
+        linestrings = [LineString(this_line.get_line())]
+        for poly in exclude_poly:
+            new_linestrings = []
+            for linestring in linestrings:
+                new_linestrings.extend(shapely_to_linestrings(linestring.difference(poly)))
+            linestrings = new_linestrings
+        for linestring in linestrings:
+            final_lines.append(EtchLine(linestring.coords[0], linestring.coords[1], etch_width=this_line.etch_width, strength=this_line.strength))
+    return final_lines
+
+# Returns best time from repeats
+def time_function(function, *args):
+    best = None
+    for i in range (0, repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return (best, result)
+
+# Creates textures for all the walls in a building file
+def load_textures(filename):
+    building = BuildingData()
+    result = building.load_file(filename)
+    if result[0] == False:
+        print (f"Unable to load {filename} - {result[1]}")
+        return []
+    walls = building.get_walls() + building.get_roofs()
+    textures = []
+    excludes = []
+    try:
+        for texture in building.get_textures():
+            textures.append(Texture(walls[texture["wall"]][1], texture["type"], texture["settings"]))
+            excludes.append(get_excludes(building, texture["wall"]))
+    # Some older files are not in the current format
+    except Exception as err:
+        print (f"Unable to load textures from {filename} - {err}")
+        return []
+    return list(zip(textures, excludes))
+
+# Gets exclude polygons for the features on a wall (same as used by wall)
+def get_excludes(building, wall_num):
+    excludes = []
+    for feature in building.get_features():
+        if feature["wall"] != wall_num:
+            continue
+        pos = feature["parameters"]["pos"]
+        if "exclude" in feature["parameters"].keys():
+            points = feature["parameters"]["exclude"]
+        else:
+            points = rect_to_polygon((0,0), feature["parameters"]["width"], feature["parameters"]["height"])
+        excludes.append([(pos[0]+point[0], pos[1]+point[1]) for point in points])
+    return excludes
+
+# Used to estimate size of laser objects before __slots__ were added
+class DictBacked():
+    pass
+
+# All the names in __slots__ for an object (including parent classes)
+def slot_names(obj):
+    names = []
+    for cls in type(obj).__mro__:
+        names.extend(getattr(cls, "__slots__", ()))
+    return names
+
+# Size of an object excluding its values (which are the same with or without __slots__)
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+# Size of the same object if it stored the values in a dict
+def dict_backed_size(obj):
+    dict_obj = DictBacked()
+    for name in slot_names(obj):
+        if hasattr(obj, name):
+            setattr(dict_obj, name, getattr(obj, name))
+    return object_size(dict_obj)
+
+# Approximate memory used by an EtchLine object including its values
+def etch_line_size(etch):
+    size = object_size(etch)
+    for point in (etch.start, etch.end):
+        size += sys.getsizeof(point) + sum(sys.getsizeof(value) for value in point)
+    return size
+
+# Brick and tile textures using current generator vs reference
+def bench_texture_rects(filename):
+    print (f"Texture rects (brick / tile) - {filename}")
+    total_reference = 0
+    total_current = 0
+    num_etches = 0
+    for texture, excludes in load_textures(filename):
+        if texture.style == "brick":
+            args = (texture.settings["brick_etch"], texture.settings["brick_height"], texture.settings["brick_width"])
+        elif texture.style == "tile":
+            args = (texture.settings["tile_etch"], texture.settings["tile_height"], texture.settings["tile_width"])
+        else:
+            continue
+        reference_time, reference_etches = time_function(rects_reference, texture, *args)
+        current_time, current_etches = time_function(texture._get_etches_rects, *args)
+        # Check that the output is the same
+        if [etch.get_line() for etch in reference_etches] != [etch.get_line() for etch in current_etches]:
+            print (f" Warning: output differs from reference")
+        total_reference += reference_time
+        total_current += current_time
+        num_etches += len(current_etches)
+    if total_current > 0:
+        print (f" {num_etches} etches, reference {total_reference:.4f}s, current {total_current:.4f}s, speedup {total_reference/total_current:.1f}x")
+
+# Removing features from the texture etches using current version vs reference
+def bench_remove_features(filename):
+    print (f"Remove features - {filename}")
+    total_reference = 0
+    total_current = 0
+    num_etches = 0
+    for texture, excludes in load_textures(filename):
+        etches = texture.get_etches()
+        reference_time, reference_etches = time_function(remove_features_reference, etches, excludes)
+        current_time, current_etches = time_function(line_remove_features, etches, excludes)
+        if [etch.get_line() for etch in reference_etches] != [etch.get_line() for etch in current_etches]:
+            print (f" Warning: output differs from reference")
+        total_reference += reference_time
+        total_current += current_time
+        num_etches += len(etches)
+    if total_current > 0:
+        print (f" {num_etches} etches, reference {total_reference:.4f}s, current {total_current:.4f}s, speedup {total_reference/total_current:.1f}x")
+
+# Generates all textures for a building twice and reports use of the texture cache
+def bench_texture_cache(filename):
+    print (f"Texture cache - {filename}")
+    Texture.cache.clear()
+    textures = load_textures(filename)
+    # Time only once as after first generation would always be in the cache
+    start = time.perf_counter()
+    for texture, excludes in textures:
+        texture.get_etches()
+    first_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for texture, excludes in textures:
+        texture.get_etches()
+    second_time = time.perf_counter() - start
+    stats = Texture.cache.get_stats()
+    print (f" {len(textures)} textures, first {first_time:.4f}s, second {second_time:.4f}s, hits {stats['hits']}, misses {stats['misses']}")
+
+# Memory used by texture etches stored as a batch vs individual EtchLine objects
+def bench_texture_memory(filename):
+    print (f"Texture memory - {filename}")
+    batch_size = 0
+    object_size = 0
+    num_etches = 0
+    for texture, excludes in load_textures(filename):
+        etches = texture.get_etches()
+        batch_size += etches.get_nbytes()
+        object_size += sum(etch_line_size(etch) for etch in etches)
+        num_etches += len(etches)
+    if batch_size > 0:
+        print (f" {num_etches} etches, objects {object_size} bytes, batch {batch_size} bytes, reduction {object_size/batch_size:.1f}x")
+
+# Bytes per laser object (cuts / etches / outers) with __slots__ vs stored in a dict
+# Texture etches are included as individual EtchLines
+def bench_primitive_memory(filename):
+    print (f"Laser object memory - {filename}")
+    config = LCConfig()
+    config.cache_dir = None
+    builder = Builder(config)
+    builder.load_file(filename)
+    primitives = []
+    for wall in builder.walls:
+        primitives.extend(wall.get_cuts(True, True))
+        primitives.extend(wall.get_outers(True, True))
+        for etch in wall.get_etches(True, True):
+            if etch.get_type() == "line_batch":
+                primitives.extend(etch)
+            else:
+                primitives.append(etch)
+    # Totals for each class - number, size before, size after
+    totals = {}
+    for primitive in primitives:
+        name = type(primitive).__name__
+        if name not in totals:
+            totals[name] = [0, 0, 0]
+        totals[name][0] += 1
+        totals[name][1] += dict_backed_size(primitive)
+        totals[name][2] += object_size(primitive)
+    for name, (number, before, after) in sorted(totals.items()):
+        print (f" {name}: {number} objects, dict {before/number:.0f} bytes each, slots {after/number:.0f} bytes each")
+
+
+### Suite - times each stage and returns results as a dictionary (seconds)
+
+# Material thickness is a class variable used by interlocking so set the same as the GUI
+def set_material_thickness(config):
+    Interlocking.material_thickness = Scale("O").reverse_scale_convert(config.wall_width)
+
+# Texture cache would otherwise mean that repeats were only timing the cache
+def uncached(function, *args):
+    Texture.cache.clear()
+    return function(*args)
+
+def update_walls(walls):
+    for wall in walls:
+        wall.update(full=True)
+
+# Creates the interlocking for all the walls
+def interlock_walls(walls):
+    for wall in walls:
+        if wall.il != []:
+            wall.get_il_edges()
+
+# Removes features from the textures of each wall
+def remove_features_walls(walls):
+    for wall in walls:
+        excludes = [feature.get_points() for feature in wall.features]
+        for etches in wall.get_texture_etches_basic():
+            line_remove_features(etches, excludes)
+
+# Time to generate each style of texture (without using the cache)
+def time_textures(walls):
+    results = {}
+    for wall in walls:
+        for texture in wall.textures:
+            texture_time, etches = time_function(texture._generate_etches)
+            key = f"texture_{texture.style}"
+            results[key] = results.get(key, 0) + texture_time
+    return results
+
+def export_building(building, filename):
+    options = {"material_thickness": 3, "outertype": "etches", "interlocking": "true", "processes": 1}
+    return building.export_file(filename, building.get_export_data(), options=options)
+
+# Times all stages for a building file
+def suite_building(filename):
+    results = {}
+    config = LCConfig()
+    # Time the updates rather than starting processes
+    config.update_processes = 1
+    # Time creating the walls rather than reading them from the cache (see process_data_cached)
+    config.cache_dir = None
+    set_material_thickness(config)
+    building = BuildingData(config)
+    results["load_file"], result = time_function(building.load_file, filename)
+    if result[0] == False:
+        return {"error": str(result[1])}
+    try:
+        builder = Builder(config)
+        builder.building.load_file(filename)
+        results["process_data"], result = time_function(uncached, builder.process_data)
+        results["wall_update"], result = time_function(uncached, update_walls, builder.walls)
+        results["process_data_cached"] = time_cached_load(filename)
+        results.update(time_textures(builder.walls))
+        results["remove_features"], result = time_function(remove_features_walls, builder.walls)
+        results["interlocking"], result = time_function(interlock_walls, builder.walls)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            results["export_file"], result = time_function(uncached, export_building, building, os.path.join(temp_dir, "export.svg"))
+    # Some older files are not in the current format
+    except Exception as err:
+        results["error"] = str(err)
+    return results
+
+# Time to process a building when the walls are in the cache (eg. reopening a file)
+def time_cached_load(filename):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        config = LCConfig()
+        config.update_processes = 1
+        config.cache_dir = cache_dir
+        set_material_thickness(config)
+        builder = Builder(config)
+        # First load creates the cache
+        builder.load_file(filename)
+        return time_function(uncached, reopen, builder)[0]
+
+# Process the data again reading the cache file (as if the file had just been opened)
+def reopen(builder):
+    builder.building.cache = None
+    builder.process_data()
+
+# Wall with features, texture and interlocking
+# size is the number of times the area of the base wall (3000 x 2000mm with 2 windows)
+# features are added to keep the same proportion of the wall
+def synthetic_wall(factor, style):
+    multiplier = math.sqrt(factor)
+    width = 3000 * multiplier
+    height = 2000 * multiplier
+    wall = Wall(f"Synthetic {factor}x", [[0, 0], [width, 0], [width, height], [0, height], [0, 0]])
+    wall.add_texture_towall(style, [], synthetic_textures[style])
+    # Windows on a grid
+    num_windows = max(1, round(math.sqrt(factor * 2)))
+    for row in range(0, num_windows):
+        for column in range(0, num_windows):
+            pos = [(column + 0.25) * width / num_windows, (row + 0.25) * height / num_windows]
+            wall.add_feature_towall("window", "", pos, rect_to_polygon((0, 0), 600, 900), [], [], [])
+    # Interlocking on the two sides
+    wall.add_interlocking(150, 1, "primary", "", "default", {})
+    wall.add_interlocking(150, 3, "secondary", "", "default", {})
+    return wall
+
+def suite_synthetic(factor):
+    results = {}
+    set_material_thickness(LCConfig())
+    for style in synthetic_textures.keys():
+        wall = synthetic_wall(factor, style)
+        results[f"texture_{style}"], result = time_function(wall.textures[0]._generate_etches)
+        results[f"wall_update_{style}"], result = time_function(uncached, wall.update, True)
+        if style == "brick":
+            results["remove_features"], result = time_function(remove_features_walls, [wall])
+            results["interlocking"], result = time_function(interlock_walls, [wall])
+    return results
+
+def run_suite(filenames):
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "buildings": {},
+        "synthetic": {}
+        }
+    for filename in filenames:
+        print (f"Suite - {filename}")
+        results["buildings"][filename] = suite_building(filename)
+    for factor in synthetic_factors:
+        print (f"Suite - synthetic {factor}x")
+        results["synthetic"][f"{factor}x"] = suite_synthetic(factor)
+    return results
+
+# Convert to a single level dictionary (eg. "buildings/shed_1.json load_file") to compare
+def flatten_results(results):
+    flat = {}
+    for group in ["buildings", "synthetic"]:
+        for name, values in results[group].items():
+            for key, value in values.items():
+                if key != "error":
+                    flat[f"{name} {key}"] = value
+    return flat
+
+# Print any timings which are slower than threshold times the previous
+# Returns number of regressions
+def compare_results(previous, current, threshold=regression_threshold):
+    previous_flat = flatten_results(previous)
+    current_flat = flatten_results(current)
+    regressions = 0
+    for key, value in current_flat.items():
+        if key not in previous_flat or previous_flat[key] < compare_min_time:
+            continue
+        ratio = value / previous_flat[key]
+        if ratio > threshold:
+            regressions += 1
+            print (f" Regression {key}: {previous_flat[key]:.4f}s to {value:.4f}s ({ratio:.2f}x)")
+    print (f"Compared {len(current_flat)} timings with {previous.get('created', 'previous')}: {regressions} regressions")
+    return regressions
+
+def print_results(results):
+    for group in ["buildings", "synthetic"]:
+        for name, values in results[group].items():
+            print (f"{name}")
+            for key, value in values.items():
+                if key == "error":
+                    print (f" error: {value}")
+                else:
+                    print (f" {key}: {value:.4f}s")
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    parser.add_argument("files", nargs="*", help=f"building files (default {default_building} or for suite all in buildings and examples)")
+    parser.add_argument("--suite", action="store_true", help="time load, regenerate and export")
+    parser.add_argument("--json", help="save suite results to a JSON file")
+    parser.add_argument("--compare", help="compare suite results against a previous JSON file")
+    parser.add_argument("--threshold", type=float, default=regression_threshold, help=f"report if this many times slower than previous (default {regression_threshold})")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    if args.suite:
+        filenames = args.files
+        if filenames == []:
+            for pattern in suite_patterns:
+                filenames.extend(sorted(glob.glob(pattern)))
+        results = run_suite(filenames)
+        print_results(results)
+        if args.json != None:
+            with open(args.json, "w") as json_file:
+                json.dump(results, json_file, indent=2)
+        if args.compare != None:
+            with open(args.compare) as json_file:
+                previous = json.load(json_file)
+            if compare_results(previous, results, args.threshold) > 0:
+                sys.exit(1)
+    else:
+        filenames = args.files
+        if filenames == []:
+            filenames = [default_building]
+        for filename in filenames:
+            bench_texture_rects(filename)
+            bench_remove_features(filename)
+            bench_texture_cache(filename)
+            bench_texture_memory(filename)
+            bench_primitive_memory(filename)
@@ -14,6 +14,8 @@ from datetime import datetime
 from history import History
 import copy
 from viewscale import ViewScale
+from wallupdate import WallUpdater
+import instrument
 
 # To support history many of the methods have an optional variable history
 # If it's default / true then we add history record (allow undo)
@@ -70,6 +72,8 @@ class Builder(QObject):
         #self.wall_update_running = False
         # ViewScale - if need to perform size conversions
         self.vs = ViewScale()
+        # Regenerates the walls in separate processes (if more than one cpu)
+        self.wall_updater = WallUpdater(self.config.update_processes)
         
     # Only deletes the actual group
     def del_il_group (self, entry_id):
@@ -176,8 +180,7 @@ class Builder(QObject):
     # Update walls - eg. if interlock or texture setting changed then reflect against all walls
     # interlock and texture no longer used
     def update_walls(self, interlock=False, texture=False):
-        for wall in self.walls:
-            wall.update()
+        self.wall_updater.update_walls(self.walls, full=True)
         
     # Takes a dictionary with the wall data where points is a list within the dictionary
     # Wall args are: name, points, view="front", position=[0,0]
@@ -322,6 +325,7 @@ class Builder(QObject):
         
     # After loading data this converts into builder objects
     # Deletes any existing entries
+    @instrument.timed("builder.process_data")
     def process_data(self):
         #print ("**Processing Data")
         self.current_status = 0
@@ -451,19 +455,12 @@ class Builder(QObject):
         #print ("** Starting updates")
 
         # If not thread then use this
+        # Textures are read from the cache for the file (if it has been loaded before)
         if self.threadpool == None:
-            
-            current_wall = 0
-            for wall in self.walls:
-                self.current_status = int((current_wall/num_walls)*100)
-                wall.update()
-                self.current_status += self.status_per_wall
-                if self.gui != None:
-                    self.gui.progress_update_signal.emit(self.current_status)
-                current_wall += 1
+            self.wall_updater.update_walls(self.walls, status_callback=self._wall_update_progress, cache=self.building.get_cache())
         else:
             # Call threaded version of update
-            self.update_walls_td (status_signal=self.wall_update_status_signal, complete_signal=self.wall_load_signal)
+            self.update_walls_td (status_signal=self.wall_update_status_signal, complete_signal=self.wall_load_signal, cache=self.building.get_cache())
             
 
     def add_il (self, primary_wall_id, primary_edge, primary_reverse, secondary_wall_id, secondary_edge, secondary_reverse, il_type, step, parameters, history=True):
@@ -597,16 +594,22 @@ class Builder(QObject):
                 self.interlocking_groups.remove(ilg)
         
         
-    # update_walls_td replaced with a single thread version
+    # Used when updating without threads to show progress after each wall
+    def _wall_update_progress(self):
+        self.current_status += self.status_per_wall
+        if self.gui != None:
+            self.gui.progress_update_signal.emit(self.current_status)
+        
+    # update_walls_td uses a single thread
     # Note that this needs to be run in separate thread to gui otherwise app not responding
     # Due to GIL running in more than one addition thread has a negative impact on performance
     # Approx 20% slower by splitting threads
-    # Possibly move to completely different process (difficult due to the data that would need to be passed)
-    # or removal of GIL may improve this
+    # Instead the thread uses WallUpdater to create the textures in separate processes
 
     # Update walls using threadpool
     # Provide Signal as an argument to reply when each wall is done
-    def update_walls_td (self, status_signal, complete_signal):
+    # If cache (BuildingCache) then textures are read from the cache if available
+    def update_walls_td (self, status_signal, complete_signal, cache=None):
         # Don't run if already running
         if self.num_updates_progress > 0:
             print ("Trying to start update when already updating - aborting")
@@ -618,7 +621,7 @@ class Builder(QObject):
             self.update_walls()
             return
         self.num_updates_progress = 1
-        self.worker = BuilderWallUpdate(_thread_update_all_walls, self.walls, status_signal, complete_signal)
+        self.worker = BuilderWallUpdate(_thread_update_all_walls, self.walls, status_signal, complete_signal, self.wall_updater, cache)
         self.threadpool.start(self.worker)
             
     # Update a single wall
@@ -663,12 +666,22 @@ def _thread_update_wall(wall, wall_num, status_emit=None, complete_emit=None):
         complete_emit.emit ()
 
 # Update all the walls
-def _thread_update_all_walls(walls, status_emit=None, complete_emit=None):
-    for wall in walls:
+# Full update as this is used when settings change (eg. material thickness)
+# If wall_updater provided then that is used to update using separate processes
+# and cache (if provided) is used for the textures
+def _thread_update_all_walls(walls, status_emit=None, complete_emit=None, wall_updater=None, cache=None):
+    if wall_updater != None:
         # Send status update as each wall is complete
+        status_callback = None
         if status_emit != None:
-            status_emit.emit()
-        wall.update()
+            status_callback = status_emit.emit
+        wall_updater.update_walls(walls, full=True, status_callback=status_callback, cache=cache)
+    else:
+        for wall in walls:
+            # Send status update as each wall is complete
+            if status_emit != None:
+                status_emit.emit()
+            wall.update(full=True)
     # Send complete when all updates complete
     if complete_emit != None:
         complete_emit.emit ()
@@ -9,13 +9,16 @@ class App(QApplication):
     def __init__ (self, args):
         super().__init__()
         
-# Create QApplication instance 
-app = App(sys.argv)
+# Only run when started directly
+# Wall updates use separate processes which import this file
+if __name__ == '__main__':
+    # Create QApplication instance 
+    app = App(sys.argv)
 
-# Create a Qt widget - main window
-window = MainWindowUI()
+    # Create a Qt widget - main window
+    window = MainWindowUI()
 
-#Start event loop
-app.exec()
+    #Start event loop
+    app.exec()
 
 # Application end
\ No newline at end of file
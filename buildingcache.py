@@ -0,0 +1,219 @@
+# Binary cache of the generated wall geometry (.lcb files)
+# Creating the textures and removing the features from them is the slowest part of loading
+# or exporting a building. The results are saved to a cache file for each building so that
+# reopening an unchanged building does not need to generate them again.
+# The cache filename is a hash of the building file and the code version, so a different
+# cache file is used if either is changed. Each wall is stored using a hash of its texture
+# values (see Wall.get_texture_data) and is only used if they are the same, so a wall that has
+# been changed since the file was loaded (eg. exporting after editing) is regenerated.
+# File format
+#   "LCB1", header length (uint32 little endian), header (JSON), padding to 8 bytes, data
+# The header has the key of each wall with the position of its arrays in the data
+# The data is memory mapped so is only read when a wall is used
+# The header can have walls with no lines, in which case there is no data
+# Must not import PySide6 as this module is used by lcmake
+import os
+import json
+import struct
+import hashlib
+import tempfile
+import numpy as np
+from wallupdate import batch_to_arrays, arrays_to_batch
+import texture
+import helpers
+import laser
+import instrument
+
+magic = b"LCB1"
+# Increase if the format of the file changes
+cache_version = 1
+extension = ".lcb"
+# Maximum number of cache files kept in the cache directory (oldest are removed)
+max_files = 100
+
+# Array types stored in the file - lines (n x 2 x 2), strengths, etch widths
+array_types = [
+    (np.dtype("<f8"), (2, 2)),
+    (np.dtype("<i1"), ()),
+    (np.dtype("<f8"), ())
+    ]
+
+# Hash of the modules which create the cached values
+# If any of these are changed (eg. a new version) then the cache is not used
+def get_code_version ():
+    code_hash = hashlib.sha1(str(cache_version).encode())
+    for module in (texture, helpers, laser):
+        with open(module.__file__, "rb") as source_file:
+            code_hash.update(source_file.read())
+    return code_hash.hexdigest()
+
+code_version = get_code_version()
+
+# Cache filename for the contents of a building file
+def get_cache_filename (cache_dir, file_data):
+    if isinstance(file_data, str):
+        file_data = file_data.encode()
+    file_hash = hashlib.sha1(code_version.encode() + file_data).hexdigest()
+    return os.path.join(cache_dir, file_hash + extension)
+
+# Key for a wall based on the values used to create the textures
+def get_wall_key (wall):
+    key_string = json.dumps(wall.get_texture_data(), sort_keys=True)
+    return hashlib.sha1(key_string.encode()).hexdigest()
+
+# Remove the oldest cache files if there are more than max_files
+def prune_cache_dir (cache_dir, max_files=max_files):
+    try:
+        filenames = [os.path.join(cache_dir, filename) for filename in os.listdir(cache_dir) if filename.endswith(extension)]
+        filenames.sort(key=os.path.getmtime, reverse=True)
+        for filename in filenames[max_files:]:
+            os.remove(filename)
+    except OSError:
+        pass
+
+
+class BuildingCache():
+    def __init__ (self, filename):
+        self.filename = filename
+        # key: (texture arrays, exclude arrays) with arrays for each texture
+        self.entries = {}
+        # True if the entries are views of the memory mapped file
+        self.mapped = False
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    # Reads the header and memory maps the data
+    # If the file does not exist (or is not valid) then the cache starts empty
+    @instrument.timed("cache.load")
+    def load (self):
+        self.entries = {}
+        self.mapped = False
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, "rb") as cache_file:
+                if cache_file.read(4) != magic:
+                    raise ValueError("not a cache file")
+                header_size = struct.unpack("<I", cache_file.read(4))[0]
+                header = json.loads(cache_file.read(header_size))
+            data_offset = _data_offset(header_size)
+            # Cannot memory map a zero length data section
+            if os.path.getsize(self.filename) > data_offset:
+                data = np.memmap(self.filename, dtype=np.uint8, mode="r", offset=data_offset)
+                self.mapped = True
+            else:
+                data = np.zeros(0, dtype=np.uint8)
+            for key, (textures, excludes) in header["walls"].items():
+                self.entries[key] = (_read_arrays(data, textures), _read_arrays(data, excludes))
+        except (OSError, ValueError, KeyError, TypeError, struct.error) as err:
+            print (f"Ignoring invalid cache file {self.filename} - {err}")
+            self.entries = {}
+            self.mapped = False
+
+    # Returns (texture batches, exclude batches) for the wall key or None if not in the cache
+    def get (self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        textures, excludes = self.entries[key]
+        return ([arrays_to_batch(arrays) for arrays in textures], [arrays_to_batch(arrays) for arrays in excludes])
+
+    # Add the textures of a wall after it has been updated
+    # key should be from before the update in case the wall is changed during the update
+    def add (self, wall, key=None):
+        if key == None:
+            key = get_wall_key(wall)
+        textures = [batch_to_arrays(batch) for batch in wall.get_texture_etches_basic()]
+        excludes = [batch_to_arrays(batch) for batch in wall.get_texture_etches()]
+        self.entries[key] = (textures, excludes)
+        self.changed = True
+
+    # Set the textures for any walls that are in the cache
+    # Returns list of (wall, key) for walls that were not in the cache (which still need updating)
+    def apply (self, walls):
+        missing = []
+        for wall in walls:
+            if not wall.textures_dirty():
+                continue
+            key = get_wall_key(wall)
+            etches = self.get(key)
+            if etches == None:
+                missing.append((wall, key))
+            else:
+                wall.set_texture_etches(*etches)
+                instrument.count("cache.hits")
+        return missing
+
+    # Write the file if anything has been added
+    # Written to a temporary file first so that the cache file is always complete
+    @instrument.timed("cache.save")
+    def save (self):
+        if not self.changed:
+            return
+        cache_dir = os.path.dirname(self.filename)
+        # The file being replaced may be the one that is memory mapped, which cannot be
+        # replaced on some systems (eg. Windows) so the entries are copied into memory first
+        if self.mapped:
+            self.entries = {key: (_copy_arrays(textures), _copy_arrays(excludes))
+                for key, (textures, excludes) in self.entries.items()}
+            self.mapped = False
+        header = {"walls": {}}
+        arrays = []
+        position = 0
+        for key, (textures, excludes) in self.entries.items():
+            positions = []
+            for wall_arrays in (textures, excludes):
+                wall_positions = []
+                for lines, strengths, etch_widths in wall_arrays:
+                    wall_positions.append([position, len(lines)])
+                    for array, (dtype, shape) in zip((lines, strengths, etch_widths), array_types):
+                        array = np.ascontiguousarray(array, dtype=dtype)
+                        arrays.append(array)
+                        position += array.nbytes
+                positions.append(wall_positions)
+            header["walls"][key] = positions
+        header_data = json.dumps(header).encode()
+        temp_filename = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_file, temp_filename = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+            with os.fdopen(temp_file, "wb") as cache_file:
+                cache_file.write(magic)
+                cache_file.write(struct.pack("<I", len(header_data)))
+                cache_file.write(header_data)
+                cache_file.write(b"\0" * (_data_offset(len(header_data)) - 8 - len(header_data)))
+                for array in arrays:
+                    cache_file.write(array.tobytes())
+            os.replace(temp_filename, self.filename)
+        except OSError as err:
+            print (f"Unable to save cache file {self.filename} - {err}")
+            if temp_filename != None and os.path.isfile(temp_filename):
+                os.remove(temp_filename)
+            return
+        self.changed = False
+        prune_cache_dir(cache_dir)
+
+
+# Data starts after magic, header size and header, aligned to 8 bytes
+def _data_offset (header_size):
+    return (8 + header_size + 7) // 8 * 8
+
+# Returns list of (lines, strengths, etch widths) from the memory mapped data
+# positions is list of [offset, number of lines] for each texture
+def _read_arrays (data, positions):
+    wall_arrays = []
+    for position, num_lines in positions:
+        arrays = []
+        for dtype, shape in array_types:
+            size = dtype.itemsize * num_lines * int(np.prod(shape))
+            arrays.append(data[position:position + size].view(dtype).reshape((num_lines,) + shape))
+            position += size
+        wall_arrays.append(tuple(arrays))
+    return wall_arrays
+
+# Returns copies of the arrays from _read_arrays which do not use the memory mapped data
+def _copy_arrays (wall_arrays):
+    return [tuple(np.array(array) for array in arrays) for arrays in wall_arrays]
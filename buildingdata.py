@@ -1,6 +1,7 @@
 # Read and write BuildingData files
 import json
 import re
+from shapely import Polygon
 from lcconfig import LCConfig
 from laser import *
 from scale import *
@@ -12,6 +13,12 @@ from buildingtemplate import *
 from featuretemplate import *
 from interlocking import *
 from helpers import *
+from travel import optimize_travel
+from nesting import *
+from wallupdate import WallUpdater
+from buildingcache import BuildingCache, get_cache_filename
+from expression import evaluate_expression
+import instrument
 
 def is_number(s):
     try:
@@ -35,6 +42,9 @@ class BuildingData ():
             self.config = LCConfig()
         else:
             self.config = lcconfig
+        # Cache of the generated walls for the loaded file (created when first used)
+        self.cache_filename = None
+        self.cache = None
     
     # Checks the appropriate parameters for a matching value_string then evaluate
     # Returns as string
@@ -83,7 +93,8 @@ class BuildingData ():
             new_string += token_string[current_pos:]
         return new_string
         
-    # Process token and perform eval to return as a number
+    # Process token and evaluate to return as a number
+    # The expression is only parsed the first time it is used (see expression.py)
     def process_token (self, token_string):
         # First check if it is already a number
         # Try int first as it's most likely an positive integer
@@ -99,9 +110,7 @@ class BuildingData ():
         except ValueError:
             # print ("Not a float")
             pass
-        new_string = self.process_token_str(token_string)
-        value = eval(new_string)
-        return value
+        return evaluate_expression(token_string, self.data["parameters"])
     
     # Load a data file
     # Overrides all data in memory
@@ -109,12 +118,17 @@ class BuildingData ():
     def load_file (self, filename):
         # Keep reference to filename loaded
         self.filename = filename
+        self.cache_filename = None
+        self.cache = None
         try:
             with open(filename, 'r') as datafile:
-                self.data = json.load(datafile)
+                file_data = datafile.read()
+            self.data = json.loads(file_data)
         except Exception as err:
             #print (f"Error {err}")
             return (False, err)
+        if self.config.cache_dir != None:
+            self.cache_filename = get_cache_filename(self.config.cache_dir, file_data)
         # Simple check did we get a name
         if 'name' not in self.data.keys():
             return (False, "Invalid data file")
@@ -143,6 +157,7 @@ class BuildingData ():
     # todo
     # Need to ensure building data is updated first
     # Options are things that can be selected - eg. material_thickness etc.
+    @instrument.timed("export.file")
     def export_file (self, filename, bdata, gui=None, options=None):
         #### TEMP
         ### Todo - this should be read in - any values missing then can use
@@ -161,19 +176,26 @@ class BuildingData ():
             gui.progress_update_signal.emit(percent_complete)
         
         # todo read this from GUI somehow
-        scale = "O"
+        # Allow override of scale (eg. from command line)
+        if "scale" in options.keys():
+            scale = options['scale']
+        else:
+            scale = "O"
         
-        # Export in grid 3 wide
-        grid_width = 3
-        # Start position
-        offset = [0, 0]
         # spacing is distance beteen objects (eg. walls) when exported to SVG
         spacing = 50
-        num_objects = 0
-        current_height = 0 # Only need for height to track which piece needs most space
 
-        # Eg. size of a small laser cutter / 3D printer
-        doc_size_mm = (600, 600)
+        # Size of material sheet (eg. size of a small laser cutter / 3D printer)
+        # Allow override of sheet_size otherwise take from config
+        if "sheet_size" in options.keys():
+            doc_size_mm = options['sheet_size']
+        else:
+            doc_size_mm = self.config.sheet_size
+        # Allow walls to be rotated to fit on the sheets
+        if "nest_rotate" in options.keys():
+            nest_rotate = options['nest_rotate']
+        else:
+            nest_rotate = self.config.nest_rotate
 
         #print (f"Creating scale with {scale}")
 
@@ -239,7 +261,20 @@ class BuildingData ():
         svgsettings["etchstrokes"] = etch_strokes
         svgsettings["etchfill"] = self.config.etch_fill
         svgsettings["etchaspolygon"] = self.config.etch_as_polygon
-        svg = SVGOut(filename, svgsettings)
+        # Allow override of etch_as_path otherwise take from config
+        if "etch_as_path" in options.keys():
+            svgsettings["etchaspath"] = options['etch_as_path']
+        else:
+            svgsettings["etchaspath"] = self.config.etch_as_path
+        # Allow override of svg_writer otherwise take from config
+        if "svg_writer" in options.keys():
+            svg_writer = options['svg_writer']
+        else:
+            svg_writer = self.config.svg_writer
+        if svg_writer == "streaming":
+            svg_class = StreamingSVGOut
+        else:
+            svg_class = SVGOut
 
         walls = []
         #for wall in self.get_walls():
@@ -272,13 +307,15 @@ class BuildingData ():
                                                feature["cuts"], feature["etches"], feature["outers"], update=False)
             
         # export interlocking defaults to True, but can be overridden
-        en_il = True
+        # Could be stored a bool or string
+        interlocking = True
         if "interlocking" in options.keys():
-            en_il == options['interlocking']
-        elif "interlocking" in bdata.keys():
-            # Could be stored a bool or string
-            if bdata["outertype"] == False or bdata["outertype"].lower() == "false":
-                en_il = False
+            interlocking = options['interlocking']
+        elif "settings" in bdata.keys() and "interlocking" in bdata["settings"]:
+            interlocking = bdata["settings"]["interlocking"]
+        en_il = True
+        if interlocking == False or str(interlocking).lower() == "false":
+            en_il = False
         Wall.settings["outertype"] = outertype
         # if setting is ignore interlocking then ignore any entries (wall will have il=[])
         if en_il:
@@ -325,60 +362,145 @@ class BuildingData ():
             per_wall_percent = 90 / num_walls
         
         
-        wall_num = 0
+        # Optimize travel defaults to config, but can be overridden
+        if "optimize_travel" in options.keys():
+            en_travel = options['optimize_travel']
+        else:
+            en_travel = self.config.optimize_travel
+        # Estimated travel distance of laser head (mm) before and after optimizing
+        travel_before = 0
+        travel_after = 0
+        
+        # Export is in stages
+        # 1. Update walls - textures are read from the cache or created in separate processes (if more than one cpu)
+        # 2. Place the walls on the sheets
+        # 3. Convert each wall to SVG - for streaming this is in separate processes with each wall
+        #    as a fragment which are then added to the document in order
+        #    svgwrite creates the whole document in memory so always converts in this process
+        # Allow override of processes otherwise take from config
+        if "processes" in options.keys():
+            processes = options['processes']
+        else:
+            processes = self.config.update_processes
+        wall_updater = WallUpdater(processes)
+        # Textures are read from the cache if available, can be disabled using cache option
+        cache = None
+        if options.get("cache", True) != False:
+            cache = self.get_cache()
+        
+        # Progress - 30% for updating walls, 60% for output
+        def update_progress():
+            nonlocal percent_complete
+            percent_complete += per_wall_percent / 3
+            if gui != None:
+                gui.progress_update_signal.emit(percent_complete)
+        wall_updater.update_walls(walls, status_callback=update_progress, cache=cache)
+        
+        # Get size (pixels) of each wall so they can be placed on sheets
+        wall_sizes = []
         for wall in walls:
-            #print (f"Exporting wall {wall_num}")
-            # First update the wall
-            wall.update()
+            wall_sizes.append(sc.convert(wall.get_maxsize()))
+        sheets = nest_parts(wall_sizes, svgsettings['docsize'], spacing, nest_rotate)
+        # If no walls then still create an empty sheet
+        if sheets == []:
+            sheets = [Sheet(svgsettings['docsize'])]
             
-            # Is this modulo grid_width if so then start next line
-            # Will match on first one - which will add spacing
-            if num_objects % grid_width == 0:
-                # Reset x and extend y
-                offset [0] = spacing
-                offset [1] = offset[1] + current_height + spacing
-                svg.set_offset(offset)
-            num_objects += 1
-            # At end of adding each shape we extend the x position (but not the y)
-            # Get overall dimensions for positioning
-            num_objectsect_size = sc.convert(wall.get_maxsize())
+        # Position of each wall and transform if rotated
+        wall_positions = {}
+        for sheet in sheets:
+            for placement in sheet.placements:
+                # Position so top left of wall is at the placement position
+                wall_min = sc.convert(Polygon(walls[placement.part].points).bounds[0:2])
+                if placement.rotated:
+                    # Draw in a group rotated 90 degrees clockwise around the top left
+                    offset = [-wall_min[0], -wall_min[1]]
+                    transform = f"translate({placement.position[0] + placement.size[0]} {placement.position[1]}) rotate(90)"
+                else:
+                    offset = [placement.position[0] - wall_min[0], placement.position[1] - wall_min[1]]
+                    transform = None
+                wall_positions[placement.part] = (offset, transform)
+        
+        # Walls converted in separate processes are only supported by the streaming writer
+        # Walls are submitted in the order they are written, with at most max_pending fragments
+        # that are not yet written so they are not all held in memory at the same time
+        # futures is the fragment for each wall that has been submitted
+        use_fragments = wall_updater.use_processes() and svg_class == StreamingSVGOut
+        futures = {}
+        submit_parts = []
+        max_pending = 2 * wall_updater.processes
+        if use_fragments:
+            executor = wall_updater.get_executor()
+            submit_parts = [placement.part for sheet in sheets for placement in sheet.placements]
+        
+        def submit_fragments():
+            while len(submit_parts) > 0 and len(futures) < max_pending:
+                part = submit_parts.pop(0)
+                wall = walls[part]
+                offset, transform = wall_positions[part]
+                futures[part] = executor.submit(export_wall_fragment,
+                    wall.get_cuts(show_interlock=True, show_textures=True),
+                    wall.get_etches(show_interlock=True, show_textures=True),
+                    svgsettings, en_travel, offset, transform, sc, EtchLine.global_etch_width)
+        
+        for sheet_num in range(0, len(sheets)):
+            sheet = sheets[sheet_num]
+            svg = svg_class(get_sheet_filename(filename, sheet_num, len(sheets)), svgsettings)
+            # Incomplete file is removed if there is an error before it is saved
+            try:
+                # Actual area of walls (pixels) to report how much of the sheet is used
+                parts_area = 0
+                for placement in sheet.placements:
+                    wall = walls[placement.part]
+                    if use_fragments:
+                        submit_fragments()
+                        fragment, before, after = futures.pop(placement.part).result()
+                        svg.add_fragment(fragment)
+                    else:
+                        offset, transform = wall_positions[placement.part]
+                        before, after = export_wall(svg,
+                            wall.get_cuts(show_interlock=True, show_textures=True),
+                            wall.get_etches(show_interlock=True, show_textures=True),
+                            en_travel, offset, transform)
+                    travel_before += before
+                    travel_after += after
+                    parts_area += Polygon(wall.points).area * sc.get_factor() ** 2
                             
-            # get the cuts
-            for cut in wall.get_cuts(show_interlock=True, show_texture=True):
-                svg.add_cut(cut)
-                    
-            # Get the etching
-            etches = wall.get_etches()
-            if etches != None:
-                for etch in etches:
-                    svg.add_etch(etch)
-                        
-            # Add offset for the end - do this even if this is last on column as it will be reset when next line
-            offset[0] = offset[0] + spacing  + num_objectsect_size[0]
-            svg.set_offset(offset)
-            if num_objectsect_size[1] > current_height :
-                current_height = num_objectsect_size[1]
-            wall_num += 1
-            # Print status
-            #print (f"{round((wall_num/num_walls) * 100)} % complete")
-            percent_complete += per_wall_percent
-            if gui != None:
-                gui.progress_update_signal.emit(percent_complete)
+                    # Print status
+                    #print (f"{round((wall_num/num_walls) * 100)} % complete")
+                    percent_complete += per_wall_percent * 2 / 3
+                    if gui != None:
+                        gui.progress_update_signal.emit(percent_complete)
+                svg.save()
+            finally:
+                svg.close()
+            print (f"Sheet {sheet_num+1} of {len(sheets)}: {len(sheet.placements)} walls, {sheet.get_utilization(parts_area)*100:.0f}% used")
         #print ("Data compiled - saving")
         
         percent_complete = 100
         if gui != None:
             gui.progress_update_signal.emit(percent_complete)
         
-        svg.save()
+        if en_travel:
+            # Travel is calculated using actual size so convert to scale
+            print (f"Estimated laser travel reduced from {sc.scale_convert(travel_before):.0f}mm to {sc.scale_convert(travel_after):.0f}mm")
         
         print ("Save complete")
+        return (True, "")
     
     # Sets all the data entries - used when loading a template 
     # Overwrites all data
     def set_all_data(self, data):
         # Make a copy of the data
         self.data = data.copy()
+        # Not from a file so there is no cache
+        self.cache_filename = None
+        self.cache = None
+        
+    # Returns the cache for the loaded file or None if not using a cache
+    def get_cache(self):
+        if self.cache == None and self.cache_filename != None:
+            self.cache = BuildingCache(self.cache_filename)
+        return self.cache
         
     # Returns the data object
     # May have missing data
@@ -485,6 +607,18 @@ class BuildingData ():
             return []
         return self.data["textures"]
     
+    # Returns data for export_file in the same format as Builder.update_bdata
+    # Used when exporting without the GUI (eg. lcmake)
+    # Roofs are added after the walls as they are handled as walls when exporting
+    def get_export_data(self):
+        export_data = self.get_main_data()
+        export_data['settings'] = self.get_settings()
+        export_data['walls'] = self.get_walls() + self.get_roofs()
+        export_data['textures'] = self.get_textures()
+        export_data['features'] = self.get_features()
+        export_data['interlocking'] = self.get_interlocking()
+        return export_data
+    
     # Returns as a copy of the parameters and settings
     def get_values(self):
         if "parameters" in self.data.keys():
@@ -527,4 +661,64 @@ class BuildingData ():
             overlap_dict["rear"] = self.data["parameters"]["roof_rear_overlap"]
         else:
             overlap_dict["rear"] = 0
-        return overlap_dict
\ No newline at end of file
+        return overlap_dict
+
+# Adds the cuts and etches for a wall to svg (SVGOut, StreamingSVGOut or SVGFragment)
+# offset is in pixels, if transform is not None then the wall is added in a group with that transform
+# Returns estimated travel (mm) before and after optimizing (0 if not optimized)
+@instrument.timed("export.wall")
+def export_wall (svg, cuts, etches, en_travel, offset, transform=None):
+    travel_before = 0
+    travel_after = 0
+    # If output as paths then merge lines which join together first
+    if etches != None and svg.settings["etchaspath"] == True:
+        with instrument.span("export.merge_etches"):
+            etches = merge_etch_lines(etches)
+        
+    # Reorder to reduce travel of laser head
+    if en_travel:
+        with instrument.span("export.optimize_travel"):
+            cuts, before, after = optimize_travel(cuts)
+            travel_before += before
+            travel_after += after
+            if etches != None:
+                etches, before, after = optimize_travel(etches)
+                travel_before += before
+                travel_after += after
+    
+    with instrument.span("svg.add"):
+        svg.set_offset(offset)
+        if transform != None:
+            svg.start_group(transform)
+        for cut in cuts:
+            svg.add_cut(cut)
+        if etches != None:
+            for etch in etches:
+                svg.add_etch(etch)
+        if transform != None:
+            svg.end_group()
+    if instrument.is_enabled():
+        instrument.count("export.cuts", count_primitives(cuts))
+        if etches != None:
+            instrument.count("export.etches", count_primitives(etches))
+    return (travel_before, travel_after)
+
+# Number of primitives including the lines in each batch
+def count_primitives (primitives):
+    total = 0
+    for primitive in primitives:
+        if primitive.get_type() == "line_batch":
+            total += len(primitive)
+        else:
+            total += 1
+    return total
+
+# Run in a separate process to convert a wall into an SVG fragment
+# Scale and etch width are class variables so need to be set in the process
+# Returns (fragment, travel before, travel after)
+def export_wall_fragment (cuts, etches, svgsettings, en_travel, offset, transform, sc, etch_width):
+    Laser.sc = sc
+    EtchLine.global_etch_width = etch_width
+    svg = SVGFragment(svgsettings)
+    travel_before, travel_after = export_wall(svg, cuts, etches, en_travel, offset, transform)
+    return (svg.get_fragment(), travel_before, travel_after)
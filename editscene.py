@@ -7,6 +7,7 @@ from texture import Texture
 from feature import Feature
 from objview import ObjView
 from viewscene import ViewScene
+import instrument
 from laser import Laser
 
 class EditScene(ViewScene):
@@ -38,6 +39,7 @@ class EditScene(ViewScene):
     # Selection is default which indicates that those that were selected should still be
     # If any objects have been deleted then it should be set to false becaues otherwise
     # will try and select objects that are deleted.
+    @instrument.timed("editscene.update")
     def update(self, feature_obj_pos=False, selection=True):
         #print ("Updating edit scene")
         # check for moved objeects
@@ -54,12 +56,14 @@ class EditScene(ViewScene):
                 if self.obj_views[i].item_group.isSelected():
                     selected_features.append(i)
         # clear scene
+        self.scene.begin_update()
         self.scene.clear()
         # delete all views by resetting the list
         self.obj_views == []
         # add wall and features
         self.add_wall() # includes textures
         self.add_features() # Add features seperately
+        self.scene.end_update()
         if selection == True:
             # reselect those that should be selected
             for i in selected_features:
@@ -163,7 +167,8 @@ class EditScene(ViewScene):
         # Add texture if enabled
         if self.gconfig.checkbox['texture']:
             for etch in self.wall.get_texture_etches_basic():
-                self.obj_views[0].add_etch(etch)
+                self.obj_views[0].add_texture(etch)
+        self.obj_views[0].finish()
         #print (f"Wall pos is {self.obj_views[0].get_pos()}")
             
     def add_features (self):
@@ -193,6 +198,7 @@ class EditScene(ViewScene):
             if etches != None:
                 for etch in etches:
                     self.obj_views[-1].add_etch(etch)
+            self.obj_views[-1].finish()
  
                     
     def clear(self):
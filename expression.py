@@ -0,0 +1,54 @@
+# Expressions used for values in buildings and templates (eg. "x + width/2")
+# Each expression is parsed once and the compiled version cached so that it
+# can be evaluated again with different values (eg. after changing the width)
+# Only numbers, names and arithmetic are allowed so that a file cannot run
+# other code (which would be possible using eval on the string)
+import ast
+from functools import lru_cache
+
+# Operators that are allowed
+# Power is not included as a large power could take a very long time to calculate
+allowed_operators = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.UAdd, ast.USub)
+
+class Expression():
+    def __init__ (self, expression_string):
+        self.expression_string = expression_string
+        try:
+            tree = ast.parse(expression_string.strip(), mode="eval")
+        except SyntaxError as err:
+            raise ValueError(f"Invalid expression {expression_string} - {err.msg}")
+        self.names = set()
+        self._check_node(tree.body)
+        self.code = compile(tree, "<expression>", "eval")
+
+    # Raises ValueError if the node (or any of its children) is not allowed
+    def _check_node (self, node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, allowed_operators):
+            self._check_node(node.left)
+            self._check_node(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, allowed_operators):
+            self._check_node(node.operand)
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            pass
+        elif isinstance(node, ast.Name):
+            self.names.add(node.id)
+        else:
+            raise ValueError(f"Invalid expression {self.expression_string} - {type(node).__name__} not allowed")
+
+    # values is a dict (or other mapping) of name to number
+    def evaluate (self, values):
+        try:
+            return eval(self.code, {"__builtins__": {}}, values)
+        except NameError:
+            missing = [name for name in sorted(self.names) if name not in values]
+            raise ValueError(f"Invalid expression {self.expression_string} - unknown value {', '.join(missing)}")
+
+
+# Returns Expression for the string from the cache (parsed if not already in the cache)
+@lru_cache(maxsize=4096)
+def get_expression (expression_string):
+    return Expression(expression_string)
+
+# Parse (if required) and evaluate an expression using the values
+def evaluate_expression (expression_string, values):
+    return get_expression(expression_string).evaluate(values)
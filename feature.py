@@ -19,6 +19,9 @@ class Feature():
         self.template = feature_template
         self.min_x = startpos[0]
         self.min_y = startpos[1]
+        # Wall that the feature is on - set by the wall when added
+        # Used to tell the wall when the feature is moved
+        self.wall = None
         # avoid access points directly - as doesn't take into consideration startpos
         # instea use get_exclude() which returns points with min_x, min_y applied
         self.points = points
@@ -180,6 +183,10 @@ class Feature():
             etch.set_internal_offset((self.min_x, self.min_y))
         for outer in self.outers:
             outer.set_internal_offset((self.min_x, self.min_y))
+        # Outer cuts / etches are created from the outers so need regenerating
+        # as well as which parts of the texture are excluded
+        if self.wall != None:
+            self.wall._invalidate_features()
 
     
     def get_exclude (self):
@@ -20,6 +20,9 @@ class GConfig():
         # 2 = more detailed
         # 4 = very high level of debug
         self.debug = 0
+        # If debug is 2 or more then timings are recorded (see instrument.py)
+        # and saved to this file when the application exits
+        self.profile_file = "lc-profile.json"
         
         # Check to see if default screensize is a reasonable size for this screen
         # just basic check to see if it's larger and if so set to maximum screen size
@@ -60,6 +63,11 @@ class GConfig():
         # based on view
         # Normally don't want this set
         self.view_etch_as_polygon = False
+
+        # Below this zoom textures are drawn as a pixmap rather than each line (see textureitem)
+        # Pixels on the screen per mm of the building (100% zoom is 0.076 see viewscale)
+        # Default is just below 100% zoom, so the pixmap is used when zoomed out
+        self.texture_detail_pixels_per_mm = 0.07
         
         # temporary settings - based on checkbox settings from mainwindow
         # il is Interlocking (whether to display or not)
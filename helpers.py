@@ -1,7 +1,10 @@
 import math
+import heapq
 import copy
-from shapely import Point, Polygon, LineString
-from laser import EtchLine
+import numpy as np
+import shapely
+from shapely import Point, Polygon, LineString, STRtree
+from laser import EtchLine, EtchLineBatch
 
 # Helper functions
 def get_angle (line):
@@ -59,6 +62,93 @@ def shapely_to_linelist (intersect):
         return_list.append([[intersect.bounds[0], intersect.bounds[1]], [intersect.bounds[2], intersect.bounds[3]]])
     return return_list
 
+# Replace some of the lines in an array of lines (shape (n, 2, 2)) keeping the order
+# pieces is a dict of line number to list of replacement lines (may be empty to remove the line)
+# Returns the new array of lines and the original line number for each new line
+# (which can be used to copy other values such as strength)
+def replace_lines (lines, pieces):
+    counts = np.ones(len(lines), dtype=int)
+    for i, new_lines in pieces.items():
+        counts[i] = len(new_lines)
+    index = np.repeat(np.arange(len(lines)), counts)
+    final_lines = lines[index]
+    positions = np.cumsum(counts) - counts
+    for i, new_lines in pieces.items():
+        if counts[i] > 0:
+            final_lines[positions[i]:positions[i]+counts[i]] = new_lines
+    return (final_lines, index)
+
+# Merge etch lines which are collinear and touch (or overlap) into a single line
+# Only merged if strength and etch_width are also the same
+# Used when exporting to reduce the number of separate lines
+# Returns a new EtchLineBatch, direction of lines may be reversed
+def merge_collinear_lines (batch, tolerance=1e-6):
+    if len(batch) < 2:
+        return batch
+    lines = batch.get_lines()
+    # Make direction consistent (left to right or top to bottom if vertical)
+    # so that lines drawn in opposite directions can still be merged
+    delta = lines[:, 1] - lines[:, 0]
+    flip = (delta[:, 0] < 0) | ((delta[:, 0] == 0) & (delta[:, 1] < 0))
+    lines[flip] = lines[flip][:, ::-1]
+    delta = lines[:, 1] - lines[:, 0]
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    # Zero length lines are not merged
+    valid = length > tolerance
+    direction = delta[valid] / length[valid, np.newaxis]
+    valid_lines = lines[valid]
+    # Distance of the line from the origin (perpendicular) and position along the line
+    distance = direction[:, 0] * valid_lines[:, 0, 1] - direction[:, 1] * valid_lines[:, 0, 0]
+    start_pos = (valid_lines[:, 0] * direction).sum(axis=1)
+    end_pos = (valid_lines[:, 1] * direction).sum(axis=1)
+    # Lines with the same key are collinear with the same strength and width
+    widths = np.nan_to_num(batch.etch_widths[valid], nan=-1)
+    keys = np.stack((batch.strengths[valid], np.round(widths / tolerance),
+        np.round(direction[:, 0] / tolerance), np.round(direction[:, 1] / tolerance),
+        np.round(distance / tolerance)), axis=1).astype(np.int64)
+    order = np.lexsort((start_pos, keys[:, 4], keys[:, 3], keys[:, 2], keys[:, 1], keys[:, 0]))
+    # Step through in order extending the current line until reach a gap
+    keys = keys.tolist()
+    start_pos = start_pos.tolist()
+    end_pos = end_pos.tolist()
+    merged = []         # index of first line and index of line with the end point
+    current_end = None
+    for i in order.tolist():
+        if current_end != None and keys[i] == keys[merged[-1][0]] and start_pos[i] <= current_end + tolerance:
+            if end_pos[i] > current_end:
+                current_end = end_pos[i]
+                merged[-1][1] = i
+        else:
+            merged.append([i, i])
+            current_end = end_pos[i]
+    merged = np.array(merged, dtype=int).reshape(-1, 2)
+    new_lines = np.stack((valid_lines[merged[:, 0], 0], valid_lines[merged[:, 1], 1]), axis=1)
+    valid_index = np.flatnonzero(valid)[merged[:, 0]]
+    invalid_index = np.flatnonzero(~valid)
+    new_lines = np.concatenate((new_lines, lines[invalid_index]))
+    index = np.concatenate((valid_index, invalid_index))
+    return EtchLineBatch.from_lines(new_lines, batch.strengths[index], batch.etch_widths[index])
+
+# Combines all etch lines (EtchLine and EtchLineBatch) into a single
+# EtchLineBatch and merges collinear lines
+# Other etches (eg. rect) are returned unchanged
+def merge_etch_lines (etches):
+    other_etches = []
+    batches = []
+    lines = []
+    for etch in etches:
+        if etch.get_type() == "line_batch":
+            batches.append(etch)
+        elif etch.get_type() == "line":
+            lines.append(etch)
+        else:
+            other_etches.append(etch)
+    if lines != []:
+        batches.append(EtchLineBatch.from_etch_lines(lines))
+    if batches == []:
+        return other_etches
+    return other_etches + [merge_collinear_lines(EtchLineBatch.concatenate(batches))]
+
 # Keeps responses as linestrings (or converts to line strings)
 def shapely_to_linestrings (intersect):
     return_list = []
@@ -76,39 +166,54 @@ def shapely_to_linestrings (intersect):
         return_list.append(Linestring(intersect))
     return return_list
 
-# Removes features from etchlines and returns as etchlines
+# Removes features from etchlines and returns as an EtchLineBatch
 def line_remove_features (lines, excludes):
-    if excludes == []:
-        return copy.copy(lines)
-    final_lines = []
-    #print (f"Removing features {lines}, {excludes}")
-    if lines == []:
-        return final_lines
-    exclude_poly = []
-   
-    for exclude in excludes:
-        exclude_poly.append(Polygon(exclude))
-    
-    # Check a line at a time against all polys
-    for this_line in lines:
-        # Convert etchline into a linestring and get width & strength for use later
-        # Place linestring into list so can iterate over for each polygon
-        linestrings = [LineString(this_line.get_line())]
-        etch_width = this_line.etch_width
-        strength = this_line.strength
-        
-        for poly in exclude_poly:
-            new_linestrings = []
-            for linestring in linestrings:
-                new_linestrings.extend(shapely_to_linestrings(linestring.difference(poly)))
-            #  linestrings replaced with new_linestrings so that we apply next poly on the updated list
-            linestrings = new_linestrings
-        # applied against all polys so now add to final lines as an etchline
-        for linestring in linestrings:
-            final_lines.append(EtchLine(linestring.coords[0], linestring.coords[1], etch_width=etch_width, strength=strength))
-        # now apply to next line
-    return final_lines
+    return ExcludeIndex(excludes).remove_features(lines)
+
 
+# Spatial index of exclude areas (eg. features) used to remove them from etchlines
+# Create once for a set of excludes (eg. during a wall update) then use for all lines
+# Only lines that intersect with an exclude polygon need any geometry operations
+# any others are returned unchanged
+class ExcludeIndex():
+    def __init__ (self, excludes):
+        self.exclude_poly = []
+        for exclude in excludes:
+            self.exclude_poly.append(Polygon(exclude))
+        self.tree = None
+        if self.exclude_poly != []:
+            self.tree = STRtree(self.exclude_poly)
+
+    # Returns a new EtchLineBatch with excludes removed
+    # lines can be an EtchLineBatch or a list of EtchLines
+    def remove_features (self, lines):
+        if not isinstance(lines, EtchLineBatch):
+            lines = EtchLineBatch.from_etch_lines(lines)
+        # Batches are not changed so can return the same one
+        if self.tree == None or len(lines) == 0:
+            return lines
+        line_array = lines.get_lines()
+        linestrings = shapely.linestrings(line_array)
+        # Pairs of line and polygon which intersect - sorted by line
+        line_ids, poly_ids = self.tree.query(linestrings, predicate="intersects")
+        candidates = {}
+        for line_id, poly_id in zip(line_ids.tolist(), poly_ids.tolist()):
+            candidates.setdefault(line_id, []).append(poly_id)
+        # Lines not near any of the excludes are kept as they are
+        pieces = {}
+        for i, poly_list in candidates.items():
+            # Place linestring into list so can iterate over for each polygon
+            line_segments = [linestrings[i]]
+            # Apply in same order as the excludes were provided
+            for poly_id in sorted(poly_list):
+                new_segments = []
+                for linestring in line_segments:
+                    new_segments.extend(shapely_to_linestrings(linestring.difference(self.exclude_poly[poly_id])))
+                # line_segments replaced with new_segments so that we apply next poly on the updated list
+                line_segments = new_segments
+            pieces[i] = [[linestring.coords[0], linestring.coords[1]] for linestring in line_segments]
+        final_lines, index = replace_lines(line_array, pieces)
+        return EtchLineBatch.from_lines(final_lines, lines.strengths[index], lines.etch_widths[index])
 
 
 #     # Check a poly at a time against all segments
@@ -126,3 +231,93 @@ def line_remove_features (lines, excludes):
 #             returned_segments = shapely_to_linelist(linestring.difference(poly))
 #             for new_segment in returned_segments:
 #                 final_lines.append(EtchLine(new_segment[0], new_segment[1], etch_width=etch_width, strength=strength))
+
+
+# Index of rectangles [min_x, min_y, max_x, max_y] (eg. the objects on a view scene)
+# Used to find whether a new rectangle overlaps any of the existing ones
+# Each rectangle has a key (eg. the object) and they are kept in the order they were first added
+# The STRtree cannot be changed so is rebuilt the next time it is queried after any changes
+class RectIndex():
+    def __init__ (self):
+        self.clear()
+
+    def clear (self):
+        self.rects = {}
+        self._invalidate()
+
+    def _invalidate (self):
+        self.tree = None
+        self.keys = []
+        self.rect_array = np.zeros((0, 4))
+        self.bounds = None
+
+    def __len__ (self):
+        return len(self.rects)
+
+    # Add a rectangle, or if key already exists then update it (eg. object has moved)
+    def set (self, key, rect):
+        rect = list(rect)
+        if self.rects.get(key) == rect:
+            return
+        self.rects[key] = rect
+        self._invalidate()
+
+    def remove (self, key):
+        if key in self.rects:
+            del self.rects[key]
+            self._invalidate()
+
+    def _update_tree (self):
+        if self.tree != None or self.rects == {}:
+            return
+        self.keys = list(self.rects.keys())
+        rects = list(self.rects.values())
+        self.rect_array = np.array(rects, dtype=float)
+        self.tree = STRtree(shapely.box(*self.rect_array.T))
+        # Uses the values rather than the array so they are the same type (eg. int) as added
+        self.bounds = [min(rect[0] for rect in rects), min(rect[1] for rect in rects),
+            max(rect[2] for rect in rects), max(rect[3] for rect in rects)]
+
+    # Returns [min_x, min_y, max_x, max_y] of all the rectangles or None if empty
+    def get_bounds (self):
+        self._update_tree()
+        return self.bounds
+
+    # Returns the keys of the rectangles which overlap (including touching) the rectangle
+    # in the order they were added
+    def get_overlapping (self, rect):
+        self._update_tree()
+        if self.rects == {}:
+            return []
+        candidates = self.tree.query(shapely.box(*rect))
+        # Tree only checks bounding boxes are close, so check the rectangles
+        found = self.rect_array[candidates]
+        overlaps = ((found[:, 2] >= rect[0]) & (found[:, 0] <= rect[2]) &
+            (found[:, 3] >= rect[1]) & (found[:, 1] <= rect[3]))
+        return [self.keys[i] for i in np.sort(candidates[overlaps]).tolist()]
+
+# Finds overlapping rectangles when moving along a row (eg. looking for space in find_space)
+# rects are [min_x, min_y, max_x, max_y] which all overlap the row (y), eg. from RectIndex
+# Each call to first_overlap must have min_x / max_x the same or higher than the previous call.
+# Rectangles are added to a heap (by their position in rects) when reached and removed when
+# passed, so each is only checked once rather than checking every rectangle each time.
+class RowScan():
+    def __init__ (self, rects):
+        self.rects = rects
+        # Position in rects, ordered by left edge
+        self.by_left = sorted(range(len(rects)), key=lambda i: rects[i][0])
+        self.next_left = 0
+        self.active = []
+
+    # Returns the position (in rects) of the first rectangle which overlaps (including touching)
+    # min_x to max_x, or None if there are none
+    def first_overlap (self, min_x, max_x):
+        while self.next_left < len(self.by_left) and self.rects[self.by_left[self.next_left]][0] <= max_x:
+            heapq.heappush(self.active, self.by_left[self.next_left])
+            self.next_left += 1
+        # Any to the left will not overlap this or any later calls
+        while self.active != [] and self.rects[self.active[0]][2] < min_x:
+            heapq.heappop(self.active)
+        if self.active == []:
+            return None
+        return self.active[0]
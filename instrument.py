@@ -0,0 +1,175 @@
+# Timing spans and counters used to find which parts of load / export / redraw are slow
+# Disabled by default, in which case span returns a span that does nothing and
+# timed / count only check a single flag
+# Enable using
+#     LC_PROFILE=profile.json python3 building.py
+# or setting GConfig.debug (see mainwindow) or by calling enable
+# Results are saved as a Chrome trace file (open in chrome://tracing or https://ui.perfetto.dev)
+# with the totals for each span and counter included in otherData
+# Does not import PySide6 so can be used by lcmake / worker processes
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import multiprocessing
+
+# Environment variable which enables instrumentation and is the filename to save to
+env_variable = "LC_PROFILE"
+
+class Recorder():
+    def __init__ (self):
+        self.enabled = False
+        self.filename = None
+        self.start_time = time.perf_counter()
+        self.events = []
+        # Totals for each span - name: [count, total, min, max] (seconds)
+        self.spans = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.saved_atexit = False
+
+    # If filename then results are saved to that file when the program exits
+    def enable (self, filename=None):
+        self.enabled = True
+        if filename != None:
+            self.filename = filename
+            if not self.saved_atexit:
+                atexit.register(self._save_atexit)
+                self.saved_atexit = True
+
+    def disable (self):
+        self.enabled = False
+
+    def clear (self):
+        with self.lock:
+            self.start_time = time.perf_counter()
+            self.events = []
+            self.spans = {}
+            self.counters = {}
+
+    def add_span (self, name, start, end):
+        duration = end - start
+        with self.lock:
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.start_time) * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident()
+                })
+            if name not in self.spans:
+                self.spans[name] = [0, 0, duration, duration]
+            totals = self.spans[name]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = min(totals[2], duration)
+            totals[3] = max(totals[3], duration)
+
+    def add_count (self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append({
+                "name": name,
+                "ph": "C",
+                "ts": (time.perf_counter() - self.start_time) * 1e6,
+                "pid": os.getpid(),
+                "args": {"total": self.counters[name]}
+                })
+
+    # Totals for each span (seconds) and counter
+    def get_summary (self):
+        with self.lock:
+            spans = {}
+            for name, (number, total, minimum, maximum) in self.spans.items():
+                spans[name] = {"count": number, "total": total, "min": minimum, "max": maximum}
+            return {"spans": spans, "counters": dict(self.counters)}
+
+    def save (self, filename):
+        summary = self.get_summary()
+        with self.lock:
+            trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms", "otherData": summary}
+        with open(filename, "w") as trace_file:
+            json.dump(trace, trace_file)
+
+    # Worker processes also have the environment variable so add the process id to the filename
+    def _save_atexit (self):
+        filename = self.filename
+        if multiprocessing.parent_process() != None:
+            base, extension = os.path.splitext(filename)
+            filename = f"{base}.{os.getpid()}{extension}"
+        self.save(filename)
+
+
+# Used when disabled
+class NullSpan():
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        return False
+
+class Span():
+    def __init__ (self, name):
+        self.name = name
+
+    def __enter__ (self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        recorder.add_span(self.name, self.start, time.perf_counter())
+        return False
+
+
+recorder = Recorder()
+null_span = NullSpan()
+
+# Context manager for timing part of a method
+#     with span("export.wall"):
+def span (name):
+    if not recorder.enabled:
+        return null_span
+    return Span(name)
+
+# Decorator for timing a function or method
+#     @timed("wall.update_cuts")
+def timed (name):
+    def decorator (function):
+        @functools.wraps(function)
+        def wrapper (*args, **kwargs):
+            if not recorder.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.add_span(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+# Add value to a counter (eg. number of etches created)
+def count (name, value=1):
+    if recorder.enabled:
+        recorder.add_count(name, value)
+
+def enable (filename=None):
+    recorder.enable(filename)
+
+def disable ():
+    recorder.disable()
+
+def is_enabled ():
+    return recorder.enabled
+
+def get_summary ():
+    return recorder.get_summary()
+
+def save (filename):
+    recorder.save(filename)
+
+
+if os.environ.get(env_variable, "") != "":
+    enable(os.environ[env_variable])
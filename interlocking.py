@@ -1,3 +1,5 @@
+import math
+import numpy as np
 from helpers import *
 
 class Interlocking():
@@ -42,7 +44,7 @@ class Interlocking():
         return self.primary == "primary"
         
     # Takes a single line segment (either full line or remaining after an interlock has been added)
-    # then add the interlocks recursively through add_interlock_segment
+    # then add the interlocks through add_interlock_segment
     # returns list of line segments for the interlocking and any remaining edge
     # line start is the start of the entire line (used for determining start and end)
     def add_interlock_line (self, line_start, line_end, line):
@@ -107,15 +109,38 @@ class Interlocking():
        
 
     # max line should be last distance for line (eg. - 1 step from end)
+    # Adds tabs until there is not enough space for another tab
+    # Horizontal and vertical lines are created as a numpy array (_add_tabs_array)
+    # then any remaining tabs (or for other lines all the tabs) are added one at a time
+    # Both give exactly the same values (including rounding) as adding each tab in turn
+    # Returns list of segments with the remaining part of the line as the last segment
     def add_interlock_segment (self, line_start, line, max_line):
-        #print (f" Adding segment {line_start} {line} {max_line}")
-        new_segments = [] 
+        new_segments, line = self._add_tabs_array(line_start, line, max_line)
+        tab_starts = set()
+        while True:
+            # If a tab starts at the same position as a previous tab (eg. step rounded to 0 or
+            # the tabs going back and forth around the end of the line) then the same tabs
+            # would be repeated without reaching the end so stop adding tabs
+            if tuple(line[0]) in tab_starts:
+                new_segments.append(line)
+                return new_segments
+            tab_starts.add(tuple(line[0]))
+            tab_segments = self._add_tab(line_start, line, max_line)
+            if tab_segments == None:
+                new_segments.append(line)
+                return new_segments
+            new_segments.extend(tab_segments)
+            # Next tab starts at the end of this tab
+            line = (tab_segments[-1][1], line[1])
+
+    # Returns the 4 segments for a single tab at the start of line or None if not enough space
+    def _add_tab (self, line_start, line, max_line):
         # Check we have enough space for Indent 
         angle = get_angle (line)
         # Next tab is 2 x tab position and will be where the next tab starts if applicable (not this tab)
         nexttab = add_distance_to_points (line[0], self.step * 2, angle)
         if check_distance (line_start, nexttab, max_line) < 0:
-            return [line]
+            return None
         endtab = add_distance_to_points (line[0], self.step, angle)
         # confirmed we have space so add next segment - turn by +/-90 degrees
         if self.reverse != True:
@@ -123,17 +148,69 @@ class Interlocking():
         else:
             seg_angle = angle-90
         starttab = add_distance_to_points (line[0], Interlocking.material_thickness, seg_angle)
-        new_segments.append((line[0], starttab))
         # next segment is back to normal angle
         toptab = add_distance_to_points (starttab, self.step, angle)
-        new_segments.append((starttab, toptab))
-        # Now back to endtab already calculated
-        new_segments.append((toptab, endtab))
-        # Straight line to start of next tab
-        new_segments.append((endtab, nexttab))
-        # now call again with next step
-        new_segments.extend(self.add_interlock_segment (line_start, (nexttab, line[1]), max_line))
-        return new_segments
+        # Out to the tab, along the tab, back to the line and then straight line to start of next tab
+        return [(line[0], starttab), (starttab, toptab), (toptab, endtab), (endtab, nexttab)]
+
+    # Adds all the tabs for a horizontal or vertical line in one go
+    # Angle (and so sin / cos) is the same for every tab so positions are calculated as arrays
+    # To give the same values as _add_tab the positions must stay exactly on the line
+    # so only used if the line is on a whole number and the tab spacing is a whole number
+    # The last tab is left for _add_tab so that the check at the end of the line is the same
+    # Returns (segments, remaining line)
+    def _add_tabs_array (self, line_start, line, max_line):
+        start = line[0]
+        end = line[1]
+        if start[0] == end[0] and start[1] != end[1]:
+            axis = 1
+        elif start[1] == end[1] and start[0] != end[0]:
+            axis = 0
+        else:
+            return ([], line)
+        if not (float(start[1-axis]).is_integer() and float(self.step * 2).is_integer() and self.step >= 1):
+            return ([], line)
+        angle = get_angle (line)
+        # Same values as used by add_distance_to_points
+        direction = np.array((math.sin(math.radians(angle)), math.cos(math.radians(angle))))
+        if self.reverse != True:
+            seg_angle = angle+90
+        else:
+            seg_angle = angle-90
+        seg_direction = np.array((math.sin(math.radians(seg_angle)), math.cos(math.radians(seg_angle))))
+        # Start of each tab - first from line[0] then each is 2 x step from the previous
+        first_next = add_distance_to_points (start, self.step * 2, angle)
+        # After the first tab all positions are whole numbers so each is exactly 2 x step from the previous
+        step_2 = round(self.step * 2 * direction[axis])
+        max_tabs = int(max_line / (self.step * 2)) + 2
+        tab_starts = np.empty((max_tabs + 1, 2))
+        tab_starts[0] = start
+        tab_starts[1:, 1-axis] = start[1-axis]
+        tab_starts[1:, axis] = first_next[axis] + np.arange(0, max_tabs) * step_2
+        # A tab can be added if the start of the next tab is not past max_line and is before the end of the line
+        distances = np.hypot(tab_starts[1:, 0] - line_start[0], tab_starts[1:, 1] - line_start[1])
+        before_end = (end[axis] - tab_starts[1:, axis]) * np.sign(end[axis] - start[axis]) > 0
+        valid = (max_line - distances >= 0) & before_end
+        num_tabs = int(np.argmin(valid)) if not valid.all() else len(valid)
+        # Leave the last tab to be checked by _add_tab
+        num_tabs -= 1
+        if num_tabs < 1:
+            return ([], line)
+        tab_points = tab_starts[:num_tabs]
+        starttabs = np.round(tab_points + Interlocking.material_thickness * seg_direction).astype(np.int64).tolist()
+        toptabs = np.round(np.array(starttabs, dtype=float) + self.step * direction).astype(np.int64).tolist()
+        endtabs = np.round(tab_points + self.step * direction).astype(np.int64).tolist()
+        nexttabs = tab_starts[1:num_tabs+1].astype(np.int64).tolist()
+        new_segments = []
+        previous = start
+        for starttab, toptab, endtab, nexttab in zip(starttabs, toptabs, endtabs, nexttabs):
+            starttab = tuple(starttab)
+            toptab = tuple(toptab)
+            endtab = tuple(endtab)
+            nexttab = tuple(nexttab)
+            new_segments.extend([(previous, starttab), (starttab, toptab), (toptab, endtab), (endtab, nexttab)])
+            previous = nexttab
+        return (new_segments, (previous, end))
 
     
     # are new positions passed the end of the line
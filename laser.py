@@ -13,11 +13,38 @@
 
 # Standard methods uses scale class for scaling
 # Methods with _screen return using vs (zoom level)
+# Individual points are converted using convert_point, polygons and batches using
+# convert_many (a single multiply-add for all the points)
+# Polygon pixel methods return a list of points for svg output, the _screen
+# versions return an array of shape (n, 2)
 
+# Batch classes (CutLineBatch / EtchLineBatch) hold many lines as numpy arrays
+# (one row per line) rather than one object per line. These are used for
+# textures which can have many thousands of lines. The pixel methods return
+# arrays for all the lines in the batch.
+
+import numpy as np
 from viewscale import ViewScale
 
+# Array of points shape (n, 2) - used for batches
+def _line_array(points):
+    return _read_only(np.array(points, dtype=float).reshape(-1, 2))
+
+# Polygon points (list of (x, y)) as an array of shape (n, 2)
+def _point_array(points):
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
 class Laser():
+    # Attributes are in __slots__ rather than a dict for each instance
+    # as there can be a large number of these objects
+    # All subclasses must also define __slots__ (empty if no new attributes)
+    __slots__ = ('type', 'io')
     # Scale convertor set as a class variable
+    # Class variables are not included in __slots__ and are shared by all instances
     # Set once during app startup and then can use for all subclasses
     # Alternative to setting up a singleton
     sc = None
@@ -46,12 +73,14 @@ class Laser():
     
 
 class Cut(Laser):
+    __slots__ = ()
     def __init__(self, type, internal_offset):
         super().__init__(type, internal_offset)
         
        
 # Start and end are tuples
 class CutLine(Cut):
+    __slots__ = ('start', 'end')
     def __init__(self, start, end, internal_offset=(0,0)):
         self.start = start
         self.end = end
@@ -70,32 +99,25 @@ class CutLine(Cut):
     def get_start_pixels(self, offset=(0,0)):
         # Add internal offset to offset
         start_io = (self.start[0]+self.io[0], self.start[1]+self.io[1])
-        start_pixels = Laser.sc.convert(start_io)
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.sc.convert_point(start_io, offset)
     
     def get_start_pixels_screen(self, offset=(0,0)):
         # Add internal offset to offset
         start_io = (self.start[0]+self.io[0], self.start[1]+self.io[1])
-        start_pixels = Laser.vs.convert(start_io)
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(start_io, offset)
     
     # Get end value converted by scale and into pixels
     # If supplied offset is in pixels relative to start of object
     def get_end_pixels(self, offset=(0,0)):
         end_io = (self.end[0]+self.io[0], self.end[1]+self.io[1])
-        end_pixels = Laser.sc.convert(end_io)
-        # Add offset
-        return ([end_pixels[0]+offset[0], end_pixels[1]+offset[1]])
+        return Laser.sc.convert_point(end_io, offset)
     
     def get_end_pixels_screen(self, offset=(0,0)):
         end_io = (self.end[0]+self.io[0], self.end[1]+self.io[1])
-        end_pixels = Laser.vs.convert(end_io)
-        # Add offset
-        return ([end_pixels[0]+offset[0], end_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(end_io, offset)
 
 class CutRect(Cut):
+    __slots__ = ('start', 'size')
     def __init__(self, start, size, internal_offset=(0,0)):
         self.start = start
         self.size = size
@@ -110,24 +132,21 @@ class CutRect(Cut):
           
     def get_start_pixels(self, offset=(0,0)):
         start_io = ([self.start[0]+self.io[0], self.start[1]+self.io[1]])
-        start_pixels = Laser.sc.convert(start_io)
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.sc.convert_point(start_io, offset)
     
     def get_start_pixels_screen(self, offset=(0,0)):
         start_io = ([self.start[0]+self.io[0], self.start[1]+self.io[1]])
-        start_pixels = Laser.vs.convert(start_io)
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(start_io, offset)
     
     # Note that size does not need offset
     def get_size_pixels(self):
-        return Laser.sc.convert(self.size)
+        return Laser.sc.convert_point(self.size)
     
     def get_size_pixels_screen(self):
-        return Laser.vs.convert(self.size)
+        return Laser.vs.convert_point(self.size)
     
 class CutPolygon(Cut):
+    __slots__ = ('points',)
     def __init__(self, points, internal_offset=(0,0)):
         self.points = points
         super().__init__("polygon", internal_offset)
@@ -145,25 +164,58 @@ class CutPolygon(Cut):
     
     # Offset is applied to all points
     def get_points_pixels(self, offset=(0,0)):
-        new_points = []
-        for point in self.points:
-            sc_point = Laser.sc.convert((point[0]+self.io[0], point[1]+self.io[1]))
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.sc.convert_many(_point_array(self.points) + self.io, offset).tolist()
     
     def get_points_pixels_screen(self, offset=(0,0)):
-        new_points = []
-        for point in self.points:
-            sc_point = Laser.vs.convert((point[0]+self.io[0], point[1]+self.io[1]))
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.vs.convert_many(_point_array(self.points) + self.io, offset)
+
+
+# Many cut lines stored as arrays of start and end points (shape (n, 2))
+# Has type "line_batch" - indexing or iterating returns CutLine objects
+class CutLineBatch(Cut):
+    __slots__ = ('starts', 'ends')
+    def __init__(self, starts, ends, internal_offset=(0,0)):
+        self.starts = _line_array(starts)
+        self.ends = _line_array(ends)
+        super().__init__("line_batch", internal_offset)
+        
+    def __len__(self):
+        return len(self.starts)
+    
+    def __getitem__(self, i):
+        return CutLine(tuple(self.starts[i].tolist()), tuple(self.ends[i].tolist()), self.io)
+    
+    def __iter__(self):
+        for i in range (0, len(self.starts)):
+            yield self[i]
+            
+    def __str__(self):
+        return f'Cut {self.type} of {len(self)} lines io {self.io}'
+    
+    # Returns (n, 2, 2) array of lines with internal offset added
+    def get_lines(self):
+        return np.stack((self.starts, self.ends), axis=1) + self.io
+    
+    def get_starts_pixels(self, offset=(0,0)):
+        return Laser.sc.convert_many(self.starts + self.io, offset)
+    
+    def get_starts_pixels_screen(self, offset=(0,0)):
+        return Laser.vs.convert_many(self.starts + self.io, offset)
+    
+    def get_ends_pixels(self, offset=(0,0)):
+        return Laser.sc.convert_many(self.ends + self.io, offset)
+    
+    def get_ends_pixels_screen(self, offset=(0,0)):
+        return Laser.vs.convert_many(self.ends + self.io, offset)
 
 # type could be "line" / "rect" etc. 
 class Etch(Laser):
+    __slots__ = ()
     def __init__(self, type, internal_offset):
         super().__init__(type, internal_offset)
     
-    # Strength is added by the subclass
+    # Strength is added by the subclass (in the subclass __slots__)
+    # Class variable is the default if the subclass does not have a strength
     strength = None
     def get_strength(self):
         return self.strength
@@ -171,6 +223,7 @@ class Etch(Laser):
         
 # Start and end are tuples
 class EtchLine(Etch):
+    __slots__ = ('strength', 'start', 'end', 'etch_width')
     # Default etch width if none others set on individual class
     # Used by etch lines only, but can be accessed by all instances
     global_etch_width = 10
@@ -201,27 +254,19 @@ class EtchLine(Etch):
     # If supplied offset is in pixels relative to start of object
     def get_start_pixels(self, offset=(0,0)):
         # Add internal offset to offset
-        start_pixels = self.sc.convert(self.get_start())
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.sc.convert_point(self.get_start(), offset)
     
     def get_start_pixels_screen(self, offset=(0,0)):
         # Add internal offset to offset
-        start_pixels = self.vs.convert(self.get_start())
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(self.get_start(), offset)
     
     # Get end value converted by scale and into pixels
     # If supplied offset is in pixels relative to start of object
     def get_end_pixels(self, offset=(0,0)):
-        end_pixels = self.sc.convert(self.get_end())
-        # Add offset
-        return ([end_pixels[0]+offset[0], end_pixels[1]+offset[1]])
+        return Laser.sc.convert_point(self.get_end(), offset)
     
     def get_end_pixels_screen(self, offset=(0,0)):
-        end_pixels = self.vs.convert(self.get_end())
-        # Add offset
-        return ([end_pixels[0]+offset[0], end_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(self.get_end(), offset)
     
     def get_end(self):
         return (self.end[0]+self.io[0], self.end[1]+self.io[1])
@@ -232,48 +277,13 @@ class EtchLine(Etch):
     # Gets a line as a polygon instead
     # Required for etches which don't allow lines
     def get_polygon_pixels(self, offset=(0,0)):
-        # half the width - first check local (to this line) - otherwise default to global
-        if self.etch_width != None:
-            hw = self.etch_width / 2
-        else:
-            hw = EtchLine.global_etch_width / 2
-        # Create an approxmation by only widening along thinest part (dx vs dy)
-        # For a horizontal / vertical line this this is accurate
-        # If not then it's an approximation
-        # As this is for a laser cutter the approximation will not be noticed when etched
-        # although may be able to see if using vector editor
-
-        # Need to know which is min and max x determine if increase
-        # or decrease appropriate values
-        dx = abs(self.end[0] - self.start[0])
-        dy = abs(self.end[1] - self.start[1])
-        # If more vertical than horizontal
-        if (dy > dx):
-            points = [
-                (self.start[0]-hw, self.start[1]),
-                (self.start[0]+hw, self.start[1]),
-                (self.end[0]+hw, self.end[1]),
-                (self.end[0]-hw, self.end[1]),
-                (self.start[0]-hw, self.start[1])
-                ]
-        # More horizontal than vertical
-        else:
-            points = [
-                (self.start[0], self.start[1]-hw),
-                (self.end[0], self.end[1]-hw),
-                (self.end[0], self.end[1]+hw),
-                (self.start[0], self.start[1]+hw),
-                (self.start[0], self.start[1]-hw)
-                ]
-        # Now convert to scale and add offsets
-        new_points = []
-        for point in points:
-            point_io = (point[0]+self.io[0], point[1]+self.io[1])
-            sc_point = Laser.sc.convert(point_io)
-            new_points.append(((offset[0]+sc_point[0]),(offset[1]+sc_point[1])))
-        return new_points
+        return Laser.sc.convert_many(self._get_polygon(), offset).tolist()
         
     def get_polygon_pixels_screen(self, offset=(0,0)):
+        return Laser.vs.convert_many(self._get_polygon(), offset)
+    
+    # Returns polygon points in mm (including internal offset)
+    def _get_polygon(self):
         # half the width - first check local (to this line) - otherwise default to global
         if self.etch_width != None:
             hw = self.etch_width / 2
@@ -307,16 +317,11 @@ class EtchLine(Etch):
                 (self.start[0], self.start[1]+hw),
                 (self.start[0], self.start[1]-hw)
                 ]
-        # Now convert to scale and add offsets
-        new_points = []
-        for point in points:
-            point_io = (point[0]+self.io[0], point[1]+self.io[1])
-            sc_point = Laser.vs.convert(point_io)
-            new_points.append(((offset[0]+sc_point[0]),(offset[1]+sc_point[1])))
-        return new_points
+        return [(point[0]+self.io[0], point[1]+self.io[1]) for point in points]
         
         
 class EtchRect(Etch):
+    __slots__ = ('strength', 'start', 'size')
     def __init__(self, start, size, internal_offset=(0,0), strength=5):
         self.strength = strength
         self.start = start
@@ -334,23 +339,20 @@ class EtchRect(Etch):
         return self.size
     
     def get_start_pixels(self, offset=(0,0)):
-        start_pixels = Laser.sc.convert(self.get_start())
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.sc.convert_point(self.get_start(), offset)
     
     def get_start_pixels_screen(self, offset=(0,0)):
-        start_pixels = Laser.vs.convert(self.get_start())
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(self.get_start(), offset)
     
     # Note that size does not need offset
     def get_size_pixels(self):
-        return Laser.sc.convert(self.size)
+        return Laser.sc.convert_point(self.size)
     
     def get_size_pixels_screen(self):
-        return Laser.vs.convert(self.size)
+        return Laser.vs.convert_point(self.size)
         
 class EtchPolygon(Etch):
+    __slots__ = ('strength', 'points')
     def __init__(self, points, internal_offset=(0,0), strength=5):
         self.strength = strength
         self.points = points
@@ -374,31 +376,144 @@ class EtchPolygon(Etch):
     
     # Offset is applied to all points
     def get_points_pixels(self, offset=(0,0)):
-        new_points = []
-        for point in self.get_points():
-            sc_point = Laser.sc.convert(point)
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.sc.convert_many(_point_array(self.points) + self.io, offset).tolist()
 
     def get_points_pixels_screen(self, offset=(0,0)):
-        new_points = []
-        for point in self.get_points():
-            sc_point = Laser.vs.convert(point)
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.vs.convert_many(_point_array(self.points) + self.io, offset)
 
+# Many etch lines stored as arrays (one row per line)
+# Used for textures where an EtchLine object per line uses a lot of memory
+# strengths and etch_widths can be a single value (applied to all) or one per line
+# etch_width of None (stored as nan) uses EtchLine.global_etch_width
+# Arrays are read only so they can be shared between batches (eg. copies from the texture cache)
+class EtchLineBatch(Etch):
+    __slots__ = ('starts', 'ends', 'strengths', 'etch_widths')
+    def __init__(self, starts, ends, internal_offset=(0,0), strengths=5, etch_widths=None):
+        self.starts = _line_array(starts)
+        self.ends = _line_array(ends)
+        num_lines = len(self.starts)
+        if etch_widths is None:
+            etch_widths = np.nan
+        self.strengths = _read_only(np.broadcast_to(np.asarray(strengths, dtype=np.int8), (num_lines,)).copy())
+        self.etch_widths = _read_only(np.broadcast_to(np.asarray(etch_widths, dtype=float), (num_lines,)).copy())
+        super().__init__("line_batch", internal_offset)
+        
+    # Create from a list of EtchLine objects
+    @staticmethod
+    def from_etch_lines(etch_lines, internal_offset=(0,0)):
+        lines = [etch.get_line() for etch in etch_lines]
+        strengths = [etch.strength for etch in etch_lines]
+        etch_widths = [np.nan if etch.etch_width == None else etch.etch_width for etch in etch_lines]
+        lines = np.array(lines, dtype=float).reshape(-1, 2, 2)
+        return EtchLineBatch(lines[:, 0], lines[:, 1], internal_offset, strengths, etch_widths)
+    
+    # Create from (n, 2, 2) array of lines, strengths and etch_widths are arrays or a single value
+    @staticmethod
+    def from_lines(lines, strengths=5, etch_widths=None):
+        lines = np.asarray(lines, dtype=float).reshape(-1, 2, 2)
+        return EtchLineBatch(lines[:, 0], lines[:, 1], strengths=strengths, etch_widths=etch_widths)
+        
+    # Combine multiple batches into a single batch (internal offsets are applied)
+    @staticmethod
+    def concatenate(batches):
+        lines = np.concatenate([batch.get_lines() for batch in batches])
+        strengths = np.concatenate([batch.strengths for batch in batches])
+        etch_widths = np.concatenate([batch.etch_widths for batch in batches])
+        return EtchLineBatch.from_lines(lines, strengths, etch_widths)
+        
+    # New batch which shares the (read only) arrays, so changing the internal offset
+    # of the copy does not change the original
+    def copy(self):
+        new_batch = EtchLineBatch.__new__(EtchLineBatch)
+        new_batch.starts = self.starts
+        new_batch.ends = self.ends
+        new_batch.strengths = self.strengths
+        new_batch.etch_widths = self.etch_widths
+        Etch.__init__(new_batch, self.type, self.io)
+        return new_batch
+
+    def __len__(self):
+        return len(self.starts)
+    
+    # Returns an individual line as an EtchLine
+    def __getitem__(self, i):
+        etch_width = self.etch_widths[i].item()
+        if np.isnan(etch_width):
+            etch_width = None
+        return EtchLine(tuple(self.starts[i].tolist()), tuple(self.ends[i].tolist()), self.io, self.strengths[i].item(), etch_width)
+    
+    def __iter__(self):
+        for i in range (0, len(self.starts)):
+            yield self[i]
+    
+    def __str__(self):
+        return f'Etch {self.type} of {len(self)} lines io {self.io}'
+    
+    # Total size of the arrays in bytes
+    def get_nbytes(self):
+        return self.starts.nbytes + self.ends.nbytes + self.strengths.nbytes + self.etch_widths.nbytes
+    
+    # Returns (n, 2, 2) array of lines with internal offset added
+    def get_lines(self):
+        return np.stack((self.starts, self.ends), axis=1) + self.io
+    
+    # Returns etch widths with global_etch_width where not set
+    def get_etch_widths(self):
+        return np.where(np.isnan(self.etch_widths), EtchLine.global_etch_width, self.etch_widths)
+        
+    def get_starts_pixels(self, offset=(0,0)):
+        return Laser.sc.convert_many(self.starts + self.io, offset)
+    
+    def get_starts_pixels_screen(self, offset=(0,0)):
+        return Laser.vs.convert_many(self.starts + self.io, offset)
+    
+    def get_ends_pixels(self, offset=(0,0)):
+        return Laser.sc.convert_many(self.ends + self.io, offset)
+    
+    def get_ends_pixels_screen(self, offset=(0,0)):
+        return Laser.vs.convert_many(self.ends + self.io, offset)
+    
+    # Same as EtchLine.get_polygon_pixels but for all lines
+    # Returns array of shape (n, 5, 2)
+    def get_polygons_pixels(self, offset=(0,0)):
+        return Laser.sc.convert_many(self._get_polygons() + self.io, offset)
+    
+    def get_polygons_pixels_screen(self, offset=(0,0)):
+        return Laser.vs.convert_many(self._get_polygons() + self.io, offset)
+    
+    # Widen each line into a polygon along thinnest part (dx vs dy)
+    # See EtchLine.get_polygon_pixels
+    def _get_polygons(self):
+        hw = self.get_etch_widths()[:, np.newaxis] / 2
+        dx = np.abs(self.ends[:, 0] - self.starts[:, 0])
+        dy = np.abs(self.ends[:, 1] - self.starts[:, 1])
+        vertical = (dy > dx)[:, np.newaxis]
+        # Amount to widen by - x for vertical lines, y for horizontal lines
+        widen = np.where(vertical, hw * np.array([1, 0]), hw * np.array([0, 1]))
+        starts = self.starts
+        ends = self.ends
+        return np.stack((
+            starts - widen,
+            np.where(vertical, starts + widen, ends - widen),
+            ends + widen,
+            np.where(vertical, ends - widen, starts + widen),
+            starts - widen
+            ), axis=1)
+    
 
 # Outer can be either cut or edge
 # Determined when generating, so convert to appropriate type when required
 # Outer must have a get_args method that allows creation of cut / edge
 # TODO - If etch current default to 5, need to make configurable
 class Outer(Laser):
+    __slots__ = ()
     def __init__(self, type, internal_offset):
         super().__init__(type, internal_offset)
         
     # Unable to use laserfactory due to circular imports
     # implement get_cut / get_etch in each of the child classes
 class OuterLine(Outer):
+    __slots__ = ('strength', 'start', 'end')
     def __init__(self, start, end, internal_offset=(0,0), strength=5):
         self.strength = strength
         self.start = start
@@ -440,16 +555,13 @@ class OuterLine(Outer):
     
     def get_start_pixels_screen(self, offset=(0,0)):
         # Add internal offset to offset
-        start_pixels = self.vs.convert(self.get_start())
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(self.get_start(), offset)
     
     def get_end_pixels_screen(self, offset=(0,0)):
-        end_pixels = self.vs.convert(self.get_end())
-        # Add offset
-        return ([end_pixels[0]+offset[0], end_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(self.get_end(), offset)
     
 class OuterRect(Outer):
+    __slots__ = ('strength', 'start', 'size')
     def __init__(self, start, size, internal_offset=(0,0), strength=5):
         self.strength = strength
         self.start = start
@@ -476,15 +588,14 @@ class OuterRect(Outer):
         return EtchRect(args[0], args[1], self.io)
 
     def get_start_pixels_screen(self, offset=(0,0)):
-        start_pixels = Laser.vs.convert(self.get_start())
-        # Add offset
-        return ([start_pixels[0]+offset[0], start_pixels[1]+offset[1]])
+        return Laser.vs.convert_point(self.get_start(), offset)
     
     
     def get_size_pixels_screen(self):
-        return Laser.vs.convert(self.size)
+        return Laser.vs.convert_point(self.size)
     
 class OuterPolygon(Outer):
+    __slots__ = ('strength', 'points')
     def __init__(self, points, internal_offset=(0,0), strength=5):
         self.strength = strength
         self.points = points
@@ -507,21 +618,18 @@ class OuterPolygon(Outer):
         return EtchPolygon(self.get_args(), self.io)
 
     def get_points_pixels_screen(self, offset=(0,0)):
-        new_points = []
-        #for point in self.get_points():
-        for point in self.points:
-            sc_point = Laser.vs.convert(point)
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.vs.convert_many(_point_array(self.points), offset)
 
 # Exclude is not used by the laser, but is used as part of objview
 # Typically polygons to draw as white areas
 class Exclude(Laser):
+    __slots__ = ()
     def __init__(self, type, internal_offset):
         super().__init__(type, internal_offset)
 
 
 class ExcludePolygon(Etch):
+    __slots__ = ('strength', 'points')
     def __init__(self, points, internal_offset=(0,0), strength=5):
         self.strength = strength	# not used by exclude
         self.points = points
@@ -545,15 +653,7 @@ class ExcludePolygon(Etch):
     
     # Offset is applied to all points
     def get_points_pixels(self, offset=(0,0)):
-        new_points = []
-        for point in self.get_points():
-            sc_point = Laser.sc.convert(point)
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.sc.convert_many(_point_array(self.points) + self.io, offset).tolist()
 
     def get_points_pixels_screen(self, offset=(0,0)):
-        new_points = []
-        for point in self.get_points():
-            sc_point = Laser.vs.convert(point)
-            new_points.append([(offset[0]+sc_point[0]),(offset[1]+sc_point[1])])
-        return new_points
+        return Laser.vs.convert_many(_point_array(self.points) + self.io, offset)
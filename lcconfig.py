@@ -1,6 +1,7 @@
 # This is currently manually edited
 # In future the configuration will be moved to a config file
 # which will be accessed through this class
+import os
 
 class LCConfig():
     def __init__(self): 
@@ -50,5 +51,36 @@ class LCConfig():
         # If etch as polygon True then this value moust be set
         self.etch_line_width = 10
         
+        # Setting option (if set then etch lines are merged where they join and are output
+        # as a single path for each etch strength rather than separate lines / polygons)
+        # This reduces the size of the file and makes it faster to import into laser software
+        # Off by default as it changes the elements in the exported file
+        self.etch_as_path = False
+        
+        # How the SVG file is written on export
+        # "svgwrite" creates the whole document in memory then saves
+        # "streaming" writes each element to the file as it is created (less memory for large buildings)
+        # Walls are only converted to SVG in separate processes (see update_processes) with "streaming"
+        self.svg_writer = "svgwrite"
+        
+        # Reorder cuts and etches on export to reduce travel of the laser head
+        # Slower to export, but may reduce the time to cut
+        self.optimize_travel = False
+        
+        # Size of material sheet in mm (eg. bed of laser cutter)
+        # Walls are placed on as many sheets as required with one SVG file for each sheet
+        self.sheet_size = (600, 600)
+        # Allow walls to be rotated by 90 degrees to fit better on the sheets
+        self.nest_rotate = True
+        
+        # Number of processes used to regenerate walls (eg. when loading a file)
+        # 0 = one for each cpu, 1 = don't use separate processes
+        self.update_processes = 0
+        
+        # Directory for the cache of generated walls (see buildingcache.py)
+        # Reopening a building that has not changed then does not need to create the textures
+        # Set to None to not use a cache
+        self.cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "lc-building")
+        
         # Views must be one of these or default to front
         self.allowed_views = ["front", "right", "rear", "left", "top", "bottom"]
\ No newline at end of file
@@ -1,193 +1,136 @@
-# LC make takes an existing building and generates the image files
-import svgwrite
-from laser import *
-from wall import *
-from buildingdata import *
-from scale import *
-from svgout import *
-from buildingtemplate import *
-from featuretemplate import *
-from interlocking import *
+# LC make - command line version which exports buildings as SVG files
+# Does not use the GUI (PySide6 is not required) so can be used for batch processing
+# eg. to export all the buildings
+#     python3 lcmake.py buildings/*.json --output output
+# Files are exported using a pool of processes with one building per process
+# If a building needs more than one sheet then one file is created for each sheet
+# For all options see
+#     python3 lcmake.py --help
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from buildingdata import BuildingData
 from lcconfig import LCConfig
-
-
-config = LCConfig()
-
-
-filename = "output/g-weigh_bridge-1.svg"
-
-#building_template = BuildingTemplate()
-#building_template.load_template("templates/building_shed_apex_1.json")
-
-#building_datafile = "buildings/shed_1.json"
-building_datafile = "buildings/weigh_bridge_1.json"
-# Example datafile for test purposes 
-#building_datafile = "buildings/test_1.json"
-
-building = BuildingData()
-building.load_file(building_datafile)
-# Copy all date from template into building data
-
-# If using a template then use the following
-# building.set_all_data(building_template.get_data())
-
-# Get the parameters and settings
-bdata = building.get_values()
-# Where parameters apply globally use directly in this code
-# Otherwise pass to appropriate classes
-
-# Feature positions are top left
-# Note y=0 is top of roof height 
-
-# If set to percent then gives percentage complete as generate each wall
-#(note does not take into consideration that some have textures and some don't)
-progress = "percent"
-
-
-
-
-#scale = "OO"
-scale = "G"
-
-
-# Export in grid 3 wide
-grid_width = 3
-# Start position
-offset = [0, 0]
-# spacing is distance beteen objects (eg. walls) when exported to SVG
-spacing = 50
-num_objects = 0
-current_height = 0 # Only need for height to track which piece needs most space
-
-# Eg. size of a small laser cutter / 3D printer
-doc_size_mm = (600, 600)
-
-sc = Scale(scale)
-
-# Pass scale instance to laser class
-Laser.sc = sc
-# Use scale to apply reverse scale to actual material_thickness
-material_thickness = bdata["material_thickness"]
-scale_material = sc.reverse_scale_convert(material_thickness)
-# Set material thickness for Interlocking (class variable)
-Interlocking.material_thickness = scale_material
-# Set default etchline width
-EtchLine.global_etch_width = config.etch_line_width
-
-Wall.settings["outertype"] = bdata["outertype"]
-
-# Convert configuration into SVG settings for output
-svgsettings = {}
-
-svgsettings['docsize'] = sc.mms_to_pixels(doc_size_mm)
-svgsettings["strokewidth"] = config.stroke_width
-svgsettings["cutstroke"] = svgwrite.rgb(*config.cut_stroke)
-
-# Convert config colors into svgwrite values
-etch_strokes = []
-for stroke_color in config.etch_strokes:
-    etch_strokes.append(svgwrite.rgb(*stroke_color))
-
-svgsettings["etchstrokes"] = etch_strokes
-svgsettings["etchfill"] = config.etch_fill
-svgsettings["etchaspolygon"] = config.etch_as_polygon
-svg = SVGOut(filename, svgsettings)
-
-walls = []
-for wall in building.get_walls():
-    # Convert from string values to values from bdata
-    walls.append(Wall(wall[0], wall[1], wall[2]))
-    
-# Add roofs (loads differently but afterwards is handled as a wall)
-for roof in building.get_roofs():
-    walls.append(Wall(roof[0], roof[1], roof[2]))
-
-for texture in building.get_textures():
-    # If not area then default to entire wall
-    area = []
-    if 'area' in texture:
-        area = texture['area']
-    walls[texture["wall"]].add_texture(texture["type"], area, texture["settings"] )
-    
-for feature in building.get_features():
-    # Features takes a polygon, but may be represented as more basic rectangle.
-    pos = feature["parameters"]["pos"]
-    polygon = []
-    # If no points provided then convert rectangle into a polygon
-    if ("exclude" in feature["parameters"].keys()):
-        # For each point then make relative to the pos
-        for this_point in feature["parameters"]["exclude"]:
-            polygon.append((this_point[0], this_point[1]))
+from scale import Scale
+
+
+# Export a single building - runs in a separate process
+# Returns (filename, success, message, time in seconds)
+# Any errors (eg. an invalid or old format file) are returned as the message so that
+# the other files are still exported
+def export_building (filename, output_filename, options):
+    start = time.perf_counter()
+    try:
+        building = BuildingData(LCConfig())
+        result = building.load_file(filename)
+        if result[0] == True:
+            result = building.export_file(output_filename, building.get_export_data(), options=options)
+    except Exception as err:
+        result = (False, "error processing building - " + get_error_message(err))
+    return (filename, result[0], str(result[1]), time.perf_counter() - start)
+
+# Error as a message including the type of error (as the message alone may not make sense)
+def get_error_message (err):
+    return f"{type(err).__name__}: {err}"
+
+# Expand any glob patterns (eg. if not expanded by the shell)
+# Returns list of files in the same order with duplicates removed
+def get_filenames (patterns):
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        # If no match then keep so that it is reported as an error
+        if matches == []:
+            matches = [pattern]
+        for filename in matches:
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+# Output filenames for the building files (eg. buildings/shed_1.json = output/shed_1.svg)
+# If more than one file has the same name (eg. from different directories) then the directory
+# is added to the name (eg. examples/shed_1.json = output/examples_shed_1.svg)
+def get_output_filenames (filenames, output_dir):
+    bases = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+    output_filenames = []
+    for filename, base in zip(filenames, bases):
+        if bases.count(base) > 1:
+            directory = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+            base = directory + "_" + base
+        output_filenames.append(os.path.join(output_dir, base + ".svg"))
+    return output_filenames
+
+def get_arguments (arguments=None):
+    config = LCConfig()
+    parser = argparse.ArgumentParser(description="Export buildings as SVG files for laser cutting")
+    parser.add_argument("files", nargs="+", help="building files (can include wildcards eg. buildings/*.json)")
+    parser.add_argument("-o", "--output", default="output", help="directory for the SVG files (default output)")
+    parser.add_argument("-s", "--scale", default="O", choices=Scale.scales.keys(), help="model scale (default O)")
+    parser.add_argument("-t", "--thickness", type=float, default=config.wall_width, help=f"material thickness in mm (default {config.wall_width})")
+    parser.add_argument("--outertype", default="etches", choices=["etches", "cuts"], help="how outer parts of features are shown (default etches)")
+    parser.add_argument("--no-interlocking", action="store_true", help="do not add interlocking to the walls")
+    parser.add_argument("--streaming", action="store_true", help="write SVG files using the streaming writer (uses less memory)")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or save the cache of generated walls")
+    parser.add_argument("-j", "--processes", type=int, default=0, help="number of files to export at the same time (default one per cpu)")
+    return parser.parse_args(arguments)
+
+def main (arguments=None):
+    args = get_arguments(arguments)
+    filenames = get_filenames(args.files)
+    output_filenames = get_output_filenames(filenames, args.output)
+    os.makedirs(args.output, exist_ok=True)
+
+    options = {
+        "scale": args.scale,
+        "material_thickness": args.thickness,
+        "outertype": args.outertype,
+        "interlocking": not args.no_interlocking,
+        # Each building is already in a separate process
+        "processes": 1
+        }
+    if args.streaming:
+        options["svg_writer"] = "streaming"
+    if args.no_cache:
+        options["cache"] = False
+
+    processes = args.processes
+    if processes < 1:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(filenames))
+
+    start = time.perf_counter()
+    results = []
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(export_building, filename, output_filename, options) for filename, output_filename in zip(filenames, output_filenames)]
+            for filename, future in zip(filenames, futures):
+                # Errors from the process (eg. if it stopped) are reported for that file only
+                try:
+                    results.append(future.result())
+                except Exception as err:
+                    results.append((filename, False, get_error_message(err), 0))
     else:
-        width = feature["parameters"]["width"]
-        height = feature["parameters"]["height"]
-        polygon = rect_to_polygon((0,0), width, height)
-        
-    walls[feature["wall"]].add_feature(feature["type"], feature["template"], pos, polygon,
-                                       feature["cuts"], feature["etches"], feature["outers"])
-    
-# if setting is ignore interlocking then ignore any entries (wall will have il=[])
-if bdata['interlocking'].lower() == "true":
-    # otherwise add
-    for il in building.get_interlocking():
-        # Add both primary and secondary for each entry
-        # parameters are optional (defines start and end positions of interlocking section)
-        # These are the optional parameters which are appended
-        parameter_keys = ["start", "end"]
-        # if tags exist then use that if not then don't include
-        parameters = {}
-        for this_key in parameter_keys:
-            if this_key in il.keys():
-                parameters[this_key] = il[this_key]
-        reverse = ""
-        if len(il["primary"]) > 2:
-            reverse = il["primary"][2]
-        # il_type has default but can add others in future
-        il_type = "default"
-        if "type" in il:
-            il_type = il["type"]
-        walls[il["primary"][0]].add_interlocking(il["step"], il["primary"][1], "primary", reverse, il_type, parameters)
-        reverse = ""
-        if len(il["secondary"]) > 2:
-            reverse = il["secondary"][2]
-        walls[il["secondary"][0]].add_interlocking(il["step"], il["secondary"][1], "secondary", reverse, il_type, parameters)
-    
-    
-   
-# Create output
-# Track wall number for simple progress chart
-num_walls = len(walls)
-wall_num = 0
-for wall in walls:
-    # Is this modulo grid_width if so then start next line
-    # Will match on first one - which will add spacing
-    if num_objects % grid_width == 0:
-        # Reset x and extend y
-        offset [0] = spacing
-        offset [1] = offset[1] + current_height + spacing
-        svg.set_offset(offset)
-    num_objects += 1
-    # At end of adding each shape we extend the x position (but not the y)
-    # Get overall dimensions for positioning
-    num_objectsect_size = sc.convert(wall.get_maxsize())
-        
-    # get the cuts
-    for cut in wall.get_cuts(True, True):
-        svg.add_cut(cut)
-            
-    # Get the etching
-    etches = wall.get_etches()
-    if etches != None:
-        for etch in etches:
-            svg.add_etch(etch)
-                
-    # Add offset for the end - do this even if this is last on column as it will be reset when next line
-    offset[0] = offset[0] + spacing  + num_objectsect_size[0]
-    svg.set_offset(offset)
-    if num_objectsect_size[1] > current_height :
-        current_height = num_objectsect_size[1]
-    wall_num += 1
-    if (progress == "percent"):
-        print (f"{round((wall_num/num_walls) * 100)} % complete")
-            
-svg.save()
+        for filename, output_filename in zip(filenames, output_filenames):
+            results.append(export_building(filename, output_filename, options))
+    total_time = time.perf_counter() - start
+
+    # Summary of each file
+    print ()
+    num_failed = 0
+    for filename, success, message, file_time in results:
+        if success:
+            print (f"{file_time:8.2f}s  {filename}")
+        else:
+            num_failed += 1
+            print (f"{file_time:8.2f}s  unable to export {filename}: {message}")
+    print (f"Exported {len(results) - num_failed} of {len(results)} buildings in {total_time:.2f}s")
+    if num_failed > 0:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
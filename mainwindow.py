@@ -7,6 +7,7 @@ from vgraphicsscene import ViewGraphicsScene
 import webbrowser
 import copy
 from builder import Builder
+from wallupdate import WallUpdater
 from viewscene import ViewScene
 from editscene import EditScene
 from lcconfig import LCConfig
@@ -20,6 +21,7 @@ from history import History
 from scale import Scale
 from laser import Laser
 from interlocking import Interlocking
+import instrument
 
 loader = QUiLoader()
 basedir = os.path.dirname(__file__)
@@ -90,6 +92,8 @@ class MainWindowUI(QMainWindow):
         self.gconfig = GConfig(status)
         if self.gconfig.debug > 0:
             print ("Debug - Create Main Window")
+        if self.gconfig.debug > 1:
+            instrument.enable(self.gconfig.profile_file)
         self.builder = Builder(self.config, self.threadpool, self)
         
         # Set default screensize (even if going to maximise afterwards)
@@ -145,6 +149,8 @@ class MainWindowUI(QMainWindow):
         self.ui.actionSave_as.triggered.connect(self.save_as_dialog)
         self.ui.actionExport.triggered.connect(self.export_dialog)
         self.ui.actionExit.triggered.connect(self.quit_app)
+        # Stop the wall update processes when the application exits (however it is closed)
+        QCoreApplication.instance().aboutToQuit.connect(WallUpdater.shutdown)
         #self.ui.actionExit.triggered.connect(self.closeEvent)
         
         # Edit Menu
@@ -812,8 +818,12 @@ class MainWindowUI(QMainWindow):
             
         
     # Updates each of the views by updating the scene
+    # Scenes that are not shown are only marked as stale and then updated when shown (change_scene)
     def update_view (self, view_name):
         #print (f"Updating scene {view_name}")
+        if view_name != self.current_scene:
+            self.view_scenes[view_name].mark_stale()
+            return
         self.view_scenes[view_name].update()
         # Show the main screen
         self.ui.graphicsView.show()
@@ -0,0 +1,145 @@
+# Nesting - packs parts (eg. walls) onto sheets of material
+# Uses maxrects bin packing on the bounding box of each part
+# Parts can optionally be rotated by 90 degrees if that gives a better fit
+# Sizes can be any units (export uses pixels) but must be consistent
+import os
+
+# Position of a part on a sheet
+# size is the size of the part on the sheet (ie. width and height swapped if rotated)
+class Placement():
+    def __init__ (self, part, position, size, rotated=False):
+        self.part = part
+        self.position = position
+        self.size = size
+        self.rotated = rotated
+
+    def __str__(self):
+        return f'Part {self.part} at {self.position} size {self.size} rotated {self.rotated}'
+
+
+# A single sheet using maxrects
+# free_rects is a list of (x, y, width, height) which may overlap
+class Sheet():
+    def __init__ (self, size):
+        self.size = size
+        self.free_rects = [(0, 0, size[0], size[1])]
+        self.placements = []
+
+    # Returns best position as (score, x, y, rotated) or None if it does not fit
+    # Uses best short side fit (smallest space left on the shortest side)
+    def find_position (self, width, height, allow_rotate=True):
+        best = None
+        sizes = [(width, height, False)]
+        if allow_rotate and width != height:
+            sizes.append((height, width, True))
+        for free_x, free_y, free_width, free_height in self.free_rects:
+            for this_width, this_height, rotated in sizes:
+                if this_width > free_width or this_height > free_height:
+                    continue
+                score = (min(free_width - this_width, free_height - this_height),
+                         max(free_width - this_width, free_height - this_height))
+                if best == None or score < best[0]:
+                    best = (score, free_x, free_y, rotated)
+        return best
+
+    # Place a rectangle and update the free rectangles
+    def place (self, part, x, y, width, height, rotated=False):
+        self.placements.append(Placement(part, (x, y), (width, height), rotated))
+        new_free = []
+        for free_rect in self.free_rects:
+            new_free.extend(self._split_free(free_rect, (x, y, width, height)))
+        # Remove any that are inside another free rectangle
+        self.free_rects = []
+        for i, rect in enumerate(new_free):
+            contained = False
+            for j, other in enumerate(new_free):
+                if i != j and _rect_contains(other, rect) and (rect != other or j < i):
+                    contained = True
+                    break
+            if not contained:
+                self.free_rects.append(rect)
+
+    # Split a free rectangle around a used rectangle
+    # Returns the parts of the free rectangle that are still free
+    def _split_free (self, free_rect, used):
+        free_x, free_y, free_width, free_height = free_rect
+        used_x, used_y, used_width, used_height = used
+        # No overlap
+        if (used_x >= free_x + free_width or used_x + used_width <= free_x or
+            used_y >= free_y + free_height or used_y + used_height <= free_y):
+            return [free_rect]
+        new_rects = []
+        # Left
+        if used_x > free_x:
+            new_rects.append((free_x, free_y, used_x - free_x, free_height))
+        # Right
+        if used_x + used_width < free_x + free_width:
+            new_rects.append((used_x + used_width, free_y, free_x + free_width - (used_x + used_width), free_height))
+        # Above
+        if used_y > free_y:
+            new_rects.append((free_x, free_y, free_width, used_y - free_y))
+        # Below
+        if used_y + used_height < free_y + free_height:
+            new_rects.append((free_x, used_y + used_height, free_width, free_y + free_height - (used_y + used_height)))
+        return new_rects
+
+    # Proportion of the sheet used by parts_area (eg. actual area of the parts placed)
+    def get_utilization (self, parts_area):
+        return parts_area / (self.size[0] * self.size[1])
+
+
+# Packs parts (list of (width, height)) onto as many sheets as required
+# spacing is added around each part (and the edge of the sheet)
+# Parts larger than a sheet are placed on a sheet on their own
+# Returns list of sheets, positions are the top left of the part (not including spacing)
+def nest_parts (sizes, sheet_size, spacing=0, allow_rotate=True):
+    sheets = []
+    # Largest parts first
+    order = sorted(range(0, len(sizes)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+    # Spacing is added to the right and bottom of each part with the sheet reduced by spacing at top and left
+    pack_size = (sheet_size[0] - spacing, sheet_size[1] - spacing)
+    for part in order:
+        width = sizes[part][0] + spacing
+        height = sizes[part][1] + spacing
+        best = None
+        for sheet in sheets:
+            position = sheet.find_position(width, height, allow_rotate)
+            if position != None:
+                best = (sheet, position)
+                break
+        if best == None:
+            sheet = Sheet(pack_size)
+            sheets.append(sheet)
+            position = sheet.find_position(width, height, allow_rotate)
+            # Too big for sheet - place on the sheet on its own
+            if position == None:
+                position = ((0, 0), 0, 0, False)
+                sheet.free_rects = []
+            best = (sheet, position)
+        sheet, (score, x, y, rotated) = best
+        if rotated:
+            width, height = height, width
+        sheet.place(part, x, y, width, height, rotated)
+    # Convert back to positions on the full sheet without spacing
+    for sheet in sheets:
+        sheet.size = sheet_size
+        for placement in sheet.placements:
+            placement.position = (placement.position[0] + spacing, placement.position[1] + spacing)
+            placement.size = (placement.size[0] - spacing, placement.size[1] - spacing)
+    return sheets
+
+
+# Returns True if rect is inside other
+def _rect_contains (other, rect):
+    return (rect[0] >= other[0] and rect[1] >= other[1] and
+            rect[0] + rect[2] <= other[0] + other[2] and
+            rect[1] + rect[3] <= other[1] + other[3])
+
+
+# Filename for each sheet when exporting
+# If only one sheet then filename is used, otherwise sheet number is added (eg. house_1.svg)
+def get_sheet_filename (filename, sheet_num, num_sheets):
+    if num_sheets <= 1:
+        return filename
+    base, extension = os.path.splitext(filename)
+    return f"{base}_{sheet_num+1}{extension}"
@@ -4,16 +4,21 @@
 
 # Uses laser module and all classes (eg. cuts)
 from laser import *
-from PySide6.QtCore import QPoint, QPointF
-from PySide6.QtGui import QPolygonF, QPen, QBrush, QColor
+import numpy as np
+from PySide6.QtCore import Qt, QPoint, QPointF
+from PySide6.QtGui import QPolygonF, QPen, QBrush, QColor, QPainterPath
 from PySide6.QtWidgets import QGraphicsItem
 from objgroup import ObjGroup
+from textureitem import TextureItem
 
 # Settings is from gconfig
 # Each objectview is a wall (or similar)
 # type is optional can be used to distinguish between objects
 # eg. so can re-render the texture without effecting other objects
 # Create as an object group and move items into it
+# Objects that use the same pen are combined into a single path item, call finish
+# after adding all the objects to add the items to the group
+# Textures are added to a TextureItem which draws a pixmap instead of the lines when zoomed out
 class ObjView():
     def __init__ (self, scene, settings, coords = (0,0), type="unknown", moveable=True):
         #print ("Adding objview to scene {scene}")
@@ -45,7 +50,19 @@ class ObjView():
         self.y_min = 0
         self.x_max = 0
         self.y_max = 0
+        # Paths for each (pen, strength) which are added to the group by finish - (path, pen, brush)
+        self.paths = {}
+        # Values the items were drawn with (eg. wall version) used by ViewScene to
+        # check whether this needs to be redrawn
+        self.draw_key = None
+        # Index of the bounding rectangles (RectIndex) which is updated when this moves
+        self.index = None
 
+    # Remove the group and all the items in it from the scene
+    def remove (self):
+        self.scene.removeItem(self.item_group)
+        if self.index != None:
+            self.index.remove(self)
 
     ### Todo - possibly error in this as it's not recalcualted if the object moves????
     # return minx, miny, maxx, maxy
@@ -73,12 +90,18 @@ class ObjView():
         new_pos = [new_pos_point.x(), new_pos_point.y()]
         if new_pos != self.pos:
             self.pos = new_pos
+            self._update_index()
             return True
         return False
         
     def set_pos(self, pos):
         self.pos = pos
         self.item_group.setPos(QPoint(*pos))
+        self._update_index()
+
+    def _update_index(self):
+        if self.index != None:
+            self.index.set(self, self.get_bounding())
         
     def get_pos(self):
         # Perhaps regenerate at this point??
@@ -119,23 +142,12 @@ class ObjView():
     # Generic version of add_cut, add_edge, add_outer
     # Pen is the pen type to use "cut", "outer", "etch"
     # If etch is used then optional parameter strength chooses appropriate etch strength
+    # Objects are added to the path for the pen, the items are created by finish
     def add_standard_object (self, object, pen, strength=5):
-        # Default is no fill - only applied to polygon
-        brush_obj = QBrush()
-        # Get pen from gconfig
-        if pen == "outer":
-            pen_obj = self.settings.pen_outer
-            # Special case is etch which also looks at strength
-        elif pen == "etch":
-            pen_obj = self.settings.pen_etch[strength]
-            # Default is a cut
-        elif pen == "exclude":
-            # Not from settings - this is fill for background of features
-            # Set to white
-            pen_obj = QPen(QColor(255,255,255))
-            brush_obj = QBrush(QColor(255,255,255))
-        else:
-            pen_obj = self.settings.pen_cut
+        if (object.get_type() == "line_batch"):
+            self._add_line_batch(object, pen)
+            return
+        path = self._get_path(pen, strength)
         if (object.get_type() == "line"):
             # get as pixels with offset added
             start_line = object.get_start_pixels_screen(self.offset)
@@ -145,11 +157,12 @@ class ObjView():
             self._upd_y_size(start_line[1])
             self._upd_y_size(end_line[1])
             #print (f"     Start line {start_line},  End line {end_line}")
-            this_object = self.scene.addLine(*start_line, *end_line, pen_obj) 
+            path.moveTo(*start_line)
+            path.lineTo(*end_line)
         elif (object.get_type() == "rect"):
             start_rect = object.get_start_pixels_screen(self.offset)
             rect_size = object.get_size_pixels_screen()
-            this_object = self.scene.addRect(*start_rect, *rect_size, pen_obj)
+            path.addRect(*start_rect, *rect_size)
             self._upd_x_size(start_rect[0])
             self._upd_x_size(start_rect[0]+rect_size[0])
             self._upd_y_size(start_rect[1])
@@ -157,12 +170,8 @@ class ObjView():
             #print (f"Rect points {start_rect} size {rect_size}")
         elif (object.get_type() == "polygon"):
             new_points = object.get_points_pixels_screen(self.offset)
-            polygon = QPolygonF()
-            for point in new_points:
-                polygon.append(QPointF(*point))
-            this_object = self.scene.addPolygon(polygon, pen_obj, brush_obj) 
+            self._add_polygon(path, new_points)
             #print (f"Polygon points {polygon}")
-        self.item_group.addToGroup(this_object)
         #print ("Standard object added {self.pos}")
 
         
@@ -170,21 +179,132 @@ class ObjView():
     # Otherwise treat as any other object - but include strength
     # May need to change to a special gconfig setting in future
     def add_etch(self, etch):
+        # Batch has strength for each line
+        if (etch.get_type() == "line_batch"):
+            if self.settings.view_etch_as_polygon == True:
+                self._add_polygon_batch(etch)
+            else:
+                self._add_line_batch(etch, "etch")
+            return
         # Get strength from the etch object
         strength = etch.get_strength()
-        pen_obj = self.settings.pen_etch[strength]
         # Special case for line etch as software tools not allow, plus need to add width
         if (etch.get_type() == "line" and self.settings.view_etch_as_polygon == True):
             # Check if etch_as_polygon set (in which case get polygon instead of line)
             # Really intended for actual output (eg. because laser cutter requires polygon)
             # May want to have different setting / pen size for display to screen
             new_points = etch.get_polygon_pixels_screen(self.offset)
-            polygon = QPolygonF()
-            for point in new_points:
-                polygon.append(QPointF(*point))
-            this_etch = self.scene.addPolygon(polygon, pen_obj) 
-            self.item_group.addToGroup(this_etch)
+            self._add_polygon(self._get_path("etch", strength), new_points)
+        else:
+            self.add_standard_object (etch, "etch", strength)
+
+    # Texture etches (eg. from wall.get_texture_etches) are drawn using a TextureItem
+    # which uses less detail when zoomed out, otherwise the same as add_etch
+    def add_texture(self, etch):
+        if (etch.get_type() == "line_batch"):
+            if self.settings.view_etch_as_polygon == True:
+                self._add_polygon_batch(etch, "texture")
+            else:
+                self._add_line_batch(etch, "texture")
+        elif (etch.get_type() == "line" and self.settings.view_etch_as_polygon == True):
+            new_points = etch.get_polygon_pixels_screen(self.offset)
+            self._add_polygon(self._get_path("texture", etch.get_strength()), new_points)
         else:
-            self.add_standard_object (etch, "etch", strength) 
+            self.add_standard_object (etch, "texture", etch.get_strength())
 
+    # Objects that use the same pen are drawn as a single path rather than an item for each
+    # object which is much quicker to create and draw (eg. a texture with thousands of lines)
+    # Returns the path for the pen (created if this is the first object to use it)
+    # Paths are in the order they are first used which is the order they are drawn in
+    def _get_path (self, pen, strength=5):
+        # Only etches and textures have a path for each strength
+        if pen != "etch" and pen != "texture":
+            strength = 5
+        key = (pen, strength)
+        if key not in self.paths:
+            # Default is no fill - only applied to polygon
+            brush_obj = QBrush()
+            # Get pen from gconfig
+            if pen == "outer":
+                pen_obj = self.settings.pen_outer
+                # Special case is etch which also looks at strength
+            elif pen == "etch" or pen == "texture":
+                pen_obj = self.settings.pen_etch[strength]
+                # Default is a cut
+            elif pen == "exclude":
+                # Not from settings - this is fill for background of features
+                # Set to white
+                pen_obj = QPen(QColor(255,255,255))
+                brush_obj = QBrush(QColor(255,255,255))
+            else:
+                pen_obj = self.settings.pen_cut
+            path = QPainterPath()
+            # Fill all of any overlapping polygons
+            path.setFillRule(Qt.WindingFill)
+            self.paths[key] = (path, pen_obj, brush_obj)
+        return self.paths[key][0]
+
+    # Add closed polygon to the path
+    def _add_polygon (self, path, points):
+        polygon = QPolygonF()
+        for point in points:
+            polygon.append(QPointF(*point))
+        path.addPolygon(polygon)
+        path.closeSubpath()
+
+    # Creates a graphics item for each of the paths and adds it to the group
+    # All the texture paths are in a single TextureItem which is drawn where the first one was added
+    # Must be called after all the objects have been added
+    def finish (self):
+        texture_paths = [(path, pen_obj) for (pen, strength), (path, pen_obj, brush_obj) in self.paths.items() if pen == "texture"]
+        for (pen, strength), (path, pen_obj, brush_obj) in self.paths.items():
+            if pen != "texture":
+                this_object = self.scene.addPath(path, pen_obj, brush_obj)
+            elif texture_paths != []:
+                this_object = TextureItem(texture_paths, self.get_texture_lod_threshold())
+                self.scene.addItem(this_object)
+                texture_paths = []
+            else:
+                continue
+            self.item_group.addToGroup(this_object)
+        self.paths = {}
+
+    # Level of detail (zoom) below which textures are drawn as a pixmap
+    # Setting is screen pixels per mm of the building
+    def get_texture_lod_threshold (self):
+        return self.settings.texture_detail_pixels_per_mm / Laser.vs.get_factor()
+
+    # Batch of lines (eg. texture) - pixels are calculated for all lines together
+    # Etches use the strength of each line, otherwise all use pen
+    def _add_line_batch (self, batch, pen):
+        if len(batch) == 0:
+            return
+        starts = batch.get_starts_pixels_screen(self.offset)
+        ends = batch.get_ends_pixels_screen(self.offset)
+        all_points = np.concatenate((starts, ends))
+        self._upd_x_size(all_points[:, 0].min().item())
+        self._upd_x_size(all_points[:, 0].max().item())
+        self._upd_y_size(all_points[:, 1].min().item())
+        self._upd_y_size(all_points[:, 1].max().item())
+        lines = np.concatenate((starts, ends), axis=1)
+        for strength, strength_lines in self._split_strengths(batch, pen, lines):
+            path = self._get_path(pen, strength)
+            for x1, y1, x2, y2 in strength_lines.tolist():
+                path.moveTo(x1, y1)
+                path.lineTo(x2, y2)
+            
+    # Batch of etch lines shown as polygons
+    def _add_polygon_batch (self, batch, pen="etch"):
+        polygons = batch.get_polygons_pixels_screen(self.offset)
+        for strength, strength_polygons in self._split_strengths(batch, pen, polygons):
+            path = self._get_path(pen, strength)
+            for new_points in strength_polygons.tolist():
+                self._add_polygon(path, new_points)
 
+    # Splits values (one row per line in batch) into a list of (strength, values) for each strength
+    # Only etches (and textures) use the strength, so anything else is a single entry
+    def _split_strengths (self, batch, pen, values):
+        if pen != "etch" and pen != "texture":
+            return [(5, values)]
+        strengths = batch.strengths
+        return [(strength, values[strengths == strength]) for strength in np.unique(strengths).tolist()]
@@ -1,6 +1,7 @@
 # Handles conversion between mm and scale size
 # Has limited scale sizes (set using constructor)
 import sys
+import numpy as np
 
 class Scale():
     
@@ -24,6 +25,7 @@ class Scale():
     def __init__ (self, scale='OO'):
         if (scale in self.scales):
             self.scale = scale
+            self._update_factor()
         else:
             # If try and choose a scale that doesn't exist then cannot continue
             # Alternative is to leave to default and try and change later
@@ -36,10 +38,19 @@ class Scale():
     def set_scale (self, scale):
         if  (scale in self.scales.keys()):
             self.scale = scale
+            self._update_factor()
             return self.scale
         else:
             return None
     
+    # Full conversion from mm to pixels (scale_convert and mm_to_pixel) as a single factor
+    # Precalculated whenever the scale is changed
+    def _update_factor(self):
+        self.factor = self.mm_to_pixel_factor / self.scales[self.scale]
+        
+    def get_factor(self):
+        return self.factor
+    
     # Return list of supported scales
     def get_scales(self):
         return self.scales.keys()
@@ -90,6 +101,24 @@ class Scale():
             return_list.append(pixel_value)
         return return_list
     
+    # Convert single point (x, y) from mm to pixels and add offset (pixels)
+    # Faster than convert_many for individual points
+    def convert_point(self, mm_point, offset=(0,0)):
+        return [mm_point[0] * self.factor + offset[0], mm_point[1] * self.factor + offset[1]]
     
+    # Convert many values from mm to pixels in one operation
+    # mm_values can be an array of points shape (n, 2) or a flat buffer
+    # If offset (pixels) is provided then values are treated as x, y pairs
+    # Returns a numpy array with the same shape
+    def convert_many(self, mm_values, offset=None):
+        values = np.asarray(mm_values, dtype=float)
+        if offset is None:
+            return values * self.factor
+        return (values.reshape(-1, 2) * self.factor + offset).reshape(values.shape)
     
-        
\ No newline at end of file
+    # Opposite of convert_many - pixels (with offset removed) to mm
+    def reverse_convert_many(self, pixel_values, offset=None):
+        values = np.asarray(pixel_values, dtype=float)
+        if offset is None:
+            return values / self.factor
+        return ((values.reshape(-1, 2) - offset) / self.factor).reshape(values.shape)
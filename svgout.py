@@ -1,5 +1,9 @@
+import io
+import os
 import svgwrite
+import numpy as np
 from laser import *
+import instrument
 
 # Settings is a dict of different settings
 class SVGOut():
@@ -8,25 +12,48 @@ class SVGOut():
         self.filename = filename
         self.offset = [0, 0]
         self.dwg = svgwrite.Drawing(filename, profile='tiny', size=(str(settings["docsize"][0]),str(settings["docsize"][1])))
+        # Elements are added to the container which is the drawing unless in a group
+        self.container = self.dwg
         
     def set_offset(self, offset):
         self.offset = offset
+        
+    # Elements added after this are in a group with an SVG transform (eg. to rotate)
+    def start_group(self, transform):
+        self.container = self.dwg.g(transform=transform)
+        self.dwg.add(self.container)
+        
+    def end_group(self):
+        self.container = self.dwg
     
     def add_cut(self, cut):
-        if (cut.get_type() == "line"):
+        if (cut.get_type() == "line_batch"):
+            self._add_cut_batch(cut)
+        elif (cut.get_type() == "line"):
             # get as pixels with offset added
             start_line = cut.get_start_pixels(self.offset)
             end_line = cut.get_end_pixels(self.offset)
-            self.dwg.add(self.dwg.line(start_line, end_line, stroke=self.settings['cutstroke'], stroke_width=self.settings['strokewidth']))
+            self.container.add(self.dwg.line(start_line, end_line, stroke=self.settings['cutstroke'], stroke_width=self.settings['strokewidth']))
         elif (cut.get_type() == "rect"):
             start_rect = cut.get_start_pixels(self.offset)
             rect_size = cut.get_size_pixels()
-            self.dwg.add(self.dwg.rect(start_rect, rect_size, stroke=self.settings['cutstroke'], fill="none", stroke_width=self.settings['strokewidth']))
+            self.container.add(self.dwg.rect(start_rect, rect_size, stroke=self.settings['cutstroke'], fill="none", stroke_width=self.settings['strokewidth']))
         elif (cut.get_type() == "polygon"):
             new_points = cut.get_points_pixels(self.offset)
-            self.dwg.add(self.dwg.polygon(new_points, stroke=self.settings['cutstroke'], fill="none", stroke_width=self.settings['strokewidth']))
+            self.container.add(self.dwg.polygon(new_points, stroke=self.settings['cutstroke'], fill="none", stroke_width=self.settings['strokewidth']))
+        
+    # Batch of lines - pixel values for all lines are calculated together
+    def _add_cut_batch(self, batch):
+        starts = batch.get_starts_pixels(self.offset).tolist()
+        ends = batch.get_ends_pixels(self.offset).tolist()
+        for start_line, end_line in zip(starts, ends):
+            self.container.add(self.dwg.line(start_line, end_line, stroke=self.settings['cutstroke'], stroke_width=self.settings['strokewidth']))
         
     def add_etch(self, etch):
+        # Batch has a strength for each line so handle separately
+        if (etch.get_type() == "line_batch"):
+            self._add_etch_batch(etch)
+            return
         # Get strength from the etch object
         strength = etch.get_strength()
         # Special case for line etch as software tools not allow, plus need to add width
@@ -34,20 +61,202 @@ class SVGOut():
             # Check if etch_as_polygon set (in which case get polygon instead of line)
             if self.settings['etchaspolygon'] == True:
                 new_points = etch.get_polygon_pixels(self.offset)
-                self.dwg.add(self.dwg.polygon(new_points, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+                self.container.add(self.dwg.polygon(new_points, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
             # Otherwise treat as line
             else:
                 # start_etch is modified start
                 start_line = etch.get_start_pixels(self.offset)
                 end_line = etch.get_end_pixels(self.offset)
-                self.dwg.add(self.dwg.line(start_line, end_line, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+                self.container.add(self.dwg.line(start_line, end_line, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
         elif (etch.get_type() == "rect"):
             start_rect = etch.get_start_pixels(self.offset)
             rect_size = etch.get_size_pixels()
-            self.dwg.add(self.dwg.rect(start_rect, rect_size, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+            self.container.add(self.dwg.rect(start_rect, rect_size, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
         elif (etch.get_type() == "polygon"):
             new_points = etch.get_points_pixels(self.offset)
-            self.dwg.add(self.dwg.polygon(new_points, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+            self.container.add(self.dwg.polygon(new_points, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+
+    # Batch of lines - same as etch line, but pixel values for all lines are calculated together
+    def _add_etch_batch(self, batch):
+        # If etchaspath then a single path for each strength
+        if "etchaspath" in self.settings and self.settings['etchaspath'] == True:
+            for strength, path_data in _batch_to_paths(batch, self.offset, self.settings['etchaspolygon']):
+                self.container.add(self.dwg.path(d=path_data, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+            return
+        strengths = batch.strengths.tolist()
+        if self.settings['etchaspolygon'] == True:
+            polygons = batch.get_polygons_pixels(self.offset).tolist()
+            for new_points, strength in zip(polygons, strengths):
+                self.container.add(self.dwg.polygon(new_points, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+        else:
+            starts = batch.get_starts_pixels(self.offset).tolist()
+            ends = batch.get_ends_pixels(self.offset).tolist()
+            for start_line, end_line, strength in zip(starts, ends, strengths):
+                self.container.add(self.dwg.line(start_line, end_line, stroke=self.settings['etchstrokes'][strength], fill=self.settings['etchfill'], stroke_width=self.settings['strokewidth']))
+
+    @instrument.timed("svg.save")
+    def save(self):
+        self.dwg.save()
+        
+    # Nothing to close as the file is only written in save
+    def close(self):
+        pass
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Alternative to SVGOut which writes each element to the file as it is added
+# rather than building the svgwrite document in memory and writing in save
+# Same interface as SVGOut - the file is only complete after calling save
+# If not saved (eg. an error while exporting) then close removes the incomplete file,
+# use with (which calls close) or call close in finally
+class StreamingSVGOut():
+    
+    # Size of file buffer in bytes
+    buffer_size = 1024 * 1024
+    
+    def __init__ (self, filename, settings):
+        self.filename = filename
+        self._set_settings(settings)
+        self.file = open(filename, "w", buffering=self.buffer_size)
+        self.file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        self.file.write(f'<svg baseProfile="tiny" height="{settings["docsize"][1]}" version="1.2" width="{settings["docsize"][0]}" '+
+            'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" xmlns:xlink="http://www.w3.org/1999/xlink"><defs />\n')
+        
+    def _set_settings(self, settings):
+        self.settings = settings
+        self.offset = [0, 0]
+        # Attributes are the same for every element with the same stroke so create once
+        self.cut_attribs = f'fill="none" stroke="{settings["cutstroke"]}" stroke-width="{settings["strokewidth"]}"'
+        self.etch_attribs = []
+        for stroke in settings["etchstrokes"]:
+            self.etch_attribs.append(f'fill="{settings["etchfill"]}" stroke="{stroke}" stroke-width="{settings["strokewidth"]}"')
+        
+    def set_offset(self, offset):
+        self.offset = offset
+        
+    # Adds elements which have already been converted to a string (eg. from SVGFragment)
+    def add_fragment(self, fragment):
+        self.file.write(fragment)
+        
+    # Elements added after this are in a group with an SVG transform (eg. to rotate)
+    def start_group(self, transform):
+        self.file.write(f'<g transform="{transform}">\n')
+        
+    def end_group(self):
+        self.file.write('</g>\n')
+        
+    def add_cut(self, cut):
+        if (cut.get_type() == "line_batch"):
+            starts = cut.get_starts_pixels(self.offset).tolist()
+            ends = cut.get_ends_pixels(self.offset).tolist()
+            self.file.write("".join([_line_string(self.cut_attribs, start, end) for start, end in zip(starts, ends)]))
+        elif (cut.get_type() == "line"):
+            self.file.write(_line_string(self.cut_attribs, cut.get_start_pixels(self.offset), cut.get_end_pixels(self.offset)))
+        elif (cut.get_type() == "rect"):
+            self.file.write(_rect_string(self.cut_attribs, cut.get_start_pixels(self.offset), cut.get_size_pixels()))
+        elif (cut.get_type() == "polygon"):
+            self.file.write(_polygon_string(self.cut_attribs, cut.get_points_pixels(self.offset)))
+            
+    def add_etch(self, etch):
+        if (etch.get_type() == "line_batch"):
+            self._add_etch_batch(etch)
+            return
+        attribs = self.etch_attribs[etch.get_strength()]
+        if (etch.get_type() == "line"):
+            if self.settings['etchaspolygon'] == True:
+                self.file.write(_polygon_string(attribs, etch.get_polygon_pixels(self.offset)))
+            else:
+                self.file.write(_line_string(attribs, etch.get_start_pixels(self.offset), etch.get_end_pixels(self.offset)))
+        elif (etch.get_type() == "rect"):
+            self.file.write(_rect_string(attribs, etch.get_start_pixels(self.offset), etch.get_size_pixels()))
+        elif (etch.get_type() == "polygon"):
+            self.file.write(_polygon_string(attribs, etch.get_points_pixels(self.offset)))
+            
+    def _add_etch_batch(self, batch):
+        if "etchaspath" in self.settings and self.settings['etchaspath'] == True:
+            for strength, path_data in _batch_to_paths(batch, self.offset, self.settings['etchaspolygon']):
+                self.file.write('<path %s d="%s" />\n' % (self.etch_attribs[strength], path_data))
+            return
+        attribs = [self.etch_attribs[strength] for strength in batch.strengths.tolist()]
+        if self.settings['etchaspolygon'] == True:
+            polygons = batch.get_polygons_pixels(self.offset).tolist()
+            self.file.write("".join([_polygon_string(attrib, points) for attrib, points in zip(attribs, polygons)]))
+        else:
+            starts = batch.get_starts_pixels(self.offset).tolist()
+            ends = batch.get_ends_pixels(self.offset).tolist()
+            self.file.write("".join([_line_string(attrib, start, end) for attrib, start, end in zip(attribs, starts, ends)]))
+            
+    @instrument.timed("svg.save")
+    def save(self):
+        self.file.write("</svg>\n")
+        self.file.close()
+        
+    # Closes the file if it has not been saved, the file is not a valid SVG so is removed
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        if self.filename != None:
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
+# Part of an SVG document (eg. a single wall) which is stored as a string
+# Allows walls to be converted in separate processes and then added to
+# StreamingSVGOut using add_fragment
+class SVGFragment(StreamingSVGOut):
+    def __init__ (self, settings):
+        self.filename = None
+        self._set_settings(settings)
+        self.file = io.StringIO()
+        
+    def get_fragment(self):
+        return self.file.getvalue()
+    
+    # Nothing to save - use get_fragment instead
     def save(self):
-        self.dwg.save()
\ No newline at end of file
+        pass
+
+
+# Strings for SVG elements used by StreamingSVGOut
+# %g formats to 6 significant figures which is less than 0.01 pixels
+def _line_string(attribs, start, end):
+    return '<line %s x1="%g" y1="%g" x2="%g" y2="%g" />\n' % (attribs, start[0], start[1], end[0], end[1])
+
+def _rect_string(attribs, start, size):
+    return '<rect %s x="%g" y="%g" width="%g" height="%g" />\n' % (attribs, start[0], start[1], size[0], size[1])
+
+def _polygon_string(attribs, points):
+    return '<polygon %s points="%s" />\n' % (attribs, " ".join(["%g,%g" % (point[0], point[1]) for point in points]))
+
+# Converts a batch of etch lines into path data with a subpath for each line
+# Returns list of (strength, path data)
+# Each path is limited to max_subpaths as very long paths are slow for svgwrite to validate
+# If aspolygon is True then each subpath is the polygon around the line
+def _batch_to_paths(batch, offset, aspolygon, max_subpaths=1000):
+    if aspolygon == True:
+        # Last point is the same as the first so use close (Z) instead
+        points = batch.get_polygons_pixels(offset)[:, :4].reshape(-1, 8)
+        subpath = "M%g %gL%g %gL%g %gL%g %gZ"
+    else:
+        points = np.concatenate((batch.get_starts_pixels(offset), batch.get_ends_pixels(offset)), axis=1)
+        subpath = "M%g %gL%g %g"
+    subpaths = {}
+    for strength, values in zip(batch.strengths.tolist(), points.tolist()):
+        subpaths.setdefault(strength, []).append(subpath % tuple(values))
+    paths = []
+    for strength, strength_subpaths in subpaths.items():
+        for i in range(0, len(strength_subpaths), max_subpaths):
+            paths.append((strength, " ".join(strength_subpaths[i:i+max_subpaths])))
+    return paths
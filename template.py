@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 import json
 import re
+from collections import ChainMap
+from expression import evaluate_expression
 
 def is_number(s):
     try:
@@ -90,11 +92,18 @@ class Template (ABC):
             new_string += token_string[current_pos:]
         return new_string
         
-    # Process token and perform eval to return as a number
+    # Values that can be used in tokens
+    # Same order as get_value_str - pre-defined values, defaults then typical
+    def get_values (self):
+        values = [Template.static_values, self.json_data["defaults"]]
+        if "typical" in self.json_data.keys():
+            values.append(self.json_data["typical"])
+        return ChainMap(*values)
+        
+    # Process token and evaluate to return as a number
+    # The expression is only parsed the first time it is used (see expression.py)
     def process_token (self, token_string):
-        new_string = self.process_token_str(token_string)
-        value = eval(new_string)
-        return value
+        return evaluate_expression(token_string, self.get_values())
             
         
     # Returns a copy of the data so it can be edited without changing actual template
@@ -1,4 +1,12 @@
 import unittest
+import os
+import math
+import tempfile
+import json
+import pickle
+from concurrent.futures import Future
+import xml.etree.ElementTree as ET
+import numpy as np
 from wall import *
 from scale import *
 from laser import *
@@ -8,8 +16,15 @@ from featuretemplate import *
 from interlocking import *
 from helpers import *
 from texture import *
+from travel import *
+from nesting import *
+from expression import *
+from buildingcache import BuildingCache
+import lcmake
+import instrument
 from lcconfig import LCConfig
 from builder import Builder
+from wallupdate import WallUpdater
 
 # Test loading of config values
 # Just few example values tested
@@ -37,6 +52,46 @@ class TestWall(unittest.TestCase):
         max_size = test_wall.get_maxsize()
         self.assertEqual(max_size[0], depth)
         self.assertEqual(max_size[1], height)
+
+    # Moving a feature regenerates the features and texture exclusion, not the texture
+    def test_wall_update_dirty(self):
+        test_wall = Wall("Wall test dirty", [(0,0),(1000,0),(1000,1000),(0,1000),(0,0)])
+        test_wall.add_texture("brick", [], {"brick_etch": 10, "brick_height": 65, "brick_width": 215})
+        test_wall.add_feature("window", "test", (100, 100), rect_to_polygon((0,0), 200, 200), [["rect", [[0, 0], [200, 200]]]])
+        self.assertEqual(test_wall.dirty, set())
+        basic_etches = test_wall.get_texture_etches_basic()
+        etches = test_wall.get_texture_etches()
+        test_wall.features[0].move((500, 500))
+        self.assertEqual(test_wall.dirty, {'feature_cuts', 'feature_etches', 'exclude', 'outers'})
+        test_wall.update()
+        self.assertIs(test_wall.get_texture_etches_basic(), basic_etches)
+        self.assertIsNot(test_wall.get_texture_etches(), etches)
+        self.assertEqual(test_wall.dirty, set())
+
+    # Outer cuts are created from the outers, so must move with the feature
+    def test_wall_move_feature_outer_cuts(self):
+        settings = Wall.settings
+        Wall.settings = {"outertype": "cuts"}
+        try:
+            test_wall = Wall("Wall test outer", [(0,0),(1000,0),(1000,1000),(0,1000),(0,0)])
+            test_wall.add_feature("window", "test", (100, 100), rect_to_polygon((0,0), 200, 200), outers=[["line", [[0, 0], [200, 0]]]])
+            outer_cut = test_wall.cut_lines['features'][-1]
+            self.assertEqual(tuple(outer_cut.io), (100, 100))
+            test_wall.features[0].move((500, 500))
+            test_wall.update()
+            outer_cut = test_wall.cut_lines['features'][-1]
+            self.assertEqual(tuple(outer_cut.io), (500, 500))
+        finally:
+            Wall.settings = settings
+
+    # Version only changes when the wall is regenerated (used to redraw changed walls)
+    def test_wall_version(self):
+        test_wall = Wall("Wall test version", [(0,0),(1000,0),(1000,1000),(0,1000),(0,0)])
+        version = test_wall.version
+        test_wall.update()
+        self.assertEqual(test_wall.version, version)
+        test_wall.add_texture("brick", [], {"brick_etch": 10, "brick_height": 65, "brick_width": 215})
+        self.assertGreater(test_wall.version, version)
               
 class TestScale(unittest.TestCase):
 
@@ -87,6 +142,22 @@ class TestScale(unittest.TestCase):
         self.assertEqual(round(scaled_values[0]), 100)
         self.assertEqual(round(scaled_values[1]), 50)
         
+    def test_convert_many(self):
+        sc = Scale('OO')
+        scaled_values = sc.convert_many([[2000, 1000], [1000, 2000]], (10, 20))
+        self.assertEqual(scaled_values.shape, (2, 2))
+        self.assertEqual(round(scaled_values[0][0]), 110)
+        self.assertEqual(round(scaled_values[1][1]), 120)
+        # Flat buffer
+        scaled_values = sc.convert_many([2000, 1000, 1000, 2000])
+        self.assertEqual(round(scaled_values[3]), 100)
+        self.assertAlmostEqual(sc.convert_point((2000, 1000))[0], sc.convert(2000))
+        # Changing scale updates the factor
+        sc.set_scale('N')
+        self.assertEqual(round(sc.convert_many([2000])[0]), 51)
+        mm_values = sc.reverse_convert_many(sc.convert_many([[2000, 1000]], (5, 5)), (5, 5))
+        self.assertAlmostEqual(mm_values[0][1], 1000)
+        
         
 # Based on example template - test loading file etc.
 ## Note based on old template - needs to be updated when template is updated
@@ -146,6 +217,25 @@ class TestTemplate(unittest.TestCase):
         self.assertEqual(output, 207.0)
     
     
+    # Only arithmetic is allowed in tokens
+    def test_token_process_invalid(self):
+        filename = "templates/window_shed_1.json"
+        template = FeatureTemplate()
+        template.load_template (filename)
+        self.assertEqual(template.process_token("-(x - width) % 300"), 100)
+        for test_string in ["__import__('os')", "width.real", "2**1000", "unknown+1", "x +"]:
+            with self.assertRaises(ValueError):
+                template.process_token(test_string)
+                
+    # Expression is only parsed once and can be evaluated with different values
+    def test_expression_cache(self):
+        expression = get_expression("(width - depth) / 2")
+        self.assertIs(get_expression("(width - depth) / 2"), expression)
+        self.assertEqual(expression.names, {"width", "depth"})
+        self.assertEqual(expression.evaluate({"width": 100, "depth": 50}), 25)
+        self.assertEqual(evaluate_expression("(width - depth) / 2", {"width": 300, "depth": 50}), 125)
+    
+    
 # Interlocking is based on lines in clockwise direction
 # Primary go outwards from start to end
 # Secondary to inwards from end to start
@@ -190,6 +280,22 @@ class TestInterlocking(unittest.TestCase):
 
         self.assertEqual(segments, expected_output)
 
+    # Line with more tabs than the recursion limit
+    # Horizontal so uses arrays, same as adding one tab at a time
+    def test_line_long(self):
+        Interlocking.material_thickness = 3
+        il = Interlocking (5, 1, "primary")
+        line = [(0,0), (20000, 0)]
+        segments = il.add_interlock_line (line[0], line[1], line)
+        self.assertEqual(len(segments), 4 * 1999 + 2)
+        self.assertEqual(segments[1:5], [((5, 0), (5, -3)), ((5, -3), (10, -3)), ((10, -3), (10, 0)), ((10, 0), (15, 0))])
+        self.assertEqual(segments[-1], ((19995, 0), (20000, 0)))
+        # Line not on a whole number and diagonal are added one tab at a time
+        self.assertEqual(il._add_tabs_array((0, 0.5), ((0, 0.5), (100, 0.5)), 100)[0], [])
+        diagonal = [(0, 0), (3000, 4000)]
+        segments = il.add_interlock_line (diagonal[0], diagonal[1], diagonal)
+        self.assertEqual(segments[-1][1], (3000, 4000))
+
 # Texture
 class TestTexture(unittest.TestCase):
     
@@ -302,12 +408,134 @@ class TestTexture(unittest.TestCase):
         self.assertEqual (lines[2][1][1], 10)
 
 
+    # Brick texture with staggered rows - 2 rows of bricks
+    def test_brick_rects(self):
+        texture = Texture([(0,0),(200,0),(200,100),(0,100),(0,0)], "brick", {"brick_etch": 10, "brick_height": 40, "brick_width": 50})
+        etches = texture.get_etches()
+        lines = [etch.get_line() for etch in etches]
+        self.assertEqual (len(lines), 7)
+        # First row starts with full brick
+        self.assertEqual (lines[0], [(51, 94), (51, 54)])
+        self.assertEqual (lines[2], [(171, 94), (171, 54)])
+        # Line across top of the first row
+        self.assertEqual (lines[3], [(1, 49), (199, 49)])
+        # Second row starts with half brick
+        self.assertEqual (lines[4], [(26, 44), (26, 4)])
+        self.assertEqual (etches[0].etch_width, 10)
+
+    # Identical textures share the same etch arrays through the cache
+    # Changing the etches from one does not change the cached etches
+    def test_texture_cache(self):
+        Texture.cache.clear()
+        settings = {"brick_etch": 10, "brick_height": 65, "brick_width": 215}
+        points = [(0,0),(1000,0),(1000,1000),(0,1000),(0,0)]
+        etches1 = Texture(points, "brick", settings).get_etches()
+        etches1.set_internal_offset((100, 100))
+        etches2 = Texture(points, "brick", settings).get_etches()
+        self.assertIs(etches1.starts, etches2.starts)
+        self.assertEqual(etches2.io, (0, 0))
+        self.assertFalse(etches2.starts.flags.writeable)
+        # Different settings are generated separately
+        settings["brick_height"] = 60
+        etches3 = Texture(points, "brick", settings).get_etches()
+        self.assertIsNot(etches1, etches3)
+        stats = Texture.cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+
+# Batches should give the same values as the individual laser objects
+class TestLaser(unittest.TestCase):
+    def test_etch_line_batch(self):
+        Laser.sc = Scale("OO")
+        lines = [EtchLine((0, 50), (200, 50), etch_width=5), EtchLine((10, 0), (10, 100), strength=3)]
+        batch = EtchLineBatch.from_etch_lines(lines)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.get_type(), "line_batch")
+        self.assertEqual(batch[1].strength, 3)
+        self.assertEqual(batch[1].etch_width, None)
+        for i in range(0, len(lines)):
+            self.assertEqual(batch.get_starts_pixels((5, 5)).tolist()[i], lines[i].get_start_pixels((5, 5)))
+            self.assertEqual(batch.get_ends_pixels_screen().tolist()[i], lines[i].get_end_pixels_screen())
+            self.assertEqual(batch.get_polygons_pixels().tolist()[i], lines[i].get_polygon_pixels())
+
+    # All laser objects use __slots__ so do not have a dict
+    def test_laser_slots(self):
+        objects = [
+            CutLine((0, 0), (1, 1)), CutRect((0, 0), (1, 1)), CutPolygon([(0, 0), (1, 1), (1, 0)]),
+            EtchLine((0, 0), (1, 1)), EtchRect((0, 0), (1, 1)), EtchPolygon([(0, 0), (1, 1), (1, 0)]),
+            OuterLine((0, 0), (1, 1)), OuterRect((0, 0), (1, 1)), OuterPolygon([(0, 0), (1, 1), (1, 0)]),
+            ExcludePolygon([(0, 0), (1, 1), (1, 0)]), EtchLineBatch([], []), CutLineBatch([], [])
+            ]
+        for laser_object in objects:
+            self.assertFalse(hasattr(laser_object, "__dict__"))
+
+    def test_cut_line_batch(self):
+        batch = CutLineBatch([(0, 0), (10, 10)], [(100, 0), (10, 50)], (5, 5))
+        self.assertEqual(batch[1].get_end_pixels_screen(), batch.get_ends_pixels_screen().tolist()[1])
+        self.assertEqual(batch.get_lines().tolist()[0], [[5, 5], [105, 5]])
+
+
+# Order of laser cuts / etches to reduce travel
+class TestTravel(unittest.TestCase):
+    def test_optimize_travel(self):
+        # Alternates between each end of the area
+        cuts = [CutLine((0, 0), (10, 0)), CutLine((100, 0), (110, 0)), CutLine((20, 0), (10, 0)), CutLine((110, 10), (100, 10))]
+        new_cuts, before, after = optimize_travel(cuts)
+        self.assertAlmostEqual(before, 180 + math.hypot(100, 10))
+        self.assertAlmostEqual(after, 90)
+        self.assertEqual(new_cuts[0].get_type(), "line_batch")
+        lines = new_cuts[0].get_lines().tolist()
+        # Second line is reversed to continue from the end of the first
+        self.assertEqual(lines[:2], [[[0, 0], [10, 0]], [[10, 0], [20, 0]]])
+        
+    # Etches are only reordered with the same strength
+    def test_optimize_travel_strength(self):
+        etches = [EtchLine((0, 0), (10, 0), strength=3), EtchRect((100, 0), (10, 10)), EtchLine((10, 0), (20, 0), strength=3)]
+        new_etches, before, after = optimize_travel(etches)
+        self.assertEqual(len(new_etches), 2)
+        self.assertEqual(len(new_etches[0]), 2)
+        self.assertEqual(new_etches[0].strengths.tolist(), [3, 3])
+        self.assertEqual(new_etches[1].get_type(), "rect")
+
+
+# Packing walls onto sheets
+class TestNesting(unittest.TestCase):
+    def test_nest_parts(self):
+        sizes = [(300, 200), (300, 200), (200, 300), (500, 100), (100, 100), (700, 100)]
+        sheets = nest_parts(sizes, (600, 600), spacing=10)
+        placed = [placement.part for sheet in sheets for placement in sheet.placements]
+        self.assertEqual(sorted(placed), [0, 1, 2, 3, 4, 5])
+        for sheet in sheets:
+            rects = []
+            for placement in sheet.placements:
+                x, y = placement.position
+                width, height = placement.size
+                # Too large part is on its own sheet
+                if placement.part == 5:
+                    self.assertEqual(len(sheet.placements), 1)
+                    continue
+                self.assertGreaterEqual(x, 10)
+                self.assertLessEqual(x + width, 600)
+                self.assertLessEqual(y + height, 600)
+                if placement.rotated:
+                    self.assertEqual((height, width), sizes[placement.part])
+                # Must not overlap any other part (including spacing)
+                for other in rects:
+                    self.assertTrue(x >= other[2] or other[0] >= x + width + 10 or y >= other[3] or other[1] >= y + height + 10)
+                rects.append((x, y, x + width + 10, y + height + 10))
+        
+    def test_sheet_filename(self):
+        self.assertEqual(get_sheet_filename("house.svg", 0, 1), "house.svg")
+        self.assertEqual(get_sheet_filename("house.svg", 1, 3), "house_2.svg")
+
 
 # Test the Builder class - along with subclasses that are read
 class TestBuilder(unittest.TestCase):
     # Read data file, write it out, read it in and compare
     def test_read_file(self):
         config = LCConfig()
+        config.cache_dir = None
         builder = Builder(config)
         builder.load_file("tests/building1.json")
         walls = builder.building.get_walls()
@@ -321,6 +549,269 @@ class TestBuilder(unittest.TestCase):
         walls1a = builder1a.building.get_walls()
         # Take first entry and see if it's expected
         self.assertEqual (walls1a[0][0], 'Front with window')
+        
+    # Streaming writer should create the same elements as svgwrite
+    def test_export_streaming(self):
+        config = LCConfig()
+        config.cache_dir = None
+        builder = Builder(config)
+        builder.load_file("tests/building1.json")
+        bdata = builder.update_bdata()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for etch_as_path in [False, True]:
+                element_counts = []
+                for svg_writer in ["svgwrite", "streaming"]:
+                    options = {"material_thickness": 3, "outertype": "etches", "interlocking": "true", "svg_writer": svg_writer, "etch_as_path": etch_as_path}
+                    filename = os.path.join(temp_dir, svg_writer+".svg")
+                    result = builder.building.export_file(filename, bdata, options=options)
+                    self.assertTrue(result[0])
+                    root = ET.parse(filename).getroot()
+                    element_counts.append(sorted([element.tag for element in root]))
+                self.assertEqual(element_counts[0], element_counts[1])
+                self.assertEqual(any(tag.endswith("path") for tag in element_counts[0]), etch_as_path)
+
+    # Streaming file that is not saved (eg. an error while exporting) is closed and removed
+    def test_export_streaming_close(self):
+        settings = {"docsize": (100, 100), "cutstroke": "red", "strokewidth": 1, "etchstrokes": ["black"], "etchfill": "none"}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "error.svg")
+            with self.assertRaises(ValueError):
+                with StreamingSVGOut(filename, settings) as svg:
+                    svg.start_group("rotate(90)")
+                    raise ValueError("test")
+            self.assertTrue(svg.file.closed)
+            self.assertFalse(os.path.exists(filename))
+            filename = os.path.join(temp_dir, "saved.svg")
+            with StreamingSVGOut(filename, settings) as svg:
+                svg.save()
+            self.assertEqual(ET.parse(filename).getroot().tag, "{http://www.w3.org/2000/svg}svg")
+
+    # Walls converted to SVG in separate processes should be the same as a single process
+    def test_export_processes(self):
+        config = LCConfig()
+        config.cache_dir = None
+        builder = Builder(config)
+        builder.load_file("tests/building1.json")
+        bdata = builder.update_bdata()
+        svg_files = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for processes in [1, 2]:
+                options = {"material_thickness": 3, "outertype": "etches", "interlocking": "true", "svg_writer": "streaming", "processes": processes}
+                filename = os.path.join(temp_dir, f"processes_{processes}.svg")
+                result = builder.building.export_file(filename, bdata, options=options)
+                self.assertTrue(result[0])
+                with open(filename) as svg_file:
+                    svg_files.append(svg_file.read())
+        self.assertEqual(svg_files[0], svg_files[1])
+        
+    # Only a few walls are converted ahead of the one being written
+    def test_export_processes_pending(self):
+        class CountingExecutor():
+            def __init__(self):
+                self.pending = 0
+                self.max_pending = 0
+            # Walls are also updated using the executor, only the fragments are counted
+            def submit(self, function, *args):
+                executor = self
+                class CountingFuture(Future):
+                    def result(self, timeout=None):
+                        executor.pending -= 1
+                        return super().result(timeout)
+                if function != export_wall_fragment:
+                    future = Future()
+                    future.set_result(function(*args))
+                    return future
+                future = CountingFuture()
+                future.set_result(function(*args))
+                self.pending += 1
+                self.max_pending = max(self.max_pending, self.pending)
+                return future
+        executor = CountingExecutor()
+        config = LCConfig()
+        config.cache_dir = None
+        builder = Builder(config)
+        builder.load_file("tests/building1.json")
+        bdata = builder.update_bdata()
+        get_executor = WallUpdater.get_executor
+        try:
+            WallUpdater.get_executor = lambda wall_updater: executor
+            with tempfile.TemporaryDirectory() as temp_dir:
+                options = {"material_thickness": 3, "svg_writer": "streaming", "processes": 2}
+                result = builder.building.export_file(os.path.join(temp_dir, "pending.svg"), bdata, options=options)
+                self.assertTrue(result[0])
+        finally:
+            WallUpdater.get_executor = get_executor
+        self.assertEqual(executor.pending, 0)
+        self.assertEqual(executor.max_pending, 4)
+
+    # Updating the walls in separate processes should give the same textures
+    def test_update_processes(self):
+        textures = []
+        for processes in [1, 2]:
+            config = LCConfig()
+            config.update_processes = processes
+            config.cache_dir = None
+            builder = Builder(config)
+            builder.load_file("tests/building1.json")
+            builder.update_walls()
+            wall_textures = []
+            for wall in builder.walls:
+                self.assertFalse(wall.textures_dirty())
+                wall_textures.append([etches.get_lines().tolist() for etches in wall.get_texture_etches()])
+            textures.append(wall_textures)
+        self.assertEqual(textures[0], textures[1])
+
+    # If the walls cannot be sent to the processes then they are updated in this process
+    def test_update_processes_fallback(self):
+        class UnpicklableExecutor():
+            def submit(self, *args):
+                raise pickle.PicklingError("test")
+        config = LCConfig()
+        config.update_processes = 2
+        config.cache_dir = None
+        builder = Builder(config)
+        builder.load_file("tests/building1.json")
+        builder.wall_updater.get_executor = lambda: UnpicklableExecutor()
+        builder.update_walls()
+        for wall in builder.walls:
+            self.assertFalse(wall.textures_dirty())
+
+# Cache of generated walls
+class TestBuildingCache(unittest.TestCase):
+    def get_builder(self, cache_dir):
+        config = LCConfig()
+        config.update_processes = 1
+        config.cache_dir = cache_dir
+        return Builder(config)
+    
+    # Reopening the file uses the cache which gives the same textures
+    def test_reopen(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            builder = self.get_builder(cache_dir)
+            builder.load_file("tests/building1.json")
+            cache = builder.building.get_cache()
+            self.assertTrue(os.path.isfile(cache.filename))
+            self.assertTrue(cache.filename.endswith(".lcb"))
+            Texture.cache.clear()
+            builder2 = self.get_builder(cache_dir)
+            builder2.load_file("tests/building1.json")
+            self.assertEqual(Texture.cache.get_stats()["misses"], 0)
+            num_textures = len([wall for wall in builder2.walls if len(wall.textures) > 0])
+            self.assertEqual(builder2.building.get_cache().hits, num_textures)
+            for wall, wall2 in zip(builder.walls, builder2.walls):
+                self.assertEqual([etches.get_lines().tolist() for etches in wall.get_texture_etches()],
+                    [etches.get_lines().tolist() for etches in wall2.get_texture_etches()])
+                self.assertEqual([etches.get_lines().tolist() for etches in wall.get_texture_etches_basic()],
+                    [etches.get_lines().tolist() for etches in wall2.get_texture_etches_basic()])
+            
+    # Wall that is changed after loading is not read from the cache
+    def test_changed_wall(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            builder = self.get_builder(cache_dir)
+            builder.load_file("tests/building1.json")
+            wall = [wall for wall in builder.walls if len(wall.features) > 0][0]
+            cache = BuildingCache(builder.building.cache_filename)
+            wall.features[0].move((0, 0))
+            wall.invalidate()
+            self.assertEqual(len(cache.apply([wall])), 1)
+            self.assertTrue(wall.textures_dirty())
+    
+    # Walls without any texture lines give a file with no data, which is still valid
+    def test_empty_data(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            filename = os.path.join(cache_dir, "empty.lcb")
+            cache = BuildingCache(filename)
+            cache.entries["wall"] = ([], [])
+            cache.changed = True
+            cache.save()
+            cache2 = BuildingCache(filename)
+            self.assertEqual(cache2.entries, {"wall": ([], [])})
+    
+    # Saving over the memory mapped file copies the entries into memory first
+    def test_save_mapped(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            builder = self.get_builder(cache_dir)
+            builder.load_file("tests/building1.json")
+            filename = builder.building.get_cache().filename
+            cache = BuildingCache(filename)
+            self.assertTrue(cache.mapped)
+            keys = list(cache.entries.keys())
+            lines = cache.entries[keys[0]][0][0][0].tolist()
+            cache.entries["new"] = ([], [])
+            cache.changed = True
+            cache.save()
+            self.assertFalse(cache.mapped)
+            self.assertFalse(isinstance(cache.entries[keys[0]][0][0][0], np.memmap))
+            cache2 = BuildingCache(filename)
+            self.assertEqual(list(cache2.entries.keys()), keys + ["new"])
+            self.assertEqual(cache2.entries[keys[0]][0][0][0].tolist(), lines)
+    
+    # Invalid cache file is ignored
+    def test_invalid_file(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            filename = os.path.join(cache_dir, "invalid.lcb")
+            with open(filename, "wb") as cache_file:
+                cache_file.write(b"invalid")
+            cache = BuildingCache(filename)
+            self.assertEqual(cache.entries, {})
+
+# Timing spans and counters
+class TestInstrument(unittest.TestCase):
+    def tearDown(self):
+        instrument.disable()
+        instrument.recorder.clear()
+        
+    def test_disabled(self):
+        instrument.recorder.clear()
+        with instrument.span("test.span"):
+            instrument.count("test.count", 5)
+        self.assertEqual(instrument.get_summary(), {"spans": {}, "counters": {}})
+        
+    def test_spans_counters(self):
+        instrument.recorder.clear()
+        instrument.enable()
+        config = LCConfig()
+        # Create the textures rather than reading from the cache
+        config.cache_dir = None
+        builder = Builder(config)
+        builder.load_file("tests/building1.json")
+        summary = instrument.get_summary()
+        self.assertEqual(summary["spans"]["builder.process_data"]["count"], 1)
+        self.assertGreater(summary["spans"]["wall.update"]["count"], 0)
+        self.assertGreater(summary["counters"]["texture.etches"], 0)
+        # Saved as Chrome trace format
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "trace.json")
+            instrument.save(filename)
+            with open(filename) as trace_file:
+                trace = json.load(trace_file)
+        self.assertIn("traceEvents", trace)
+        self.assertEqual(trace["otherData"]["spans"]["builder.process_data"]["count"], 1)
+        
+
+# Command line export
+class TestLCMake(unittest.TestCase):
+    def test_output_filenames(self):
+        filenames = ["buildings/shed_1.json", "examples/shed_1.json", "buildings/test_1.json"]
+        output_filenames = lcmake.get_output_filenames(filenames, "output")
+        self.assertEqual(output_filenames, [os.path.join("output", "buildings_shed_1.svg"),
+            os.path.join("output", "examples_shed_1.svg"), os.path.join("output", "test_1.svg")])
+        
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            result = lcmake.main(["tests/building1.json", "--output", temp_dir, "--scale", "OO", "--processes", "1", "--no-cache"])
+            self.assertEqual(result, 0)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "building1.svg")))
+
+    # A file that cannot be exported is reported, the other files are still exported
+    def test_export_invalid(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            result = lcmake.main(["buildings/test_1.json", "tests/building1.json", "--output", temp_dir, "--processes", "1", "--no-cache"])
+            self.assertEqual(result, 1)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "building1.svg")))
+            filename, success, message, file_time = lcmake.export_building("buildings/test_1.json", os.path.join(temp_dir, "test_1.svg"), {})
+            self.assertFalse(success)
+            self.assertIn("TypeError", message)
 
 # helper functions
 class TestHelpers(unittest.TestCase):   
@@ -338,7 +829,57 @@ class TestHelpers(unittest.TestCase):
         # Vertical line downwards
         angle = get_angle([[20, 20], [20, 200]])
         self.assertEqual(angle, 0)
-     
+
+    # Line through a feature is split, line away from feature is unchanged
+    def test_line_remove_features(self):
+        lines = [EtchLine((0, 50), (200, 50), etch_width=5), EtchLine((0, 150), (200, 150), etch_width=5)]
+        excludes = [rect_to_polygon((50, 0), 100, 100)]
+        new_lines = line_remove_features(lines, excludes)
+        self.assertEqual(len(new_lines), 3)
+        self.assertEqual(new_lines[0].get_line(), [(0, 50), (50, 50)])
+        self.assertEqual(new_lines[1].get_line(), [(150, 50), (200, 50)])
+        self.assertEqual(new_lines[1].etch_width, 5)
+        self.assertEqual(new_lines[2].get_line(), [(0, 150), (200, 150)])
+
+    # Touching and overlapping lines are merged, but not with gaps or different strength
+    def test_merge_collinear_lines(self):
+        lines = EtchLineBatch.from_lines([
+            [[0, 0], [10, 0]], [[20, 0], [10, 0]], [[15, 0], [30, 0]], [[31, 0], [40, 0]],
+            [[0, 5], [10, 5]], [[10, 5], [20, 5]]
+            ], strengths=[5, 5, 5, 5, 5, 3])
+        new_lines = merge_collinear_lines(lines)
+        self.assertEqual(len(new_lines), 4)
+        merged = sorted([(etch.get_line(), etch.strength) for etch in new_lines])
+        self.assertEqual(merged[0], ([(0, 0), (30, 0)], 5))
+        self.assertEqual(merged[1], ([(0, 5), (10, 5)], 5))
+        self.assertEqual(merged[3], ([(31, 0), (40, 0)], 5))
+
+    # Overlapping (including touching) are returned in the order added, moved / removed are updated
+    def test_rect_index(self):
+        index = RectIndex()
+        self.assertEqual(index.get_bounds(), None)
+        self.assertEqual(index.get_overlapping([0, 0, 10, 10]), [])
+        index.set("a", [50, 0, 100, 50])
+        index.set("b", [0, 0, 40, 40])
+        index.set("c", [0, 60, 100, 100])
+        self.assertEqual(index.get_bounds(), [0, 0, 100, 100])
+        self.assertEqual(index.get_overlapping([30, 10, 60, 20]), ["a", "b"])
+        self.assertEqual(index.get_overlapping([40, 50, 45, 60]), ["c"])
+        self.assertEqual(index.get_overlapping([41, 41, 49, 59]), [])
+        index.set("a", [200, 0, 250, 50])
+        index.remove("c")
+        self.assertEqual(index.get_bounds(), [0, 0, 250, 50])
+        self.assertEqual(index.get_overlapping([30, 10, 60, 20]), ["b"])
+
+    # First (in order) of the rectangles that overlap as moving along the row
+    def test_row_scan(self):
+        row_scan = RowScan([[50, 0, 100, 10], [0, 0, 60, 10], [120, 0, 150, 10]])
+        self.assertEqual(row_scan.first_overlap(0, 10), 1)
+        self.assertEqual(row_scan.first_overlap(55, 65), 0)
+        self.assertEqual(row_scan.first_overlap(101, 119), None)
+        self.assertEqual(row_scan.first_overlap(110, 120), 2)
+        self.assertEqual(row_scan.first_overlap(151, 200), None)
+
         
 
 
@@ -3,16 +3,82 @@
 # Creates an instance for each element - then can use to detect
 # if it needs to be removed because of other features
 import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import shapely
 from laser import *
 from helpers import *
 from shapely import Point, Polygon, LineString
 
+# Cache of generated texture etches shared by all textures
+# The etches only depend upon the style, settings and polygon so identical
+# textures (eg. same brick on multiple walls or a copied wall) are only generated once
+# Least recently used entries are removed when more than max_size
+# Etches are returned as an EtchLineBatch which is read only as they are shared
+class TextureCache():
+    def __init__ (self, max_size=64):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Textures may be generated on different threads
+        self.lock = threading.Lock()
+        
+    # Returns canonical hash based on texture values
+    def get_key (self, style, settings, points):
+        key_string = json.dumps([style, settings, points], sort_keys=True)
+        return hashlib.sha1(key_string.encode()).hexdigest()
+        
+    # Returns etches or None if not in cache
+    # Each is a copy of the cached EtchLineBatch, the arrays are shared but are read only
+    # and any other changes (eg. set_internal_offset) do not change the cached value
+    def get (self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key].copy()
+        
+    # Stores a copy so that later changes to etches do not change the cached value
+    def add (self, key, etches):
+        with self.lock:
+            self.entries[key] = etches.copy()
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                
+    def clear (self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            
+    # Returns dictionary of cache statistics - used for tuning max_size
+    def get_stats (self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "max_size": self.max_size
+                }
+
+
 # Only work in mm
 # Wall should handle conversion to pixels
 # settings is dependent upon style - eg. brick_width only on bricks
 # fullwall option is whether to automatically extend the points to the full wall
 # in the event that the wall is changed this is default as GUI does not support partial textures
 class Texture():
+    
+    # Cache is set as a class variable so that it is shared by all textures
+    cache = TextureCache()
+    
     def __init__ (self, points, style="", settings=None, fullwall=True):
         self.fullwall = fullwall
         self.points = copy.copy(points)
@@ -63,14 +129,26 @@ class Texture():
     def get_entry(self):
         return ((self.points, self.style, self.settings))
             
+    # Use polygon rather than points as that is what is used to generate the etches
+    def get_cache_key(self):
+        return Texture.cache.get_key(self.style, self.settings, list(self.polygon.exterior.coords))
+            
     # Returns the texture as etches
     # excludes is a list of polygons for areas to exclude texture from
     # ie. Features - doors windows etc.
+    # Returned as an EtchLineBatch which shares its (read only) arrays through the cache
     def get_etches(self, excludes=[]):
         #print (f"Get etches - excluding {excludes}")
         # Update excludes so that this is applied across the texture
         self.excludes = excludes
-        
+        key = self.get_cache_key()
+        etches = Texture.cache.get(key)
+        if etches == None:
+            etches = self._generate_etches()
+            Texture.cache.add(key, etches)
+        return etches
+    
+    def _generate_etches(self):
         # Call appropriate texture generator based on style
         if self.style == "horizontal_wood" or self.style=="wood":
             return self._get_etches_horizontal_wood()
@@ -79,7 +157,7 @@ class Texture():
         elif self.style == "tile":
             return self._get_etches_tiles()
         else:
-            return []
+            return EtchLineBatch([], [])
     
     
     # Returns horizontal etch lines representing a wood texture
@@ -88,7 +166,6 @@ class Texture():
     # Does not stagger alternate lines
     def _get_etches_horizontal_wood(self):
         lines = []
-        etches = []
         etch_width = self.settings["wood_etch"]
         wood_height = self.settings["wood_height"]
         if "wood_width" in self.settings:
@@ -108,7 +185,7 @@ class Texture():
             # If less than 1/4 wood size left then stop
             if current_y < min_y + min_wood_size:
                 break
-            lines.extend(self._line([min_x, current_y],[max_x, current_y]))
+            lines.append([[min_x, current_y],[max_x, current_y]])
         # Ignore wood width if default (0)
         if wood_width > 0:
             # Apply vertical lines unless width is default (0)
@@ -117,11 +194,10 @@ class Texture():
                 current_x += wood_width
                 if current_x > max_x:
                     break
-                lines.extend(self._line([current_x, min_y],[current_x, max_y]))
+                lines.append([[current_x, min_y],[current_x, max_y]])
                 current_x += etch_width
-        for line in lines:
-            etches.append(EtchLine(line[0], line[1], etch_width=etch_width))
-        return etches
+        segments = self._lines_zone(np.array(lines, dtype=float).reshape(-1, 2, 2))
+        return EtchLineBatch.from_lines(segments, etch_widths=etch_width)
     
     
     # Returns brick texture
@@ -144,48 +220,51 @@ class Texture():
     
     # Returns rect used for bricks / rect tiles (known as tiles)
     # Applies rows of staggered rectangles (such as bricks)
+    # All the joints are calculated as numpy arrays and then clipped against
+    # the wall in a single shapely call, rather than one call per joint
+    # Positions are accumulated (cumsum) so values match stepping through in a loop
     def _get_etches_rects(self, etch_width, rect_height, rect_width):
-        #print ("Getting rects")
-        #print ("Get etches rects")
-        lines = []
-        etches = []
-        
         min_x = self.polygon.bounds[0]+1
         max_x = self.polygon.bounds[2]-1
         min_y = self.polygon.bounds[1]+1
-        max_y = self.polygon.bounds[3]-1
         min_rect_width = rect_width / 2
-        min_rect_height = rect_height / 4
-        # Generate horizontal lines across full width of wall
-        # Starting bottom left
-        current_y = self.polygon.bounds[3]-1
-        current_x = min_x
+        half_etch = etch_width / 2    # half of the etch width, need to use this multiple times
+        row_step = rect_height + etch_width
+        col_step = rect_width + etch_width
+        # Top of each row - starting bottom left and working up
+        start_y = self.polygon.bounds[3]-1
+        max_rows = int((start_y - min_y) / row_step) + 2
+        row_ys = np.cumsum(np.concatenate(([start_y], np.full(max_rows, -row_step))))
+        num_rows = np.count_nonzero(np.logical_and.accumulate(row_ys > min_y))
+        # Horizontal line is added at bottom of each row (ie. top of the next)
+        line_ys = row_ys[1:num_rows+1]
+        # Vertical positions for the end of each brick
         # row alternate between 0 and 1 (0 - start full brick, 1 - start 1/2 brick)
-        row = 0
-        half_etch = etch_width / 2    # half of the etch width, need to use this multiple times 
-        # One row at a time - create individual brick markers then add line across top
-        while current_y > min_y:
-            current_x = min_x
-            if row == 0:
-                current_x += rect_width
-            else:
-                current_x += rect_width / 2
-            #  short lines for end of each brick
-            while current_x < max_x:
-                # Draw vertical line
-                lines.extend(self._line([current_x, current_y - half_etch], [current_x, current_y-(rect_height+half_etch)]))
-                current_x += rect_width + etch_width
-                if current_x + min_rect_width > max_x:
-                    break
-            # flip row between odd and even (eg full brick vs half brick)
-            row = 1 - row
-            current_y -= (rect_height + etch_width)
-            lines.extend(self._line([min_x, current_y],[max_x, current_y]))
-        
-        for line in lines:
-            etches.append(EtchLine(line[0], line[1], etch_width=etch_width))
-        #print ("Rects done")
-        return etches
+        max_cols = int((max_x - min_x) / col_step) + 2
+        col_steps = np.full(max_cols, col_step)
+        row_xs = []
+        for start_x in (min_x + rect_width, min_x + rect_width / 2):
+            xs = np.cumsum(np.concatenate(([start_x], col_steps)))
+            # First is added if within the wall, others only if there is room for 1/2 brick
+            keep = xs + min_rect_width <= max_x
+            keep[0] = True
+            keep &= xs < max_x
+            row_xs.append(xs[:np.count_nonzero(np.logical_and.accumulate(keep))])
+        # Build lines in the order they would be drawn (row ends then line across top)
+        # Shape is (num_lines, 2 points, x/y)
+        lines = []
+        for row in range(0, num_rows):
+            xs = row_xs[row % 2]
+            verticals = np.empty((len(xs), 2, 2))
+            verticals[:, :, 0] = xs[:, np.newaxis]
+            verticals[:, 0, 1] = row_ys[row] - half_etch
+            verticals[:, 1, 1] = row_ys[row] - (rect_height + half_etch)
+            lines.append(verticals)
+            lines.append(np.array([[[min_x, line_ys[row]], [max_x, line_ys[row]]]]))
+        if lines == []:
+            return EtchLineBatch([], [], etch_widths=etch_width)
+        segments = self._lines_zone(np.concatenate(lines))
+        return EtchLineBatch.from_lines(segments, etch_widths=etch_width)
     
     
     # Break task into small functions, these are multistep operations
@@ -222,6 +301,31 @@ class Texture():
 
         return shapely_to_linelist (linestring.intersection(self.polygon))
 
+    # Same as _line_zone, but for an array of lines with shape (n, 2, 2)
+    # Clips all lines against the zone in one call and returns an array
+    # of the resulting lines in the same order
+    def _lines_zone(self, lines):
+        if len(lines) == 0:
+            return lines
+        linestrings = shapely.linestrings(lines)
+        # Lines fully inside the zone don't need clipping
+        shapely.prepare(self.polygon)
+        inside = shapely.contains_properly(self.polygon, linestrings)
+        clipped = linestrings.copy()
+        clipped[~inside] = shapely.intersection(linestrings[~inside], self.polygon)
+        # Most will be a simple linestring - get those points without looping through shapely
+        simple = (shapely.get_type_id(clipped) == 1) & (shapely.length(clipped) > 0)
+        coords, index = shapely.get_coordinates(clipped[simple], return_index=True)
+        first = np.unique(index, return_index=True)[1]
+        lines = lines.copy()
+        lines[simple, 0] = coords[first]
+        lines[simple, 1] = coords[first+1]
+        # Others are replaced by zero or more lines
+        pieces = {}
+        for i in np.flatnonzero(~simple).tolist():
+            pieces[i] = shapely_to_linelist(clipped[i])
+        return replace_lines(lines, pieces)[0]
+
     # Check if the line needs to be excluded, or subdivided due to exclusion areas (features)    
     def _line_exclude_all(self, line):
         # convert excludes into Polygons
@@ -0,0 +1,59 @@
+# Graphics item for the texture etches of a wall
+# A texture can have thousands of lines which are drawn every time the view is repainted.
+# When zoomed out the lines are too close together to see, so below the lod_threshold
+# (level of detail - screen pixels per scene pixel) a pixmap of the texture is drawn instead.
+# The pixmap is rendered the first time it is needed at the threshold resolution and then
+# scaled, so zooming out / scrolling does not need to draw the lines again.
+# The textures are already clipped to the wall, the rest of the pixmap is transparent.
+from PySide6.QtCore import Qt, QRectF
+from PySide6.QtGui import QPainter, QPixmap
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+class TextureItem(QGraphicsItem):
+
+    # Largest width / height of the pixmap, if larger the pixmap is created at a lower resolution
+    max_pixmap_size = 4096
+
+    # paths is list of (QPainterPath, QPen) drawn in order
+    def __init__(self, paths, lod_threshold=1.0):
+        super().__init__()
+        self.paths = paths
+        self.lod_threshold = lod_threshold
+        self.pixmap = None
+        self.bounding_rect = QRectF()
+        for path, pen in self.paths:
+            margin = pen.widthF() / 2
+            self.bounding_rect = self.bounding_rect.united(path.boundingRect().adjusted(-margin, -margin, margin, margin))
+
+    def boundingRect(self):
+        return self.bounding_rect
+
+    def paint(self, painter, option, widget):
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        if lod >= self.lod_threshold or self.bounding_rect.isEmpty():
+            self._draw_paths(painter)
+            return
+        if self.pixmap == None:
+            self.pixmap = self._create_pixmap()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawPixmap(self.bounding_rect, self.pixmap, QRectF(self.pixmap.rect()))
+
+    def _draw_paths(self, painter):
+        painter.setBrush(Qt.NoBrush)
+        for path, pen in self.paths:
+            painter.setPen(pen)
+            painter.drawPath(path)
+
+    # Renders the paths to a pixmap at the threshold level of detail
+    def _create_pixmap(self):
+        scale = min(self.lod_threshold,
+            self.max_pixmap_size / max(self.bounding_rect.width(), self.bounding_rect.height()))
+        pixmap = QPixmap(max(1, int(self.bounding_rect.width() * scale + 0.5)),
+            max(1, int(self.bounding_rect.height() * scale + 0.5)))
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.scale(pixmap.width() / self.bounding_rect.width(), pixmap.height() / self.bounding_rect.height())
+        painter.translate(-self.bounding_rect.topLeft())
+        self._draw_paths(painter)
+        painter.end()
+        return pixmap
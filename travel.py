@@ -0,0 +1,265 @@
+# Laser travel optimizer
+# Reorders cuts / etches so the laser head travels less between the end of
+# one and the start of the next (travel is when the laser is off)
+# Lines can be drawn in either direction so may be reversed
+# Rects and polygons start and finish at the same point
+# Uses nearest neighbour to create the order and then 2-opt to improve it
+
+# all dimensions are in mm (same as laser)
+
+import math
+import numpy as np
+from laser import *
+
+# Grid of points to find the nearest point to a position
+# Used instead of a KD-tree as points are removed once they are used
+# item is the primitive number, end is 0 for start, 1 for end
+class GridIndex():
+    def __init__ (self, points, items, ends):
+        self.cell_size = 1
+        if len(points) > 0:
+            size = np.ptp(points, axis=0)
+            # Approx 2 points per cell
+            self.cell_size = max(math.sqrt(size[0] * size[1] * 2 / len(points)), size.max() / len(points), 1e-6)
+        self.cells = {}
+        for point, item, end in zip(points.tolist(), items.tolist(), ends.tolist()):
+            cell = (int(point[0] // self.cell_size), int(point[1] // self.cell_size))
+            self.cells.setdefault(cell, []).append((point[0], point[1], item, end))
+        # Range of cells used to know when all have been searched
+        self.cell_min = (0, 0)
+        self.cell_max = (0, 0)
+        if self.cells != {}:
+            cells = np.array(list(self.cells.keys()))
+            self.cell_min = cells.min(axis=0).tolist()
+            self.cell_max = cells.max(axis=0).tolist()
+
+    # Returns (item, end) for nearest point where item is not in used
+    def nearest (self, pos, used):
+        center = (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        best = None
+        best_distance = None
+        ring = 0
+        max_ring = max(abs(center[0] - self.cell_min[0]), abs(center[0] - self.cell_max[0]),
+            abs(center[1] - self.cell_min[1]), abs(center[1] - self.cell_max[1]))
+        # Keep looking until the next ring cannot have anything closer
+        while ring <= max_ring:
+            if best != None and best_distance <= (ring - 1) * self.cell_size:
+                break
+            for cell in self._ring_cells(center, ring):
+                if cell not in self.cells:
+                    continue
+                # Remove points that have been used
+                points = [point for point in self.cells[cell] if not used[point[2]]]
+                if points == []:
+                    del self.cells[cell]
+                    continue
+                self.cells[cell] = points
+                for point in points:
+                    distance = math.hypot(point[0] - pos[0], point[1] - pos[1])
+                    if best == None or distance < best_distance:
+                        best = (point[2], point[3])
+                        best_distance = distance
+            ring += 1
+        return best
+
+    # Cells in a square ring around the center
+    def _ring_cells (self, center, ring):
+        if ring == 0:
+            return [center]
+        cells = []
+        for i in range(-ring, ring + 1):
+            cells.append((center[0] + i, center[1] - ring))
+            cells.append((center[0] + i, center[1] + ring))
+        for i in range(-ring + 1, ring):
+            cells.append((center[0] - ring, center[1] + i))
+            cells.append((center[0] + ring, center[1] + i))
+        return cells
+
+
+# Primitives are split into groups (cuts, or etches by strength) and each group optimized separately
+# Returns new list of primitives with travel (in mm) before and after
+# Lines (including from batches) are returned as batches, consecutive lines in the same batch
+def optimize_travel (primitives, start=(0,0), window=20):
+    groups = {}
+    for primitive in primitives:
+        if primitive.get_type() == "line_batch" and isinstance(primitive, EtchLineBatch):
+            for strength in np.unique(primitive.strengths).tolist():
+                groups.setdefault(("etch", strength), []).append((primitive, np.flatnonzero(primitive.strengths == strength)))
+        elif isinstance(primitive, Etch):
+            groups.setdefault(("etch", primitive.get_strength()), []).append((primitive, None))
+        else:
+            groups.setdefault(("cut", None), []).append((primitive, None))
+    new_primitives = []
+    total_before = 0
+    total_after = 0
+    pos = start
+    for group in groups.values():
+        travel_path = TravelPath(group, pos)
+        total_before += travel_path.get_travel()
+        travel_path.nearest_neighbour()
+        travel_path.two_opt(window)
+        total_after += travel_path.get_travel()
+        new_primitives.extend(travel_path.get_primitives())
+        pos = travel_path.get_end()
+    return (new_primitives, total_before, total_after)
+
+
+# Order of primitives in a single group
+# entries are (primitive, index) where index is array of lines to use in a batch
+class TravelPath():
+    def __init__ (self, entries, start=(0,0)):
+        self.start = np.array(start, dtype=float)
+        # For each item - primitive, line number in batch (or None), closed shape
+        self.items = []
+        starts = []
+        ends = []
+        for primitive, index in entries:
+            if index is not None:
+                lines = primitive.get_lines()[index]
+                starts.append(lines[:, 0])
+                ends.append(lines[:, 1])
+                self.items.extend([(primitive, i, False) for i in index.tolist()])
+            else:
+                points = _get_points(primitive)
+                starts.append(np.array([points[0]], dtype=float))
+                ends.append(np.array([points[1]], dtype=float))
+                self.items.append((primitive, None, primitive.get_type() != "line"))
+        if self.items == []:
+            self.starts = np.empty((0, 2))
+            self.ends = np.empty((0, 2))
+        else:
+            self.starts = np.concatenate(starts)
+            self.ends = np.concatenate(ends)
+        # Current order and whether each is reversed
+        self.order = np.arange(len(self.items))
+        self.reverse = np.zeros(len(self.items), dtype=bool)
+
+    # Entry and exit points for the current order
+    def _get_path_points(self):
+        entry = np.where(self.reverse[:, np.newaxis], self.ends[self.order], self.starts[self.order])
+        exit = np.where(self.reverse[:, np.newaxis], self.starts[self.order], self.ends[self.order])
+        return (entry, exit)
+
+    # Distance travelled between the primitives
+    def get_travel(self):
+        if len(self.items) == 0:
+            return 0
+        entry, exit = self._get_path_points()
+        previous = np.concatenate((self.start[np.newaxis], exit[:-1]))
+        return float(np.hypot(*(entry - previous).T).sum())
+
+    # Final position
+    def get_end(self):
+        if len(self.items) == 0:
+            return self.start
+        return self._get_path_points()[1][-1]
+
+    def nearest_neighbour(self):
+        num_items = len(self.items)
+        if num_items < 2:
+            return
+        closed = np.array([item[2] for item in self.items])
+        # Closed shapes only have the start point
+        open_items = np.flatnonzero(~closed)
+        points = np.concatenate((self.starts, self.ends[open_items]))
+        items = np.concatenate((np.arange(num_items), open_items))
+        ends = np.concatenate((np.zeros(num_items, dtype=int), np.ones(len(open_items), dtype=int)))
+        index = GridIndex(points, items, ends)
+        used = [False] * num_items
+        order = []
+        reverse = []
+        pos = self.start.tolist()
+        for i in range(0, num_items):
+            item, end = index.nearest(pos, used)
+            used[item] = True
+            order.append(item)
+            reverse.append(end == 1)
+            if end == 1:
+                pos = self.starts[item].tolist()
+            else:
+                pos = self.ends[item].tolist()
+        self.order = np.array(order)
+        self.reverse = np.array(reverse)
+
+    # Improve by reversing sections of the path (which also reverses each primitive in the section)
+    # Only sections up to window long are checked
+    def two_opt(self, window=20, max_passes=3):
+        num_items = len(self.items)
+        if num_items < 2:
+            return
+        for this_pass in range(0, max_passes):
+            improved = False
+            entry, exit = self._get_path_points()
+            for i in range(0, num_items):
+                previous = self.start if i == 0 else exit[i-1]
+                last = min(i + window, num_items)
+                # Reverse i to j (for each j in the window)
+                j_exit = exit[i:last]
+                next_entry = entry[i+1:last+1]
+                old = np.hypot(*(entry[i] - previous)) + np.zeros(last - i)
+                new = np.hypot(*(j_exit - previous).T)
+                # End of path has nothing after it
+                num_next = len(next_entry)
+                old[:num_next] += np.hypot(*(next_entry - j_exit[:num_next]).T)
+                new[:num_next] += np.hypot(*(next_entry - entry[i]).T)
+                gain = old - new
+                best = int(np.argmax(gain))
+                if gain[best] > 1e-9:
+                    j = i + best
+                    self.order[i:j+1] = self.order[i:j+1][::-1].copy()
+                    self.reverse[i:j+1] = ~self.reverse[i:j+1][::-1]
+                    entry[i:j+1], exit[i:j+1] = exit[i:j+1][::-1].copy(), entry[i:j+1][::-1].copy()
+                    improved = True
+            if not improved:
+                break
+
+    # Returns the primitives in the new order
+    # Consecutive lines are combined into a batch
+    def get_primitives(self):
+        primitives = []
+        lines = []
+        for item_num, reverse in zip(self.order.tolist(), self.reverse.tolist()):
+            primitive, index, closed = self.items[item_num]
+            if primitive.get_type() == "line_batch" or primitive.get_type() == "line":
+                lines.append((item_num, reverse))
+                continue
+            primitives.extend(self._lines_to_batch(lines))
+            lines = []
+            primitives.append(primitive)
+        primitives.extend(self._lines_to_batch(lines))
+        return primitives
+
+    def _lines_to_batch(self, lines):
+        if lines == []:
+            return []
+        item_nums = np.array([line[0] for line in lines])
+        reverse = np.array([line[1] for line in lines])[:, np.newaxis]
+        starts = np.where(reverse, self.ends[item_nums], self.starts[item_nums])
+        ends = np.where(reverse, self.starts[item_nums], self.ends[item_nums])
+        first = self.items[item_nums[0]][0]
+        if not isinstance(first, Etch):
+            return [CutLineBatch(starts, ends)]
+        strengths = []
+        etch_widths = []
+        for item_num in item_nums.tolist():
+            primitive, index, closed = self.items[item_num]
+            if index is not None:
+                strengths.append(primitive.strengths[index])
+                etch_widths.append(primitive.etch_widths[index])
+            else:
+                strengths.append(primitive.get_strength())
+                etch_widths.append(np.nan if primitive.etch_width == None else primitive.etch_width)
+        return [EtchLineBatch(starts, ends, strengths=strengths, etch_widths=etch_widths)]
+
+
+# Start and end (with internal offset) of an individual primitive
+# For rect and polygon these are the same point
+def _get_points(primitive):
+    io = primitive.io
+    if primitive.get_type() == "line":
+        return [(primitive.start[0]+io[0], primitive.start[1]+io[1]), (primitive.end[0]+io[0], primitive.end[1]+io[1])]
+    elif primitive.get_type() == "rect":
+        point = (primitive.start[0]+io[0], primitive.start[1]+io[1])
+    else:
+        point = (primitive.points[0][0]+io[0], primitive.points[0][1]+io[1])
+    return [point, point]
@@ -15,6 +15,8 @@ class ViewGraphicsScene (QGraphicsScene):
         super().__init__()
         self.main_window = main_window
         self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        # Index method to restore after begin_update / end_update (None when not updating)
+        self.saved_index_method = None
         
         # Triggers when a selection is changed within the scene
         self.selectionChanged.connect(self.new_focus)
@@ -60,6 +62,23 @@ class ViewGraphicsScene (QGraphicsScene):
             self.main_window.zoom_out()
         event.accept()
 
+    # Adding or removing lots of items is slower when the index needs updating for each item
+    # so the index is not used during large changes (eg. adding all the walls)
+    # Call end_update after the changes are complete, the index is then rebuilt when next needed
+    def begin_update(self):
+        if self.saved_index_method != None:
+            return
+        self.saved_index_method = self.itemIndexMethod()
+        if self.saved_index_method != QGraphicsScene.NoIndex:
+            self.setItemIndexMethod(QGraphicsScene.NoIndex)
+
+    def end_update(self):
+        if self.saved_index_method == None:
+            return
+        if self.saved_index_method != QGraphicsScene.NoIndex:
+            self.setItemIndexMethod(self.saved_index_method)
+        self.saved_index_method = None
+
     def get_selected(self):
         return self.selectedItems()
 
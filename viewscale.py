@@ -1,6 +1,7 @@
 # Handles conversion between mm and view level 
 # Based on scale, but applied to screen and fixed size
 # For zoom in / zoom out then use QGraphicsView scale
+import numpy as np
 
 class ViewScale():
     
@@ -8,7 +9,16 @@ class ViewScale():
     
     # Zoom factor is number representing how much to scale by
     def __init__ (self, scale_factor=50):
+        self.set_scale_factor(scale_factor)
+        
+    # Use this to change scale_factor so that factor is updated
+    def set_scale_factor(self, scale_factor):
         self.scale_factor = scale_factor
+        # Full conversion from mm to pixels (scale_convert and mm_to_pixel) as a single factor
+        self.factor = self.mm_to_pixel_factor / self.scale_factor
+        
+    def get_factor(self):
+        return self.factor
 
             
     # Perform conversion from mm to scale mm
@@ -70,4 +80,26 @@ class ViewScale():
             scale_mm = self.reverse_scale_convert(pixel_value)
             mm_value = self.pixel_to_mm(scale_mm)
             return_list.append(mm_value)
-        return return_list
\ No newline at end of file
+        return return_list
+    
+    # Convert single point (x, y) from mm to pixels and add offset (pixels)
+    # Faster than convert_many for individual points
+    def convert_point(self, mm_point, offset=(0,0)):
+        return [mm_point[0] * self.factor + offset[0], mm_point[1] * self.factor + offset[1]]
+    
+    # Convert many values from mm to pixels in one operation
+    # mm_values can be an array of points shape (n, 2) or a flat buffer
+    # If offset (pixels) is provided then values are treated as x, y pairs
+    # Returns a numpy array with the same shape
+    def convert_many(self, mm_values, offset=None):
+        values = np.asarray(mm_values, dtype=float)
+        if offset is None:
+            return values * self.factor
+        return (values.reshape(-1, 2) * self.factor + offset).reshape(values.shape)
+    
+    # Opposite of convert_many - pixels (with offset removed) to mm
+    def reverse_convert_many(self, pixel_values, offset=None):
+        values = np.asarray(pixel_values, dtype=float)
+        if offset is None:
+            return values / self.factor
+        return ((values.reshape(-1, 2) - offset) / self.factor).reshape(values.shape)
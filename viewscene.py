@@ -2,6 +2,9 @@
 # Pulls in relevant objects from builder (eg. walls) and then uses ObjViews to draw
 from PySide6.QtCore import Signal, QObject
 from objview import ObjView
+from laser import Laser
+from helpers import RectIndex, RowScan
+import instrument
 
 class ViewScene(QObject):
     
@@ -23,29 +26,29 @@ class ViewScene(QObject):
         # Need to keep index in sync, so if remove from one need to remove from other as well
         self.objs = []
         self.obj_views = []
+        # Bounding rectangles of the obj_views (updated by the obj_views when moved)
+        # used to find space for new objects
+        self.index = RectIndex()
+        # Set when the walls have changed but the scene is not visible so has not been updated
+        # (see MainWindowUI.update_view), the scene is updated when it is next shown or used
+        self.stale = False
         
     # Get information about the objects on the viewscene
+    # Always includes 0,0
     def scene_info (self):
+        # Make sure the objects are up to date (eg. if adding a wall to a scene not shown)
+        self.update_if_stale()
         min_x = 0
         max_x = 0
         min_y = 0
         max_y = 0
         print ("Getting information")
-        for i in range(0,len(self.obj_views)):
-            # Get position / dimensions
-            pos = self.obj_views[i].get_pos()
-            size = self.obj_views[i].get_size()
-            bounding = self.obj_views[i].get_bounding()
-            #size = self.objs[i].get_size_string()
-            #print (f"Object {i} - pos {pos}, size {size} = {bounding}")
-            if bounding[0] < min_x:
-                min_x = bounding[0]
-            if bounding[2] > max_x:
-                max_x = bounding[2]
-            if bounding[1] < min_y:
-                min_y = bounding[1]
-            if bounding[3] > max_y:
-                max_y = bounding[3]
+        bounding = self.index.get_bounds()
+        if bounding != None:
+            min_x = min(min_x, bounding[0])
+            min_y = min(min_y, bounding[1])
+            max_x = max(max_x, bounding[2])
+            max_y = max(max_y, bounding[3])
         # Get screen area in use
         print (f"Current region {min_x}, {min_y}, {max_x}, {max_y}")
         return [min_x, min_y, max_x, max_y]
@@ -66,9 +69,17 @@ class ViewScene(QObject):
         next_y_position = None
         while (current_y < end_y - size[1]):
             #print (f"Y pos {current_y}")
+            # Only the objects on this row need to be checked
+            row_views = self.index.get_overlapping([start_x, current_y, end_x, current_y + size[1]])
+            row_scan = RowScan([this_obj.get_bounding() for this_obj in row_views])
             while (current_x < end_x - size[0]):
                 #print (f"  X pos {current_x}")
-                overlap_result = self._check_overlap(current_x, current_y, size[0], size[1])
+                # Same as _check_overlap but only looks at the objects on the row
+                overlap_result = None
+                overlap_id = row_scan.first_overlap(current_x, current_x + size[0])
+                if overlap_id != None:
+                    this_obj_coords = row_views[overlap_id].get_bounding()
+                    overlap_result = [this_obj_coords[2], this_obj_coords[3]]
                 # If no overlap then return this as a valid space
                 if overlap_result == None:
                     return [current_x, current_y]
@@ -104,8 +115,9 @@ class ViewScene(QObject):
     # if overlap then return right_x and bottom_y of object that overlaps
     # returning the first object that it overlaps with
     # the calling can then increment x based on the current - or store y (to keep lowest) to try next loop 
+    # Uses the index so only objects near the rectangle are checked
     def _check_overlap (self, x, y, size_x, size_y):
-        for this_obj in self.obj_views:
+        for this_obj in self.index.get_overlapping([x, y, x+size_x, y+size_y]):
             this_obj_coords = this_obj.get_bounding()
             # Test if rects overlap
             # Simple version of seperating axis theorem https://code.tutsplus.com/collision-detection-using-the-separating-axis-theorem--gamedev-169t
@@ -130,20 +142,29 @@ class ViewScene(QObject):
         return len(self.obj_views)
         
        
-    # Clear scene and then add walls
+    # Update the walls on the scene
+    # Only walls that have changed (or display settings changed) are redrawn
     # Full update / vs partial update - not needed on scene
     # but allowed to set full=True - no difference
+    @instrument.timed("viewscene.update")
     def update(self):
         #print ("View update")
         #print (f"Update view scene {self.view_name}")
         self.update_obj_pos()
-        self.scene.clear()
-        self.objs = []
-        self.obj_views = []
         self.add_walls()
+        self.stale = False
+
+    # Instead of update when the scene is not visible
+    def mark_stale(self):
+        self.stale = True
+
+    def update_if_stale(self):
+        if self.stale:
+            self.update()
         
     # Deletes the object view and the object
     def del_obj_by_id (self, id):
+        self.obj_views[id].remove()
         del self.objs[id]
         del self.obj_views[id]
         
@@ -181,49 +202,90 @@ class ViewScene(QObject):
         
         
     # Add walls to the scene
+    # Walls already on the scene are kept if they have not changed since they were drawn
+    # Any that are no longer in this view (eg. deleted) are removed
     def add_walls(self):
         if self.gconfig.debug > 2:
             print ("Debug - View Scene {self.scene} add walls")
-        # Delete old objects and add new
         #print ("View Scene Add walls")
+        # Index is updated after all the walls are added
+        self.scene.begin_update()
+        # Existing views by wall, the wall is still in self.objs so id is unique
+        old_views = {}
+        for obj, obj_view in zip(self.objs, self.obj_views):
+            old_views[id(obj)] = obj_view
+        self.objs = []
+        self.obj_views = []
+        # Added again in the same order as obj_views when the position is set
+        self.index.clear()
         # Get all the walls from builder
         walls = self.builder.get_walls_view(self.view_name)
         #print (f"Adding {len(walls)} walls")
         for wall in walls:
+            draw_key = self.get_draw_key(wall)
+            obj_view = old_views.pop(id(wall), None)
+            if obj_view != None and obj_view.draw_key == draw_key:
+                instrument.count("viewscene.walls_kept")
+            else:
+                if obj_view != None:
+                    obj_view.remove()
+                obj_view = self.draw_wall(wall)
+                obj_view.draw_key = draw_key
+                obj_view.index = self.index
+                instrument.count("viewscene.walls_drawn")
             self.objs.append (wall)
-            # Create objview to abstract out the drawing
-            # Uses lasercutter config lcconfig - could have heirarchical in future - allow override for graphics display
-            # Note currently put at 0,0 - this will overwrite need to work out positioning
-            #self.obj_views.append(ObjView(self.scene, self.gconfig, coords = wall.position))
-            self.obj_views.append(ObjView(self.scene, self.gconfig))
-            # position using setPos
-            
-            # Now draw them on the scene
-            # Etches first, then outers then walls - this then shows overlap in that order
-            # Also typically will want to output in that order (although that is under control of laser cut software)
-
-            # Get the etching
-            etches = wall.get_etches(self.gconfig.checkbox['il'], self.gconfig.checkbox['texture'])
-            if etches != None:
-                for etch in etches:
-                    self.obj_views[-1].add_etch(etch)
-                    
-            # Get the outers (show different pen)
-            outers = wall.get_outers(self.gconfig.checkbox['il'], self.gconfig.checkbox['texture'])
-            if outers != None:
-                for outer in outers:
-                    self.obj_views[-1].add_outer(outer)
-                    
-            cuts = wall.get_cuts(self.gconfig.checkbox['il'], self.gconfig.checkbox['texture'])
-            for cut in cuts:
-                self.obj_views[-1].add_cut(cut)
-            
+            self.obj_views.append(obj_view)
             # Set position after adding graphics items
             #print (f"Setting {wall} to {wall.position}")
-            self.obj_views[-1].set_pos(wall.position)
+            obj_view.set_pos(wall.position)
+        for obj_view in old_views.values():
+            obj_view.remove()
+        self.scene.end_update()
+
+    # Values which if changed mean the wall needs to be redrawn
+    def get_draw_key(self, wall):
+        return (wall.version, self.gconfig.checkbox['il'], self.gconfig.checkbox['texture'],
+            self.gconfig.view_etch_as_polygon, Laser.vs.get_factor())
+
+    # Create an ObjView with the cuts, etches and outers for the wall
+    def draw_wall(self, wall):
+        # Create objview to abstract out the drawing
+        # Uses lasercutter config lcconfig - could have heirarchical in future - allow override for graphics display
+        # Note currently put at 0,0 - this will overwrite need to work out positioning
+        #self.obj_views.append(ObjView(self.scene, self.gconfig, coords = wall.position))
+        obj_view = ObjView(self.scene, self.gconfig)
+        # position using setPos
+        
+        # Now draw them on the scene
+        # Etches first, then outers then walls - this then shows overlap in that order
+        # Also typically will want to output in that order (although that is under control of laser cut software)
+
+        # Get the etching
+        etches = wall.get_etches(self.gconfig.checkbox['il'], False)
+        if etches != None:
+            for etch in etches:
+                obj_view.add_etch(etch)
+        # Textures are added separately so they can be drawn with less detail when zoomed out
+        if self.gconfig.checkbox['texture']:
+            for etch in wall.get_texture_etches():
+                obj_view.add_texture(etch)
+                
+        # Get the outers (show different pen)
+        outers = wall.get_outers(self.gconfig.checkbox['il'], self.gconfig.checkbox['texture'])
+        if outers != None:
+            for outer in outers:
+                obj_view.add_outer(outer)
+                
+        cuts = wall.get_cuts(self.gconfig.checkbox['il'], self.gconfig.checkbox['texture'])
+        for cut in cuts:
+            obj_view.add_cut(cut)
+        obj_view.finish()
+        return obj_view
 
- 
                     
     def clear(self):
         self.scene.clear()
+        self.objs = []
+        self.obj_views = []
+        self.index.clear()
             
@@ -11,6 +11,7 @@ from laser import *
 from helpers import *
 from shapely import Polygon
 import json
+import instrument
 
 # Texture is generated as part of get_etch,
 # This means that if a feature is added as long as it
@@ -30,6 +31,14 @@ import json
 # Some methods include option update=True
 # Can instead set to False if multiple operations then apply manuall afterwards
 
+# Cuts, etches and outers are cached and only regenerated when they are marked as dirty
+# Methods that change the wall (eg. add_feature) use invalidate to mark only the values
+# that are affected, then update only regenerates those. update_cuts / update_etches / update_outers
+# always regenerate their values, so can still be used after changing the wall directly
+# (eg. removing from wall.il).
+# version is increased whenever any of the cached values are regenerated, this allows views
+# to only redraw walls that have changed (see ViewScene)
+
 # Some methods include a history parameter typically history=False
 # But then don't implement anything different. This is due to history being moved away from the wall
 # class, but argument kept for consistancy - likely it will be removed in future
@@ -38,6 +47,17 @@ class Wall():
     
     settings = {}
     
+    # Cached values that can be regenerated individually (in order they need to be generated)
+    # wall = cut_lines['wall'], il = cut_lines['il'], feature_cuts = cut_lines['features']
+    # textures = basic_etches['textures'], exclude = etches['textures'] (textures with features removed)
+    # feature_etches = etches['features'], outers = outers['features']
+    cache_names = ['wall', 'il', 'feature_cuts', 'textures', 'exclude', 'feature_etches', 'outers']
+    # If one of these is invalidated then the dependent values also need to be regenerated
+    cache_depends = {
+        'wall': ['il'],
+        'textures': ['exclude']
+        }
+    
     def __init__ (self, name, points, view="front", position=[0,0]):
         # type is set as a wall - but allows us to check as may have different type
         # in future (eg. "exterior_object" - which could be porch support or something similar)
@@ -91,6 +111,9 @@ class Wall():
             'features': [],
             'textures': []
             }
+        # Start with all values dirty so that they are all generated
+        self.dirty = set(Wall.cache_names)
+        self.version = 0
         self.update()
         
     def __str__(self):
@@ -283,21 +306,81 @@ class Wall():
                 feature.update_pos()
 
     # Updates cuts, etches and outers
-    # Interlock = None, keep current, otherwise update
-    # Interlock and texture no longer used - instead use through get edges etc.
-    # quick is faster, but not as accurate
-    # for export always used a quick=False
-    def update (self):
-        self.update_cuts()
-        #print ("Updating etches")
-        self.update_etches()
-        #print ("Etches updated")
-        #self.update_exclude()
-        self.update_outers()
-
+    # Only regenerates values that have been invalidated since the last update
+    # full=True regenerates everything (eg. if material thickness or scale has changed)
+    @instrument.timed("wall.update")
+    def update (self, full=False):
+        if full == True:
+            self.invalidate()
+        self._update_dirty(Wall.cache_names)
+
+    # Mark cached values as dirty so they are regenerated on next update
+    # If no names provided then all values are marked
+    def invalidate (self, *names):
+        if len(names) == 0:
+            names = Wall.cache_names
+        for name in names:
+            self.dirty.add(name)
+            if name in Wall.cache_depends:
+                self.invalidate(*Wall.cache_depends[name])
+
+    # Features are used by cuts, etches, outers and to exclude texture
+    def _invalidate_features (self):
+        self.invalidate('feature_cuts', 'feature_etches', 'exclude', 'outers')
+
+    # Regenerate any of the named values which are dirty
+    # Always follows order of cache_names as later values may depend on earlier ones
+    def _update_dirty (self, names):
+        for name in Wall.cache_names:
+            if name in names and name in self.dirty:
+                # Remove before regenerating so that any changes made during
+                # the update (eg. from another thread) are not lost
+                self.dirty.discard(name)
+                self._update_cache(name)
+
+    def _update_cache (self, name):
+        if name == 'wall':
+            self.cut_lines['wall'] = self.edges_to_lines(self.get_wall_edges())
+        elif name == 'il':
+            self.cut_lines['il'] = self.edges_to_lines(self.get_il_edges())
+            instrument.count("wall.interlocking_cuts", len(self.cut_lines['il']))
+        elif name == 'feature_cuts':
+            self.cut_lines['features'] = self._get_cuts_features()
+        elif name == 'textures':
+            self.basic_etches['textures'] = self._texture_to_etches()
+        elif name == 'exclude':
+            self.etches['textures'] = self._texture_remove_features()
+        elif name == 'feature_etches':
+            self.etches['features'] = self._get_etches_features()
+        elif name == 'outers':
+            self.outers['features'] = self._get_outers_features()
+        self.version += 1
         
+
+    # Are the textures (or the textures with features removed) waiting to be regenerated
+    def textures_dirty (self):
+        return len(self.textures) > 0 and ('textures' in self.dirty or 'exclude' in self.dirty)
+
+    # Values needed to regenerate the textures - used by WallUpdater to send to another process
+    def get_texture_data (self):
+        return {
+            "textures": [(texture.style, texture.settings, texture.points) for texture in self.textures],
+            "excludes": [feature.get_points() for feature in self.features]
+            }
+
+    # Set textures which have been generated elsewhere (eg. by WallUpdater)
+    # One EtchLineBatch for each texture in both lists
+    def set_texture_etches (self, texture_etches, exclude_etches):
+        self.basic_etches['textures'] = texture_etches
+        self.etches['textures'] = exclude_etches
+        self.dirty.discard('textures')
+        self.dirty.discard('exclude')
+        self.version += 1
+
+    # Regenerate the texture with features removed (eg. after a feature has moved)
     def update_exclude(self):
-        pass
+        self.dirty.add('exclude')
+        self._update_dirty(['exclude'])
         
     # Gets wall edges - not including interlocking
     def get_wall_edges (self):
@@ -315,6 +398,7 @@ class Wall():
         return lines
             
     # Get wall edges with interlocking applied
+    @instrument.timed("wall.interlocking")
     def get_il_edges (self):
         il_edges = []
         cut_edges = self.get_wall_edges()
@@ -368,13 +452,12 @@ class Wall():
     # Generate all the cuts and store in self.cuts
     # For performance reasons call this initially then just use get_cuts
     # but if update then run this again before running get_cuts
+    # Always regenerates (does not check dirty) but does not regenerate etches
+    @instrument.timed("wall.update_cuts")
     def update_cuts (self):
-        wall_edges = self.get_wall_edges ()
-        self.cut_lines['wall']=self.edges_to_lines(wall_edges)
-        il_edges = self.get_il_edges ()
-        self.cut_lines['il']=self.edges_to_lines(il_edges)
-        # Add cuts from features 
-        self.cut_lines['features'] = self._get_cuts_features()
+        cut_names = ['wall', 'il', 'feature_cuts']
+        self.dirty.update(cut_names)
+        self._update_dirty(cut_names)
         
 
     # Get cuts for outside of wall and any inner cuts (eg. features)
@@ -416,12 +499,13 @@ class Wall():
     def get_texture_etches (self):
         return self.etches['textures']
     
+    # Always regenerates (does not check dirty)
+    @instrument.timed("wall.update_etches")
     def update_etches (self):
         # Although we have etches for wall - nothing to do in this version
-        self.basic_etches['textures'] = self._texture_to_etches()
-        self.etches['textures'] = self._texture_remove_features()
-        # Add etches from features
-        self.etches['features'] = self._get_etches_features()
+        etch_names = ['textures', 'exclude', 'feature_etches']
+        self.dirty.update(etch_names)
+        self._update_dirty(etch_names)
 
     def get_outers (self, show_interlock=False, show_textures=False):
         # Note uses copy to prevent merging features into cut_lines multiple times
@@ -437,10 +521,17 @@ class Wall():
             outers.extend(self.outers['textures'])
         return outers
         
+    # Always regenerates (does not check dirty)
     def update_outers (self):
+        self.dirty.add('outers')
+        self._update_dirty(['outers'])
+
+    def _get_outers_features (self):
         # Add any accessories (windows etc.)
+        feature_outers = []
         for feature in self.features:
-            self.outers['features'].extend(feature.get_outers())
+            feature_outers.extend(feature.get_outers())
+        return feature_outers
     
     def get_type (self):
         return self.type
@@ -463,6 +554,7 @@ class Wall():
 
     def del_texture (self, texture):
         self.textures.remove(texture)
+        self.invalidate('textures')
 
 
     # Used by builder class or internally within this
@@ -473,6 +565,7 @@ class Wall():
             area = self.points
         # reordered here when passed to constructor
         self.textures.append(Texture(area, type, settings))
+        self.invalidate('textures')
         return self.textures[-1]
         
     # Note that this is different order to texture constructor as
@@ -481,8 +574,8 @@ class Wall():
     def add_texture (self, type, area, settings, update=True):
         this_texture = self.add_texture_towall (type, area, settings)
         if update == True:
-            # Only update etches as that is limit of textures
-            self.update_etches()
+            # Only update texture etches as that is limit of textures
+            self._update_dirty(['textures', 'exclude'])
         return this_texture
             
     def restore_texture(self, current_texture, old_params, history=False):
@@ -495,7 +588,8 @@ class Wall():
             current_texture.points = old_params['points']
             current_texture.style = old_params['style']
             current_texture.settings = old_params['settings']
-        self.update_etches()
+            self.invalidate('textures')
+        self._update_dirty(['textures', 'exclude'])
 
     # This is internal method - or one to be used when loading from file
     # Does not perform update - also used by add_feature but then performs update
@@ -511,17 +605,22 @@ class Wall():
         if outers == None:
             outers = []
         self.features.append(Feature(feature_type, feature_template, startpos, points, cuts, etches, outers))
+        # Feature uses this to invalidate the wall if it moves
+        self.features[-1].wall = self
+        self._invalidate_features()
         return feature_num
     
     # Delete a feature by id
     def del_feature_id (self, feature_num):
         del self.features[feature_num]
+        self._invalidate_features()
         
     # delete feature by obj
     def del_feature_obj (self, obj, history=False):
         for i in range (0, len(self.features)):
             if self.features[i] == obj:
                 self.features.pop(i)
+                self._invalidate_features()
                 return
 
     # Restores feature from an undo
@@ -581,26 +680,37 @@ class Wall():
         if parameters==None:
             parameters = {}
         self.il.append(Interlocking(step, edge, primary, reverse, il_type, parameters))
+        self.invalidate('il')
         return self.il[-1]
             
+    # Index of the features is created once for each update and used for all lines
+    @instrument.timed("wall.texture_remove_features")
     def _texture_remove_features(self):
         #print ("Removing features")
         exclude_areas = []
         #update_lines = []
         for feature in self.features:
             exclude_areas.append(feature.get_points())
-        update_lines = line_remove_features(self.basic_etches['textures'], exclude_areas)
+        exclude_index = ExcludeIndex(exclude_areas)
+        # One EtchLineBatch for each texture
+        update_lines = []
+        for batch in self.basic_etches['textures']:
+            update_lines.append(exclude_index.remove_features(batch))
+            instrument.count("texture.etches_after_features", len(update_lines[-1]))
         return update_lines
             
     # This is later stage in get_etches
+    # Returns list with an EtchLineBatch for each texture
+    @instrument.timed("wall.texture_to_etches")
     def _texture_to_etches(self):
         etches = []
         #print ("Texture to etches")
         #print (f"Self textures {self.textures}")
         for texture in self.textures:
             #print (f"Getting this texture {texture}")
-            # Each texture can have one or more etches
-            etches.extend(texture.get_etches())
+            # Each texture has a batch of etches
+            etches.append(texture.get_etches())
+            instrument.count("texture.etches", len(etches[-1]))
         return etches
         
 
@@ -634,9 +744,13 @@ class Wall():
         for this_il in self.il:
             if this_il.edge == edge:
                 self.il.remove(this_il)
+        self.invalidate('il')
     
     # If size has changed then may need to update texture points
+    # Called after the wall points are changed so also invalidates the wall cuts
     def update_texture_points(self):
+        self.invalidate('wall')
         for texture in self.textures:
             if texture.fullwall:
-                texture.change_points(self.points)
\ No newline at end of file
+                texture.change_points(self.points)
+                self.invalidate('textures')
\ No newline at end of file
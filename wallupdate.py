@@ -0,0 +1,142 @@
+# Regenerates walls using separate processes
+# Most of the time updating a wall is spent creating the textures and removing
+# the features from them. Using threads does not help with this due to the GIL
+# so instead the textures are created in a pool of processes.
+# Each wall is sent as a compact description (texture style, settings and points and the
+# exclude polygons from the features) and the etches are returned as numpy arrays
+# which are then added back to the wall. The rest of the wall (cuts, interlocking, features)
+# is quick to create so is updated in the main process.
+# Must not import PySide6 as this module is loaded by each of the worker processes
+import os
+import pickle
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from texture import Texture
+from helpers import ExcludeIndex
+from laser import EtchLineBatch
+import instrument
+
+class WallUpdater():
+
+    # Executor is shared by all builders (eg. if a new file is opened) and started
+    # the first time it is needed
+    executor = None
+    executor_processes = 0
+    lock = threading.Lock()
+
+    # processes is the number of worker processes, 0 = number of cpus
+    # If only 1 then walls are updated in the current process
+    def __init__ (self, processes=0):
+        if processes == None or processes < 1:
+            processes = os.cpu_count() or 1
+        self.processes = processes
+
+    def use_processes (self):
+        return self.processes > 1
+
+    # Returns shared executor, creates a new one if the number of processes has changed
+    # Uses spawn rather than fork as forking a process which uses Qt threads is not safe
+    def get_executor (self):
+        with WallUpdater.lock:
+            if WallUpdater.executor != None and WallUpdater.executor_processes != self.processes:
+                WallUpdater.executor.shutdown(wait=False)
+                WallUpdater.executor = None
+            if WallUpdater.executor == None:
+                WallUpdater.executor = ProcessPoolExecutor(max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"))
+                WallUpdater.executor_processes = self.processes
+            return WallUpdater.executor
+
+    # Stop the worker processes (eg. when closing the application)
+    # Any walls waiting to be updated are cancelled rather than waiting for them
+    @staticmethod
+    def shutdown ():
+        with WallUpdater.lock:
+            if WallUpdater.executor != None:
+                WallUpdater.executor.shutdown(cancel_futures=True)
+                WallUpdater.executor = None
+
+    # Update all the walls
+    # status_callback is called once for each wall when it is complete
+    # full=True regenerates everything (eg. if material thickness or scale has changed)
+    # If cache (BuildingCache) then textures are read from the cache where available
+    # and any that are created are added to the cache
+    @instrument.timed("wallupdater.update_walls")
+    def update_walls (self, walls, full=False, status_callback=None, cache=None):
+        if full == True:
+            for wall in walls:
+                wall.invalidate()
+        new_texture_walls = []
+        if cache != None:
+            new_texture_walls = cache.apply(walls)
+        # Walls without textures (or where the textures are not changed) are updated locally
+        texture_walls = []
+        for wall in walls:
+            if self.use_processes() and wall.textures_dirty():
+                texture_walls.append(wall)
+            else:
+                wall.update()
+                if status_callback != None:
+                    status_callback()
+        if texture_walls != []:
+            self._update_processes(texture_walls, status_callback)
+        if cache != None:
+            for wall, key in new_texture_walls:
+                cache.add(wall, key)
+            cache.save()
+
+    # Create the textures in the worker processes and then update the rest of the wall
+    def _update_processes (self, texture_walls, status_callback=None):
+        try:
+            executor = self.get_executor()
+            futures = {}
+            for wall in texture_walls:
+                futures[executor.submit(update_textures, wall.get_texture_data())] = wall
+            for future in as_completed(futures):
+                wall = futures[future]
+                results = future.result()
+                texture_batches = []
+                exclude_batches = []
+                for texture, (texture_arrays, exclude_arrays) in zip(wall.textures, results):
+                    texture_batch = arrays_to_batch(texture_arrays)
+                    # Add to this process's cache so any later changes to the wall can use it
+                    Texture.cache.add(texture.get_cache_key(), texture_batch)
+                    texture_batches.append(texture_batch)
+                    exclude_batches.append(arrays_to_batch(exclude_arrays))
+                wall.set_texture_etches(texture_batches, exclude_batches)
+                wall.update()
+                if status_callback != None:
+                    status_callback()
+        # If processes cannot be started (or the wall cannot be sent to them) then update without them
+        # Any other errors are from creating the textures so would also fail without the processes
+        except (BrokenProcessPool, OSError, pickle.PicklingError) as err:
+            print (f"Unable to update walls in separate processes - {err}")
+            WallUpdater.shutdown()
+            for wall in texture_walls:
+                if wall.textures_dirty():
+                    wall.update()
+                    if status_callback != None:
+                        status_callback()
+
+
+# Run in the worker process
+# texture_data is from Wall.get_texture_data
+# Returns list with (texture, texture with excludes removed) arrays for each texture
+def update_textures (texture_data):
+    exclude_index = ExcludeIndex(texture_data["excludes"])
+    results = []
+    for style, settings, points in texture_data["textures"]:
+        texture_batch = Texture(points, style, settings).get_etches()
+        exclude_batch = exclude_index.remove_features(texture_batch)
+        results.append((batch_to_arrays(texture_batch), batch_to_arrays(exclude_batch)))
+    return results
+
+# Compact version of a batch which is sent between processes
+def batch_to_arrays (batch):
+    return (batch.get_lines(), batch.strengths, batch.etch_widths)
+
+def arrays_to_batch (arrays):
+    lines, strengths, etch_widths = arrays
+    return EtchLineBatch.from_lines(lines, strengths, etch_widths)